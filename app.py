@@ -1,7 +1,18 @@
 import streamlit as st
 import base64
-from code_parser import CodeParser
-from diagram_generator import DiagramGenerator
+import hashlib
+import html
+import os
+import time
+import instrumentation
+import large_diagram
+import structural_diff
+from code_parser import CodeParser, diff_structures, join_cells
+from context_builder import estimate_tokens
+from notebook_reader import NotebookFormatError, read_code_cells, slim_notebook
+from diagram_generator import Degraded, DiagramGenerator
+from diagram_renderer import FORMATS, MIME_TYPES, DiagramRenderer
+from isolated_parser import shared_parser
 import streamlit.components.v1 as components
 
 # --- Page Configuration ---
@@ -161,21 +172,190 @@ def get_download_link(diagram_code, filename="diagram.mmd"):
     b64 = base64.b64encode(diagram_code.encode()).decode()
     return f'<a href="data:text/plain;base64,{b64}" download="{filename}">Download Mermaid Diagram</a>'
 
-def render_mermaid(mermaid_code: str):
-    """Renders the Mermaid diagram."""
+# Uploads whose stage results are kept per session
+MAX_STORED_UPLOADS = 8
+
+# mermaid.js is served from ./static by Streamlit (see .streamlit/config.toml) when it has been
+# downloaded there, so diagrams render offline and the browser caches it; otherwise from the CDN
+MERMAID_VERSION = '11'
+MERMAID_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'mermaid.min.js')
+MERMAID_CDN = f"https://cdn.jsdelivr.net/npm/mermaid@{MERMAID_VERSION}/dist/mermaid.min.js"
+
+
+@st.cache_resource
+def get_generator():
+    """One DiagramGenerator (and Gemini client) shared by all sessions of this process"""
+    return DiagramGenerator()
+
+
+@st.cache_resource
+def get_renderer():
+    """One server-side renderer (and its image cache) shared by all sessions of this process"""
+    return DiagramRenderer()
+
+
+def upload_stages(uploaded_file):
+    """Session store for the results computed from this upload, keyed by its content hash
+
+    Holds the decoded source, parse result, structure context, summary and one
+    diagram per mode, so reruns triggered by other widgets reuse them.
+    """
+    key = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    uploads = st.session_state.setdefault('uploads', {})
+    if key not in uploads:
+        uploads[key] = {}
+        while len(uploads) > MAX_STORED_UPLOADS:
+            uploads.pop(next(iter(uploads)))
+    return uploads[key]
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def collapsed_view(diagram_code, expanded=()):
+    """The diagram fitted to the node budget, with the `expanded` groups drawn in full"""
+    return large_diagram.collapse(diagram_code, expanded=expanded)
+
+
+def show_diagram(panel, diagram_code, filename):
+    """Fill a panel with the rendered diagram, its download link and source
+
+    Large diagrams are drawn with groups collapsed; the ones picked in the
+    "Expand" box are drawn in full. The downloads and code view are always complete.
+    """
+    with panel.container():
+        if isinstance(diagram_code, Degraded):
+            st.caption(f"Fallback diagram shown ({diagram_code.reason}); generate again to retry.")
+        digest = hashlib.sha256(diagram_code.encode()).hexdigest()[:16]
+        key = f"expand_{digest}"
+        view = collapsed_view(diagram_code, tuple(st.session_state.get(key, ())))
+        if view['groups']:
+            labels = {group['key']: group['label'] for group in view['groups']}
+            st.caption(f"Large diagram: showing {view['visible']} of {view['nodes']} nodes. "
+                       "Dashed boxes stand for collapsed groups.")
+            st.multiselect("Expand", options=list(labels), format_func=labels.get, key=key)
+        render_mermaid(view['code'])
+
+        st.markdown(
+            get_download_link(diagram_code, filename),
+            unsafe_allow_html=True
+        )
+
+        renderer = get_renderer()
+        if renderer.available:
+            # Images are rendered on request; the renderer caches them by diagram hash
+            export_key = f"export_{digest}"
+            if st.button("Export SVG / PNG", key=f"{export_key}_button"):
+                st.session_state[export_key] = True
+            if st.session_state.get(export_key):
+                stem = filename.rsplit('.', 1)[0]
+                for fmt in FORMATS:
+                    image = renderer.render(diagram_code, fmt)
+                    if 'error' in image:
+                        st.caption(f"{fmt.upper()} export failed: {image['error']}")
+                    else:
+                        st.download_button(f"Download {fmt.upper()}", image['data'], file_name=f"{stem}.{fmt}",
+                                           mime=MIME_TYPES[fmt], key=f"{export_key}_{fmt}")
+
+        with st.expander("View Mermaid Code"):
+            st.code(diagram_code, language="mermaid")
+
+
+def show_summary(panel, summary, code_structure):
+    """Fill a panel with the summary and the code statistics"""
+    with panel.container():
+        st.markdown(summary, unsafe_allow_html=True)
+
+        stats = CodeParser().get_code_complexity(code_structure)
+        hotspots = ', '.join(f"`{name}` ({complexity})" for name, complexity in stats['hotspots'][:3])
+        st.info(f"""
+        **Code Statistics:**
+        - Functions: {stats['num_functions']}
+        - Methods: {stats['num_methods']}
+        - Classes: {stats['num_classes']}
+        - Imports: {stats['num_imports']}
+        - Cyclomatic complexity: {stats['avg_complexity']} average, {stats['max_complexity']} max
+        - Deepest nesting: {stats['max_depth']}
+        - Most complex: {hotspots or 'n/a'}
+        """)
+
+def compare_versions(base_file, file_content, file_extension, bypass_cache):
+    """Structural diff against the earlier version, with its highlighted diagram and a summary of the change"""
+    base_content = base_file.getvalue()
+    if file_extension != 'ipynb':
+        base_content = base_content.decode('utf-8')
+    with instrumentation.stage('diff', kind=file_extension):
+        changes = structural_diff.compare(base_content, file_content, file_extension)
+    changes['summary'] = get_generator().generate_change_summary(changes, file_extension,
+                                                                 use_cache=not bypass_cache)
+    return changes
+
+
+def show_comparison(changes, filename):
+    """Show the change diagram next to the change summary"""
+    functions = changes['functions']
+    st.caption(f"Functions: {len(functions['changed'])} changed, {len(functions['added'])} added, "
+               f"{len(functions['removed'])} removed, {len(functions['unchanged'])} unchanged")
+    col_diagram, col_summary = st.columns([1, 1])
+    with col_diagram:
+        st.subheader("Change Diagram")
+        show_diagram(st.empty(), changes['diagram'], filename.replace('_diagram.mmd', '_diff.mmd'))
+    with col_summary:
+        st.subheader("Change Summary")
+        st.markdown(changes['summary'], unsafe_allow_html=True)
+
+def performance_panel(trace):
+    """Show per-stage timings, token counts and cache results of a request"""
+    with st.expander("Performance", expanded=True):
+        st.markdown(f"**Total:** {trace.seconds * 1000:.0f} ms (reading the upload took "
+                    f"{trace.fields['read_seconds'] * 1000:.0f} ms)")
+        rows = [
+            {
+                'stage': stage,
+                'calls': entry['calls'],
+                'ms': round(entry['seconds'] * 1000, 1),
+                'prompt tokens': entry['prompt_tokens'],
+                'response tokens': entry['response_tokens']
+            }
+            for stage, entry in trace.totals().items()
+        ]
+        st.table(rows)
+        notes = [f"{record['stage']} ({record['kind']}): cache {record['cache']}"
+                 for record in trace.stages if 'cache' in record]
+        notes += [f"{record['stage']}: fallback ({record['fallback']})"
+                  for record in trace.stages if record.get('fallback')]
+        notes += [f"{event['event']} ({', '.join(f'{k}={v}' for k, v in event.items() if k not in ('event', 'at'))})"
+                  for event in trace.events]
+        if notes:
+            st.caption("; ".join(notes))
+
+def render_mermaid(mermaid_code: str, server: bool = True):
+    """Renders the Mermaid diagram, as a cached server-side SVG when mermaid-cli is installed."""
+    renderer = get_renderer()
+    if server and renderer.available:
+        image = renderer.render(mermaid_code, 'svg')
+        if 'error' not in image:
+            with instrumentation.stage('render', kind='svg'):
+                components.html(f'<div style="text-align: center;">{image["data"]}</div>', height=550, scrolling=True)
+            return
+        print(f"Error rendering diagram on the server, drawing it in the browser: {image['error']}")
+
+    script = "app/static/mermaid.min.js" if os.path.exists(MERMAID_FILE) else MERMAID_CDN
+    # Escaped so labels containing < or & reach mermaid as text; the limits allow expanded large diagrams
     mermaid_html = f"""
-    <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
+    <script src="{script}"></script>
     <div class="mermaid">
-        {mermaid_code}
+        {html.escape(mermaid_code, quote=False)}
     </div>
     <script>
-        mermaid.initialize({{ startOnLoad: true }});
+        mermaid.initialize({{ startOnLoad: true, maxTextSize: 2000000, maxEdges: 10000 }});
     </script>
     """
     # Set a fixed height for the mermaid container
-    components.html(mermaid_html, height=550, scrolling=True) # Adjusted height
+    with instrumentation.stage('render', kind='browser'):
+        components.html(mermaid_html, height=550, scrolling=True) # Adjusted height
     
 def main():
+    # Optional Prometheus endpoint (CODETODIAGRAM_METRICS_PORT); started once per process
+    instrumentation.serve_metrics()
     
     # Title with Name
     st.markdown("""
@@ -217,54 +397,232 @@ def main():
     if uploaded_file:
         st.success(f"File uploaded: {uploaded_file.name}")
 
-        file_content = uploaded_file.read().decode('utf-8')
         file_extension = uploaded_file.name.split('.')[-1]
+        stages = upload_stages(uploaded_file)
+        cells = stages.get('cells')
+
+        if 'read' not in stages:
+            read_start = time.perf_counter()
+            if file_extension == 'ipynb':
+                # Stream the notebook so large outputs are skipped instead of decoded
+                try:
+                    cells = read_code_cells(uploaded_file.getvalue())
+                except NotebookFormatError as e:
+                    st.error(f"Invalid Jupyter notebook: {str(e)}")
+                    st.stop()
+                stages['cells'] = cells
+                stages['read'] = (slim_notebook(cells), join_cells(cells))
+            else:
+                file_content = uploaded_file.getvalue().decode('utf-8')
+                stages['read'] = (file_content, file_content)
+            stages['read_seconds'] = round(time.perf_counter() - read_start, 6)
+            instrumentation.record('read', stages['read_seconds'], kind=file_extension)
+        file_content, display_code = stages['read']
 
         with st.expander("View Original Code", expanded=False):
-            st.code(file_content, language='python' if file_extension in ['py', 'ipynb'] else 'cpp')
+            st.code(display_code, language='python' if file_extension in ['py', 'ipynb'] else 'cpp')
 
-        if st.button("Generate Diagram & Summary", type="primary"):
-            with st.spinner("Analyzing code and generating diagram..."):
-                try:
-                    parser = CodeParser()
-                    diagram_gen = DiagramGenerator()  # No API key needed
-
-                    code_structure = parser.parse_file(file_content, file_extension)
-
-                    diagram_code = diagram_gen.generate_mermaid_diagram(code_structure, file_extension)
-                    summary = diagram_gen.generate_summary(file_content, file_extension)
-
-                    # --- Two-Column Output ---
-                    # This st.columns block will ALSO be styled by the [data-testid="stHorizontalBlock"] CSS
-                    col_diagram, col_summary = st.columns([1, 1])
-
-                    with col_diagram:
-                        st.subheader("Code Diagram")
-                        render_mermaid(diagram_code)
-                    
-                        st.markdown(
-                            get_download_link(diagram_code, f"{uploaded_file.name}_diagram.mmd"),
-                            unsafe_allow_html=True
-                        )
-                    
-                        with st.expander("View Mermaid Code"):
-                            st.code(diagram_code, language="mermaid")
-                        
-                    with col_summary:
-                        st.subheader("AI Summary")
-                        st.markdown(summary, unsafe_allow_html=True)
-
-                        st.info(f"""
-                        **Code Statistics:**
-                        - Functions: {len(code_structure.get('functions', []))}
-                        - Classes: {len(code_structure.get('classes', []))}
-                        - Imports: {len(code_structure.get('imports', []))}
-                        """)
-                    
-                    st.success("Analysis complete!")
-
-                except Exception as e:
-                    st.error(f"Error processing file: {str(e)}")
+        diagram_mode = st.radio(
+            "Diagram mode",
+            options=['local', 'ai', 'refine'],
+            format_func=lambda m: {
+                'local': "Local (instant)",
+                'ai': "AI",
+                'refine': "Local, then AI refine"
+            }[m],
+            index=2,
+            horizontal=True,
+            help="Local diagrams are built from the code's control flow in milliseconds; AI modes use Gemini"
+        )
+
+        bypass_cache = st.checkbox(
+            "Bypass cache",
+            help="Ignore previously generated results for this file and regenerate them"
+        )
+
+        show_performance = st.checkbox(
+            "Show performance",
+            help="Time, token and cache details for each stage of the last run"
+        )
+
+        base_file = None
+        if st.checkbox("Compare with an earlier version",
+                       help="Upload the previous version to diagram and summarize only what changed"):
+            base_file = st.file_uploader("Earlier version", type=[file_extension], key='base_file')
+
+        diagrams = stages.setdefault('diagrams', {})
+        comparisons = stages.setdefault('comparisons', {})
+        comparison_key = hashlib.sha256(base_file.getvalue()).hexdigest() if base_file is not None else None
+        filename = f"{uploaded_file.name}_diagram.mmd"
+        generate = st.button("Generate Diagram & Summary", type="primary")
+
+        if generate and base_file is not None:
+            if bypass_cache:
+                comparisons.pop(comparison_key, None)
+
+            with instrumentation.request('compare', file_type=file_extension, bytes=uploaded_file.size,
+                                         base_bytes=base_file.size, read_seconds=stages['read_seconds'],
+                                         bypass_cache=bypass_cache) as trace:
+                with st.spinner("Comparing the two versions..."):
+                    try:
+                        comparison = comparisons.get(comparison_key)
+                        if comparison is None:
+                            comparison = compare_versions(base_file, file_content, file_extension, bypass_cache)
+                            # A failed change summary is shown but asked for again on the next click
+                            if not isinstance(comparison['summary'], Degraded):
+                                comparisons[comparison_key] = comparison
+                        show_comparison(comparison, filename)
+                        st.success("Comparison complete!")
+                    except Exception as e:
+                        st.error(f"Error comparing files: {str(e)}")
+            stages['trace'] = trace
+
+            if show_performance:
+                performance_panel(trace)
+
+        elif generate:
+            if bypass_cache:
+                for stage in ('structure', 'context', 'summary', 'changes'):
+                    stages.pop(stage, None)
+                diagrams.clear()
+
+            with instrumentation.request('generate', file_type=file_extension, mode=diagram_mode,
+                                         bytes=uploaded_file.size, read_seconds=stages['read_seconds'],
+                                         bypass_cache=bypass_cache) as trace:
+                with st.spinner("Analyzing code and generating diagram..."):
+                    try:
+                        diagram_gen = get_generator()
+
+                        if 'structure' not in stages:
+                            # Kept for the session so notebook cells parsed on earlier runs are reused
+                            if 'parser' not in st.session_state:
+                                st.session_state.parser = CodeParser()
+                            parser = st.session_state.parser
+                            # Parse in a time- and memory-capped worker process when the pool is enabled
+                            isolated = shared_parser()
+
+                            with instrumentation.stage('parse', kind=file_extension, isolated=bool(isolated)) as info:
+                                if cells is not None and isolated:
+                                    # New cells go to the pool, cached ones come from the session
+                                    code_structure = isolated.parse_cells(cells, parser=parser)
+                                elif cells is not None:
+                                    code_structure = parser.parse_cells(cells)
+                                else:
+                                    code_structure = (isolated or parser).parse_file(file_content, file_extension)
+                                if 'error' in code_structure:
+                                    info['error'] = code_structure['error']
+
+                            if cells is not None:
+                                notebooks = st.session_state.setdefault('notebook_structures', {})
+                                previous = notebooks.get(uploaded_file.name)
+                                notebooks[uploaded_file.name] = code_structure
+                                if previous is not None:
+                                    changes = diff_structures(previous, code_structure)
+                                    edited = changes['added'] + changes['changed'] + changes['removed']
+                                    stages['changes'] = (f"Changed since last run: {', '.join(edited)}" if edited
+                                                         else "No functions or classes changed since last run")
+
+                            if 'limit' in code_structure:
+                                # Don't retry the same input in this process (the local diagram would parse it too)
+                                st.error(f"Error processing file: {code_structure['error']}")
+                                st.stop()
+                            stages['structure'] = code_structure
+                        code_structure = stages['structure']
+
+                        if 'context' not in stages:
+                            with instrumentation.stage('context') as info:
+                                stages['context'] = diagram_gen.build_context(code_structure, file_extension,
+                                                                              file_content)
+                                info['tokens'] = estimate_tokens(stages['context'])
+
+                        if stages.get('changes'):
+                            st.caption(stages['changes'])
+
+                        # --- Two-Column Output ---
+                        # This st.columns block will ALSO be styled by the [data-testid="stHorizontalBlock"] CSS
+                        col_diagram, col_summary = st.columns([1, 1])
+
+                        with col_diagram:
+                            st.subheader("Code Diagram")
+                            diagram_panel = st.empty()
+                        with col_summary:
+                            st.subheader("AI Summary")
+                            summary_panel = st.empty()
+
+                        if diagram_mode in diagrams:
+                            show_diagram(diagram_panel, diagrams[diagram_mode], filename)
+                        if 'summary' in stages:
+                            show_summary(summary_panel, stages['summary'], code_structure)
+
+                        if 'summary' in stages and diagram_mode not in diagrams:
+                            # Only the diagram for this mode is new; the summary doesn't depend on the mode
+                            with diagram_panel.container():
+                                st.caption("Generating diagram...")
+                            diagram = diagram_gen.generate_mermaid_diagram(
+                                code_structure, file_extension, use_cache=not bypass_cache,
+                                mode=diagram_mode, code_content=file_content, context=stages['context']
+                            )
+                            if not isinstance(diagram, Degraded):
+                                diagrams[diagram_mode] = diagram
+                            show_diagram(diagram_panel, diagram, filename)
+                        elif 'summary' not in stages:
+                            # Both Gemini calls run at once; each panel fills in as soon as its result arrives
+                            results = diagram_gen.generate_concurrently(
+                                code_structure, file_content, file_extension,
+                                use_cache=not bypass_cache, stream_summary=True, mode=diagram_mode,
+                                context=stages['context']
+                            )
+                            streamed_summary = ""
+                            for kind, result in results:
+                                if kind == 'diagram_draft':
+                                    with diagram_panel.container():
+                                        # The draft is replaced within seconds, so the browser draws it
+                                        render_mermaid(collapsed_view(result)['code'], server=False)
+                                        st.caption("Local diagram shown; refining with AI...")
+                                elif kind == 'diagram':
+                                    # Fallbacks and errors are shown but not kept, so the next click retries
+                                    if not isinstance(result, Degraded):
+                                        diagrams[diagram_mode] = result
+                                    show_diagram(diagram_panel, result, filename)
+                                elif kind == 'summary_chunk':
+                                    streamed_summary += result
+                                    summary_panel.markdown(streamed_summary + " ▌", unsafe_allow_html=True)
+                                else:
+                                    if not isinstance(result, Degraded):
+                                        stages['summary'] = result
+                                    show_summary(summary_panel, result, code_structure)
+
+                        cache_stats = diagram_gen.cache.stats()
+                        for name, value in cache_stats.items():
+                            instrumentation.metrics.set(f'result_cache_{name}', value)
+                        st.success("Analysis complete!")
+                        st.caption(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+
+                    except Exception as e:
+                        st.error(f"Error processing file: {str(e)}")
+            stages['trace'] = trace
+
+            if show_performance:
+                performance_panel(trace)
+
+        elif comparison_key in comparisons:
+            show_comparison(comparisons[comparison_key], filename)
+            if show_performance and 'trace' in stages:
+                performance_panel(stages['trace'])
+
+        elif diagram_mode in diagrams and 'summary' in stages:
+            # Any other widget rerun: show the stored results instead of regenerating them
+            if stages.get('changes'):
+                st.caption(stages['changes'])
+            col_diagram, col_summary = st.columns([1, 1])
+            with col_diagram:
+                st.subheader("Code Diagram")
+                show_diagram(st.empty(), diagrams[diagram_mode], filename)
+            with col_summary:
+                st.subheader("AI Summary")
+                show_summary(st.empty(), stages['summary'], stages['structure'])
+            if show_performance and 'trace' in stages:
+                performance_panel(stages['trace'])
 
     else:
         st.info("Upload a code file to get started!")
@@ -0,0 +1,271 @@
+"""Headless batch mode: diagram every supported file under a directory.
+
+Usage:
+    python batch.py SRC_DIR OUT_DIR [--workers N] [--concurrency N] [--rpm N] [--export svg,png] [--repo-diagram] [--stub]
+
+Each source file produces OUT_DIR/<relative path>.mmd and .md (and .svg/.png
+with --export). A manifest of
+content hashes is kept in OUT_DIR so re-runs only process changed files.
+--repo-diagram also writes OUT_DIR/repository.mmd, the module dependency graph
+of the whole tree, from an incremental index kept in OUT_DIR.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import instrumentation
+from code_parser import CodeParser
+from notebook_reader import NotebookFormatError, read_code_cells, slim_notebook
+
+SUPPORTED_EXTENSIONS = ('py', 'ipynb', 'cpp')
+MANIFEST_NAME = '.manifest.json'
+SKIP_DIRS = {'.git', '__pycache__', 'node_modules', '.venv', 'venv'}
+
+
+def find_sources(src_dir):
+    """Yield paths (relative to src_dir) of all supported files"""
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.rsplit('.', 1)[-1] in SUPPORTED_EXTENSIONS:
+                yield os.path.relpath(os.path.join(root, name), src_dir)
+
+
+def parse_job(args):
+    """Hash and parse one file (runs in a worker process)
+
+    Returns None when the file is unchanged since the last run. The last
+    element of the result is the time spent reading and parsing. A file
+    that can't be read or parsed at all (an OSError, or a RecursionError
+    from a deeply nested expression) gives {'path', 'error'} instead of
+    ending the whole run.
+    """
+    try:
+        return _parse_file(*args)
+    except Exception as e:
+        return {'path': args[1], 'error': f"{type(e).__name__}: {e}"}
+
+
+def _parse_file(src_dir, rel_path, known_hash):
+    path = os.path.join(src_dir, rel_path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    content_hash = digest.hexdigest()
+    if content_hash == known_hash:
+        return None
+
+    file_type = rel_path.rsplit('.', 1)[-1]
+    start = time.perf_counter()
+    parser = CodeParser()
+    if file_type == 'ipynb':
+        # Stream notebooks so their outputs are never loaded; keep only the code cells
+        try:
+            with open(path, 'rb') as f:
+                cells = read_code_cells(f)
+        except NotebookFormatError:
+            cells = None
+        if cells is not None:
+            structure = parser.parse_cells(cells)
+            return rel_path, content_hash, slim_notebook(cells), file_type, structure, time.perf_counter() - start
+
+    with open(path, 'rb') as f:
+        content = f.read().decode('utf-8', errors='replace')
+    structure = parser.parse_file(content, file_type)
+    return rel_path, content_hash, content, file_type, structure, time.perf_counter() - start
+
+
+class BatchRunner:
+    """Parse files in a process pool and dispatch Gemini calls through a bounded queue"""
+
+    def __init__(self, src_dir, out_dir, generator, workers=None, concurrency=4, force=False, mode='ai',
+                 renderer=None, formats=()):
+        self.src_dir = src_dir
+        self.out_dir = out_dir
+        self.generator = generator
+        self.renderer = renderer
+        self.formats = formats
+        self.workers = workers
+        self.concurrency = concurrency
+        self.force = force
+        self.mode = mode
+        self.manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self.stats = {'processed': 0, 'skipped': 0, 'failed': 0}
+        self._lock = threading.RLock()
+
+    def run(self):
+        """Process every supported file and return run statistics"""
+        start = time.monotonic()
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        jobs = [
+            (self.src_dir, rel, None if self.force or not self._outputs_exist(rel) else self.manifest.get(rel))
+            for rel in find_sources(self.src_dir)
+        ]
+
+        # Bound in-flight generations so parsed files don't pile up in memory
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        with ProcessPoolExecutor(max_workers=self.workers) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as gen_pool:
+            try:
+                for result in parse_pool.map(parse_job, jobs, chunksize=8):
+                    if result is None:
+                        self.stats['skipped'] += 1
+                        continue
+                    if isinstance(result, dict):
+                        print(f"Failed to process {result['path']}: {result['error']}", file=sys.stderr)
+                        with self._lock:
+                            self.stats['failed'] += 1
+                        continue
+                    slots.acquire()
+                    future = gen_pool.submit(self._generate, *result)
+                    future.add_done_callback(lambda _: slots.release())
+            finally:
+                gen_pool.shutdown(wait=True)
+                self._save_manifest()
+
+        for name, value in self.generator.cache.stats().items():
+            instrumentation.metrics.set(f'result_cache_{name}', value)
+        instrumentation.write_metrics_file()
+
+        elapsed = time.monotonic() - start
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['files_per_second'] = round(len(jobs) / elapsed, 2) if elapsed else 0.0
+        return self.stats
+
+    def _generate(self, rel_path, content_hash, content, file_type, structure, parse_seconds):
+        """Generate and write the diagram and summary for one file"""
+        with instrumentation.request('batch', file=rel_path, file_type=file_type, mode=self.mode):
+            instrumentation.record('parse', parse_seconds, 'error' if 'error' in structure else 'ok',
+                                   kind=file_type)
+            self._process(rel_path, content_hash, content, file_type, structure)
+
+    def _process(self, rel_path, content_hash, content, file_type, structure):
+        # Loaded with the generator, which needs the Gemini client
+        from diagram_generator import Degraded
+        try:
+            diagram = self.generator.generate_mermaid_diagram(structure, file_type, mode=self.mode,
+                                                              code_content=content)
+            summary = self.generator.generate_summary(content, file_type, structure=structure)
+
+            base = os.path.join(self.out_dir, rel_path)
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            with open(base + '.mmd', 'w', encoding='utf-8') as f:
+                f.write(diagram)
+            with open(base + '.md', 'w', encoding='utf-8') as f:
+                f.write(summary)
+            for fmt in self.formats:
+                image = self.renderer.render(diagram, fmt)
+                if 'error' in image:
+                    raise RuntimeError(f"{fmt.upper()} render failed: {image['error']}")
+                with open(f"{base}.{fmt}", 'wb') as f:
+                    f.write(image['data'].encode('utf-8') if fmt == 'svg' else image['data'])
+
+            # Fallback diagrams and failed summaries are written but left for the next run
+            for result in (diagram, summary):
+                if isinstance(result, Degraded):
+                    raise RuntimeError(result.reason)
+        except Exception as e:
+            print(f"Failed to process {rel_path}: {e}", file=sys.stderr)
+            with self._lock:
+                self.stats['failed'] += 1
+            return
+
+        with self._lock:
+            self.manifest[rel_path] = content_hash
+            self.stats['processed'] += 1
+            # Checkpoint periodically so an interrupted run can resume
+            if self.stats['processed'] % 50 == 0:
+                self._save_manifest()
+
+    def _outputs_exist(self, rel_path):
+        base = os.path.join(self.out_dir, rel_path)
+        return all(os.path.exists(f"{base}.{ext}") for ext in ('mmd', 'md') + tuple(self.formats))
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        with self._lock:
+            data = json.dumps(self.manifest, indent=1, sort_keys=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate diagrams and summaries for a whole directory")
+    parser.add_argument('src_dir', help="directory to scan for .py/.ipynb/.cpp files")
+    parser.add_argument('out_dir', help="directory to write .mmd diagrams and .md summaries to")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent Gemini requests")
+    parser.add_argument('--rpm', type=float, default=60, help="max Gemini requests per minute (0 = unlimited)")
+    parser.add_argument('--mode', choices=('local', 'ai', 'refine'), default='ai',
+                        help="diagram mode; 'local' needs no Gemini call for diagrams")
+    parser.add_argument('--export', default='', help="also render each diagram to these image formats (svg,png) "
+                                                     "with mermaid-cli")
+    parser.add_argument('--repo-diagram', action='store_true',
+                        help="also write repository.mmd, the module dependency graph of the whole tree")
+    parser.add_argument('--force', action='store_true', help="reprocess files even if unchanged")
+    parser.add_argument('--stub', action='store_true', help="use a local stub instead of Gemini (offline)")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds of simulated latency per stub call")
+    args = parser.parse_args(argv)
+
+    # Imported here so spawned parse workers don't load the Gemini client
+    from diagram_generator import DiagramGenerator, shared_model
+    from scheduler import BATCH, Scheduler
+
+    # Calls are spaced evenly at --rpm, retried on 429/5xx and queued behind interactive ones
+    if args.stub:
+        from stub_model import StubModel
+        scheduler = Scheduler(StubModel(latency=args.stub_latency), args.rpm, burst=1)
+        generator = DiagramGenerator(model=scheduler.lane(BATCH))
+    else:
+        shared_model().set_rate(args.rpm, burst=1)
+        generator = DiagramGenerator(priority=BATCH)
+
+    formats = tuple(fmt.strip().lower() for fmt in args.export.split(',') if fmt.strip())
+    renderer = None
+    if formats:
+        from diagram_renderer import FORMATS, DiagramRenderer
+        unknown = [fmt for fmt in formats if fmt not in FORMATS]
+        if unknown:
+            parser.error(f"unsupported export format: {', '.join(unknown)}")
+        renderer = DiagramRenderer()
+        if not renderer.available:
+            parser.error("--export needs mermaid-cli (mmdc); set CODETODIAGRAM_MMDC to its command line")
+
+    runner = BatchRunner(args.src_dir, args.out_dir, generator, workers=args.workers,
+                         concurrency=args.concurrency, force=args.force, mode=args.mode,
+                         renderer=renderer, formats=formats)
+    stats = runner.run()
+    print(f"Processed {stats['processed']}, skipped {stats['skipped']} unchanged, "
+          f"failed {stats['failed']} in {stats['seconds']}s ({stats['files_per_second']} files/s)")
+
+    if args.repo_diagram:
+        from project_index import ProjectIndex
+        index = ProjectIndex(args.src_dir, os.path.join(args.out_dir, '.index.sqlite'))
+        try:
+            index.update(workers=args.workers)
+            with open(os.path.join(args.out_dir, 'repository.mmd'), 'w', encoding='utf-8') as f:
+                f.write(index.repository_diagram())
+        finally:
+            index.close()
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
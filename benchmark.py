@@ -0,0 +1,423 @@
+"""Parser and generator benchmarks.
+
+Usage:
+    python benchmark.py [--sizes 1K,64K,1M,10M] [--repeat N] [--stub-latency S]
+                        [--json OUT.json] [--compare BASELINE.json] [--threshold R]
+    python benchmark.py --legacy [--functions N] [--cpp-classes N] [--repeat N]
+
+The suite builds synthetic .py, .ipynb and .cpp inputs of each size, plus
+deeply nested and many-function inputs, and times the parse, complexity,
+structure-context and local-diagram stages, recording peak memory for each.
+Inputs up to --e2e-max are also run through DiagramGenerator end to end
+against the offline stub model, cold and with a warm result cache.
+
+A stage that raises is recorded with an 'error' instead of a timing, and the
+run exits with 1; when parsing raises, the input's later stages are skipped. Local diagrams of functions nested too deeply to draw are
+counted in 'too_deep'.
+
+--json writes the results for later comparison; --compare prints the ratio
+of every timing to a baseline file and exits with 1 if any got slower than
+--threshold times the baseline.
+
+--legacy runs the original comparison of CodeParser.parse_python against the
+previous ast.walk-based implementation, and times parse_cpp.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from code_parser import CodeParser, _StructureVisitor
+from local_diagram import TOO_DEEP, LocalDiagramEngine
+
+DEFAULT_SIZES = '1K,64K,1M,10M'
+SIZE_UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def synthetic_python(num_functions):
+    """Build a module with num_functions functions spread over classes and module level"""
+    parts = ["import os\nimport sys\nfrom collections import defaultdict\n"]
+    for i in range(num_functions):
+        body = (
+            f"    total = 0\n"
+            f"    for item in range(x):\n"
+            f"        if item % {i % 7 + 2} == 0:\n"
+            f"            total += compute(item, [v * 2 for v in range(3)], {{'k': item}})\n"
+            f"        while total > 100:\n"
+            f"            total -= helper_{i}(total)\n"
+            f"    return total\n"
+        )
+        if i % 4 == 0:
+            parts.append(f"class Service{i}:\n    def method_{i}(self, x):\n" +
+                         body.replace('\n    ', '\n        ').replace('    total = 0', '        total = 0', 1))
+        else:
+            parts.append(f"def func_{i}(x, y=None):\n" + body)
+    return "\n\n".join(parts)
+
+
+def synthetic_cpp(num_classes):
+    """Build a translation unit with num_classes classes, each with an out-of-line method"""
+    parts = ['#include <vector>\n#include "util.h"\n']
+    for i in range(num_classes):
+        parts.append(
+            f"/* Widget {i}: {{ braces in comments are ignored }} */\n"
+            f"class Widget{i} : public Base {{\n"
+            f"public:\n"
+            f"    explicit Widget{i}(int size) : size_(size), data_{{}} {{}}\n"
+            f"    int process(const std::vector<int>& items, bool verbose = false) const;\n"
+            f"private:\n"
+            f"    int size_;\n"
+            f"    std::vector<int> data_;\n"
+            f"}};\n\n"
+            f"int Widget{i}::process(const std::vector<int>& items, bool verbose) const {{\n"
+            f"    int total = 0;\n"
+            f"    for (size_t k = 0; k < items.size(); ++k) {{\n"
+            f"        if (items[k] % 2 == 0) {{\n"
+            f"            total += items[k] * size_;\n"
+            f"        }} else if (verbose) {{\n"
+            f"            printf(\"odd value {{%d}}\\n\", items[k]);\n"
+            f"        }}\n"
+            f"    }}\n"
+            f"    return total;\n"
+            f"}}\n"
+        )
+    return "\n".join(parts)
+
+
+def synthetic_notebook(num_cells):
+    """Build a notebook of num_cells code cells, each with text and image outputs
+
+    About half of the file is outputs, as in a typical executed notebook.
+    """
+    cells = []
+    for i in range(num_cells):
+        source = synthetic_python(2).replace('func_', f'cell{i}_func_').replace('Service', f'Cell{i}Service')
+        cells.append({'cell_type': 'markdown', 'metadata': {}, 'source': [f"## Step {i}\n"]})
+        cells.append({
+            'cell_type': 'code',
+            'execution_count': i + 1,
+            'metadata': {},
+            'source': source.splitlines(True),
+            'outputs': [
+                {'output_type': 'stream', 'name': 'stdout', 'text': [f"step {i} done\n"] * 4},
+                {'output_type': 'display_data', 'metadata': {},
+                 'data': {'image/png': 'iVBORw0KGgo' + 'A' * 600, 'text/plain': ['<Figure>']}}
+            ]
+        })
+    return json.dumps({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}, indent=1)
+
+
+def deep_python(depth, copies):
+    """Build copies of a function whose body nests if/for blocks depth levels deep"""
+    parts = []
+    for c in range(copies):
+        lines = [f"def deep_{c}(x):"]
+        for level in range(depth):
+            keyword = 'if x > 0:' if level % 2 else 'for x in range(x):'
+            lines.append("    " * (level + 1) + keyword)
+        lines.append("    " * (depth + 1) + "x = helper(x)")
+        lines.append("    return x")
+        parts.append("\n".join(lines))
+    return "\n\n\n".join(parts) + "\n"
+
+
+def deep_cpp(depth, copies):
+    """Build copies of a function whose body nests if/for blocks depth levels deep"""
+    parts = []
+    for c in range(copies):
+        opens = "".join(
+            f"if (x > {level}) {{\n" if level % 2 else f"for (int i{level} = 0; i{level} < x; ++i{level}) {{\n"
+            for level in range(depth)
+        )
+        parts.append(f"int deep_{c}(int x) {{\n{opens}x = helper(x);\n{'}' * depth}\nreturn x;\n}}\n")
+    return "\n".join(parts)
+
+
+def scaled(build, target_bytes):
+    """Call build(n) with the n whose output is closest to target_bytes"""
+    sample = len(build(8)) / 8
+    return build(max(1, round(target_bytes / sample)))
+
+
+def parse_size(text):
+    """'64K' -> 65536"""
+    text = text.strip().upper()
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(num_bytes):
+    for unit, factor in (('M', SIZE_UNITS['M']), ('K', SIZE_UNITS['K'])):
+        if num_bytes >= factor:
+            return f"{num_bytes / factor:g}{unit}"
+    return str(num_bytes)
+
+
+def legacy_walk(tree):
+    """The original ast.walk/isinstance traversal, kept for comparison"""
+    structure = {'functions': [], 'classes': [], 'imports': [], 'control_flow': []}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef):
+            structure['functions'].append({
+                'name': node.name,
+                'args': [arg.arg for arg in node.args.args],
+                'line': node.lineno
+            })
+        elif isinstance(node, ast.ClassDef):
+            methods = [n.name for n in node.body if isinstance(n, ast.FunctionDef)]
+            structure['classes'].append({'name': node.name, 'methods': methods, 'line': node.lineno})
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                structure['imports'].append(alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module:
+                structure['imports'].append(node.module)
+        elif isinstance(node, (ast.If, ast.For, ast.While)):
+            structure['control_flow'].append({'type': type(node).__name__, 'line': node.lineno})
+    return structure
+
+
+def measure(func, arg, repeat):
+    """Return (best wall time in seconds, peak traced memory in bytes of the result)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func(arg)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, current
+
+
+def profile(func, repeat):
+    """Time func() repeat times, then trace one more call for its peak memory
+
+    Returns (result, {'seconds': best, 'mean_seconds', 'peak_bytes'}).
+    Timing runs without tracemalloc, which slows allocation-heavy code down.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    del result
+
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        'seconds': round(min(times), 6),
+        'mean_seconds': round(sum(times) / len(times), 6),
+        'peak_bytes': peak
+    }
+
+
+def corpus(sizes):
+    """Yield (case, file_type, content) for every benchmark input"""
+    for size in sizes:
+        label = format_size(size)
+        yield f"py-{label}", 'py', scaled(synthetic_python, size)
+        yield f"ipynb-{label}", 'ipynb', scaled(synthetic_notebook, size)
+        yield f"cpp-{label}", 'cpp', scaled(synthetic_cpp, size)
+    # Python's tokenizer allows at most 100 indentation levels
+    yield "py-deep", 'py', deep_python(90, 200)
+    yield "cpp-deep", 'cpp', deep_cpp(500, 200)
+    yield "py-many-functions", 'py', synthetic_python(5000)
+
+
+def run_suite(sizes, repeat=3, stub_latency=0.0, e2e_max=1024 * 1024, mode='refine', log=print):
+    """Run every stage on every corpus input; return the results document"""
+    # Imported here so --legacy runs don't need the Gemini client installed
+    from diagram_generator import DiagramGenerator
+    from result_cache import ResultCache
+    from scheduler import Scheduler
+    from stub_model import StubModel
+
+    parse = {
+        'py': lambda parser, content: parser.parse_python(content),
+        'ipynb': lambda parser, content: parser.parse_jupyter(content),
+        'cpp': lambda parser, content: parser.parse_cpp(content)
+    }
+    results = []
+
+    def add(case, file_type, content, op, stats, **extra):
+        results.append({'case': case, 'file_type': file_type, 'bytes': len(content), 'op': op, **stats, **extra})
+        if 'error' in extra:
+            log(f"{case:<20} {op:<22} {'failed':>13}  {extra['error']}")
+            return
+        note = f"  ({extra['too_deep']} functions too deep to draw)" if extra.get('too_deep') else ""
+        log(f"{case:<20} {op:<22} {stats['seconds'] * 1000:10.1f} ms  peak {stats['peak_bytes'] / 1024 / 1024:8.1f} MB"
+            + note)
+
+    def measure(case, file_type, content, op, fn, runs, details=lambda result: {}):
+        """Profile and record one stage; returns (result, whether it ran without raising)"""
+        try:
+            result, stats = profile(fn, runs)
+        except Exception as e:
+            add(case, file_type, content, op, {}, error=f"{type(e).__name__}: {e}")
+            return None, False
+        add(case, file_type, content, op, stats, **details(result))
+        return result, True
+
+    with tempfile.TemporaryDirectory(prefix='codetodiagram-bench-') as cache_dir:
+        for case, file_type, content in corpus(sizes):
+            # Fresh parsers and engines, so notebook cell caches don't turn repeats into hits
+            structure, parsed = measure(case, file_type, content, f'parse_{file_type}',
+                                        lambda: parse[file_type](CodeParser(), content), repeat)
+            if not parsed:
+                continue
+
+            measure(case, file_type, content, 'get_code_complexity',
+                    lambda: CodeParser().get_code_complexity(structure), repeat)
+
+            # Unlimited rate, but otherwise the same scheduled path as the app
+            stub = StubModel(latency=stub_latency)
+            generator = DiagramGenerator(cache=ResultCache(os.path.join(cache_dir, case)),
+                                         model=Scheduler(stub, rate_per_minute=0))
+            measure(case, file_type, content, 'build_context',
+                    lambda: generator.build_context(structure, file_type, content), repeat)
+
+            # The local diagram directly: the fallback would hide its errors behind the plain structure diagram
+            def fallback():
+                generator.local_engine = LocalDiagramEngine()
+                return generator.generate_local_diagram(content, file_type, structure)
+            measure(case, file_type, content, 'fallback_diagram', fallback, repeat,
+                    lambda diagram: {'too_deep': diagram.count(TOO_DEEP)})
+
+            if len(content) > e2e_max:
+                continue
+            # One cold run against an empty result cache, then warm runs that hit it
+            for label, runs in (('end_to_end_cold', 1), ('end_to_end_warm', repeat)):
+                calls_before = stub.calls
+                measure(case, file_type, content, label, lambda: list(generator.generate_concurrently(
+                    structure, content, file_type, stream_summary=True, mode=mode)), runs,
+                    lambda _: {'model_calls': stub.calls - calls_before})
+
+    return {'meta': environment(repeat=repeat, stub_latency=stub_latency, mode=mode), 'results': results}
+
+
+def environment(**settings):
+    """Describe the run, so result files from different commits can be told apart"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **settings
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print current/baseline time ratios; return the (case, op) pairs slower than threshold"""
+    old = {(r['case'], r['op']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for result in current['results']:
+        before = old.get((result['case'], result['op']))
+        if before is None or not before.get('seconds') or 'error' in result:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        memory = result['peak_bytes'] / max(before['peak_bytes'], 1)
+        flag = ''
+        # Sub-millisecond timings are too noisy to flag
+        if ratio > threshold and result['seconds'] > 0.001:
+            regressions.append((result['case'], result['op']))
+            flag = '  REGRESSION'
+        print(f"{result['case']:<20} {result['op']:<22} time {ratio:6.2f}x  memory {memory:6.2f}x{flag}")
+    return regressions
+
+
+def run_legacy(args):
+    code = synthetic_python(args.functions)
+    nodes = sum(1 for _ in ast.walk(ast.parse(code)))
+    print(f"Synthetic module: {len(code) / 1024:.0f} KB, {nodes} AST nodes")
+
+    # ast.parse is shared by both; time the traversals on a pre-parsed tree
+    tree = ast.parse(code)
+    parse_time, _ = measure(ast.parse, code, args.repeat)
+    print(f"{'ast.parse':<16} {parse_time * 1000:9.1f} ms")
+
+    def scoped_visit(tree):
+        visitor = _StructureVisitor()
+        visitor.visit(tree)
+        return visitor.functions, visitor.classes, visitor.methods, visitor.imports, visitor.control_flow
+
+    results = []
+    for label, func in (('legacy ast.walk', legacy_walk), ('scoped visitor', scoped_visit)):
+        seconds, memory = measure(func, tree, args.repeat)
+        results.append((seconds, memory))
+        print(f"{label:<16} {seconds * 1000:9.1f} ms  result {memory / 1024:8.0f} KB")
+
+    (old_t, old_m), (new_t, new_m) = results
+    print(f"Traversal speedup: {old_t / new_t:.1f}x, result memory: {old_m / max(new_m, 1):.1f}x smaller")
+    total, _ = measure(CodeParser().parse_python, code, 1)
+    print(f"parse_python end to end: {total * 1000:.1f} ms")
+
+    cpp = synthetic_cpp(args.cpp_classes)
+    total, memory = measure(CodeParser().parse_cpp, cpp, args.repeat)
+    print(f"parse_cpp on {len(cpp) / 1024 / 1024:.1f} MB: {total * 1000:.1f} ms "
+          f"({len(cpp) / 1024 / 1024 / total:.1f} MB/s), result {memory / 1024:.0f} KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the parsers and the diagram generator")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated input sizes, e.g. 1K,1M,50M (default {DEFAULT_SIZES})")
+    parser.add_argument('--repeat', type=int, default=3, help="timing repetitions (best is reported)")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds of simulated latency per model call")
+    parser.add_argument('--e2e-max', default='1M', help="largest input run end to end through DiagramGenerator")
+    parser.add_argument('--mode', choices=('local', 'ai', 'refine'), default='refine',
+                        help="diagram mode for the end-to-end runs")
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON ('-' for stdout)")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare with a previous --json result file")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="with --compare, fail if any timing exceeds this multiple of the baseline")
+    parser.add_argument('--legacy', action='store_true', help="run the ast.walk traversal comparison instead")
+    parser.add_argument('--functions', type=int, default=5000, help="--legacy: functions in the synthetic module")
+    parser.add_argument('--cpp-classes', type=int, default=5000, help="--legacy: classes in the synthetic C++ file")
+    args = parser.parse_args(argv)
+
+    if args.legacy:
+        run_legacy(args)
+        return 0
+
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    log = (lambda line: print(line, file=sys.stderr)) if args.json == '-' else print
+    document = run_suite(sizes, args.repeat, args.stub_latency, parse_size(args.e2e_max), args.mode, log)
+
+    if args.json == '-':
+        json.dump(document, sys.stdout, indent=1)
+        print()
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=1)
+
+    failed = [f"{r['case']} {r['op']}" for r in document['results'] if 'error' in r]
+    if failed:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, document, args.threshold):
+            return 1
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
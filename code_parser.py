@@ -1,10 +1,394 @@
 import ast
-import json
+import copy
+import hashlib
+import heapq
 import re
+from array import array
+from collections.abc import Mapping
+
+from cpp_lexer import CppScanner
+from notebook_reader import CellCache, NotebookFormatError, read_code_cells
+
+CONTROL_FLOW_TYPES = ('If', 'For', 'While')
+
+# Notebook cells are joined with a blank line between them
+CELL_SEPARATOR = '\n\n'
+# IPython magics and shell escapes are not Python; blank them but keep the line
+_MAGIC_LINE = re.compile(r'^[ \t]*[%!].*$', re.MULTILINE)
+
+# Fields of statement nodes that hold nested statements; expressions can't contain defs
+_STATEMENT_FIELDS = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
+
+METRIC_COLUMNS = ('complexity', 'depth', 'loc', 'fan_out')
+
+# Cyclomatic complexity: one path plus one per decision point (and per extra boolean operand)
+_BRANCHES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert) + (
+    (ast.match_case,) if hasattr(ast, 'match_case') else ())
+# Statements whose bodies count as one level deeper
+_NESTING = frozenset((ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try) + tuple(
+    getattr(ast, name) for name in ('TryStar', 'Match') if hasattr(ast, name)))
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+# Node type -> what it adds to the metrics; looked up once per node instead of a chain of isinstance checks
+_BRANCH, _BOOL_OP, _COMPREHENSION, _CALL, _DEFINITION = range(1, 6)
+_METRIC_KINDS = dict.fromkeys(_BRANCHES, _BRANCH)
+_METRIC_KINDS.update({ast.BoolOp: _BOOL_OP, ast.comprehension: _COMPREHENSION, ast.Call: _CALL})
+_METRIC_KINDS.update(dict.fromkeys(_DEFINITIONS, _DEFINITION))
+# Expression fields that never hold anything the metrics count (contexts, operators, names)
+_LEAF_FIELDS = frozenset(('ctx', 'op', 'ops', 'id', 'attr', 'arg', 'kind', 'conversion'))
+_expression_fields = {ast.Name: (), ast.Constant: ()}
+
+
+def _child_fields(node_type):
+    """Fields of an expression type worth walking into, cached per type"""
+    fields = _expression_fields.get(node_type)
+    if fields is None:
+        fields = _expression_fields[node_type] = tuple(f for f in node_type._fields if f not in _LEAF_FIELDS)
+    return fields
+
+
+class _Record(Mapping):
+    """Slotted parse record with a read-only dict view for backward compatibility"""
+    __slots__ = ()
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+    
+    def __iter__(self):
+        return iter(self.__slots__)
+    
+    def __len__(self):
+        return len(self.__slots__)
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+    
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+    
+    def shifted(self, offset):
+        """Copy of the record with its line numbers moved down by offset"""
+        record = copy.copy(self)
+        record.line += offset
+        record.end_line += offset
+        return record
+
+
+class FunctionRecord(_Record):
+    """A function or method definition"""
+    __slots__ = ('name', 'qualname', 'args', 'line', 'end_line', 'parent', 'decorators', 'is_async')
+    
+    def __init__(self, name, qualname, args, line, end_line, parent=None, decorators=(), is_async=False):
+        self.name = name
+        self.qualname = qualname
+        self.args = args
+        self.line = line
+        self.end_line = end_line
+        self.parent = parent
+        self.decorators = decorators
+        self.is_async = is_async
+
+
+class ClassRecord(_Record):
+    """A class definition; `methods` lists the names of its direct methods"""
+    __slots__ = ('name', 'qualname', 'methods', 'bases', 'line', 'end_line', 'parent', 'decorators')
+    
+    def __init__(self, name, qualname, bases, line, end_line, parent=None, decorators=()):
+        self.name = name
+        self.qualname = qualname
+        self.methods = []
+        self.bases = bases
+        self.line = line
+        self.end_line = end_line
+        self.parent = parent
+        self.decorators = decorators
+
+
+class ControlFlowTable:
+    """Array-backed list of control-flow nodes whose items read as {'type', 'line'} dicts"""
+    __slots__ = ('types', 'lines')
+    
+    def __init__(self):
+        self.types = array('B')
+        self.lines = array('I')
+    
+    def append(self, type_name, line):
+        self.types.append(CONTROL_FLOW_TYPES.index(type_name))
+        self.lines.append(line)
+    
+    def __len__(self):
+        return len(self.lines)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {'type': CONTROL_FLOW_TYPES[self.types[index]], 'line': self.lines[index]}
+    
+    def __iter__(self):
+        for type_code, line in zip(self.types, self.lines):
+            yield {'type': CONTROL_FLOW_TYPES[type_code], 'line': line}
+    
+    def extend(self, other, line_offset=0):
+        """Append all entries of another table, moving their lines down by line_offset"""
+        self.types.extend(other.types)
+        self.lines.extend(line + line_offset for line in other.lines)
+
+
+class MetricsTable:
+    """Per-function metrics in columnar arrays; items read as {'qualname', 'complexity', ...} dicts
+
+    One row per function or method, in parse order: cyclomatic complexity,
+    maximum nesting depth, lines of code and fan-out (distinct callees).
+    """
+    __slots__ = ('qualnames',) + METRIC_COLUMNS
+    
+    def __init__(self):
+        self.qualnames = []
+        for column in METRIC_COLUMNS:
+            setattr(self, column, array('I'))
+    
+    def append(self, qualname, complexity, depth, loc, fan_out):
+        self.qualnames.append(qualname)
+        self.complexity.append(complexity)
+        self.depth.append(depth)
+        self.loc.append(loc)
+        self.fan_out.append(fan_out)
+    
+    def __len__(self):
+        return len(self.qualnames)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        row = {'qualname': self.qualnames[index]}
+        row.update((column, getattr(self, column)[index]) for column in METRIC_COLUMNS)
+        return row
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def extend(self, other):
+        self.qualnames.extend(other.qualnames)
+        for column in METRIC_COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+    
+    def by_name(self):
+        """{qualname: row}; a later definition with the same name wins"""
+        return {row['qualname']: row for row in self}
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Table from {'qualname', 'complexity', ...} dicts, as structure_to_dict writes them"""
+        if isinstance(rows, cls):
+            return rows
+        table = cls()
+        for row in rows:
+            table.append(row['qualname'], *(row[column] for column in METRIC_COLUMNS))
+        return table
+
+
+def _function_metrics(node):
+    """(complexity, max nesting depth, fan-out) of one function, not counting nested definitions"""
+    complexity = 1
+    max_depth = 0
+    callees = set()
+    kinds = _METRIC_KINDS
+    statements = [(child, 1) for child in node.body]
+    expressions = []
+    while statements:
+        node, depth = statements.pop()
+        kind = kinds.get(type(node))
+        if kind == _DEFINITION:
+            continue
+        if kind == _BRANCH:
+            complexity += 1
+        inner = depth
+        if type(node) in _NESTING:
+            inner = depth + 1
+            max_depth = max(max_depth, depth)
+        
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if field in _STATEMENT_FIELDS:
+                if field == 'orelse' and type(node) is ast.If and len(value) == 1 and type(value[0]) is ast.If:
+                    # elif stays at the level of its if
+                    statements.append((value[0], depth))
+                else:
+                    statements.extend((child, inner) for child in value)
+            elif isinstance(value, list):
+                expressions.extend(item for item in value if isinstance(item, ast.AST))
+            elif isinstance(value, ast.AST):
+                expressions.append(value)
+        
+        # Expressions don't nest, so they are walked without tracking depth
+        while expressions:
+            expression = expressions.pop()
+            node_type = type(expression)
+            kind = kinds.get(node_type)
+            if kind == _CALL:
+                func = expression.func
+                if type(func) is ast.Name:
+                    callees.add(func.id)
+                elif type(func) is ast.Attribute:
+                    callees.add(func.attr)
+            elif kind == _BRANCH:
+                complexity += 1
+            elif kind == _BOOL_OP:
+                complexity += len(expression.values) - 1
+            elif kind == _COMPREHENSION:
+                complexity += 1 + len(expression.ifs)
+            for field in _expression_fields.get(node_type) or _child_fields(node_type):
+                value = getattr(expression, field, None)
+                if type(value) is list:
+                    # Dict keys hold None for ** unpacking
+                    expressions.extend(item for item in value if item is not None)
+                elif isinstance(value, ast.AST):
+                    expressions.append(value)
+    return complexity, max_depth, len(callees)
+
+
+def structure_to_dict(structure):
+    """Materialize records and tables into plain, JSON-serializable dicts and lists"""
+    plain = {}
+    for key, value in structure.items():
+        if isinstance(value, (list, ControlFlowTable, MetricsTable)):
+            value = [item.to_dict() if isinstance(item, _Record) else item for item in value]
+        plain[key] = value
+    return plain
+
+
+def diff_structures(old, new):
+    """Compare two notebook parse results by their per-definition digests
+    
+    Returns qualified names of functions, methods and classes that were
+    'added', 'removed', 'changed' or left 'unchanged', so callers can skip
+    regenerating output for unchanged definitions. Structures without
+    digests (non-notebook files) have nothing to compare.
+    """
+    before = (old or {}).get('digests', {})
+    after = (new or {}).get('digests', {})
+    return {
+        'added': sorted(name for name in after if name not in before),
+        'removed': sorted(name for name in before if name not in after),
+        'changed': sorted(name for name in after if name in before and before[name] != after[name]),
+        'unchanged': sorted(name for name in after if before.get(name) == after[name])
+    }
+
+
+def join_cells(cells):
+    """The code of notebook cells as one source text, matching parse_cells line numbers"""
+    return CELL_SEPARATOR.join(cell.source for cell in cells)
+
+
+def _dotted_name(node):
+    """Best-effort dotted name of a decorator or base-class expression"""
+    if isinstance(node, ast.Call):
+        node = node.func
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return '.'.join(reversed(parts))
+    return ast.unparse(node)
+
+
+class _StructureVisitor(ast.NodeVisitor):
+    """Collect functions, classes, imports and control flow in one scoped pass"""
+    
+    def __init__(self):
+        self.functions = []
+        self.classes = []
+        self.methods = []
+        self.imports = []
+        self.control_flow = ControlFlowTable()
+        self.metrics = MetricsTable()
+        self._scope = []
+    
+    def generic_visit(self, node):
+        # Only statements can hold definitions, imports or control flow
+        for field in _STATEMENT_FIELDS:
+            for child in getattr(node, field, ()):
+                self.visit(child)
+    
+    def visit_FunctionDef(self, node, is_async=False):
+        parent = self._scope[-1] if self._scope else None
+        record = FunctionRecord(
+            node.name,
+            f"{parent.qualname}.{node.name}" if parent else node.name,
+            [arg.arg for arg in node.args.args],
+            node.lineno,
+            node.end_lineno,
+            parent.qualname if parent else None,
+            [_dotted_name(d) for d in node.decorator_list],
+            is_async
+        )
+        if isinstance(parent, ClassRecord):
+            parent.methods.append(node.name)
+            self.methods.append(record)
+        else:
+            self.functions.append(record)
+        complexity, depth, fan_out = _function_metrics(node)
+        self.metrics.append(record.qualname, complexity, depth, node.end_lineno - node.lineno + 1, fan_out)
+        
+        self._scope.append(record)
+        self.generic_visit(node)
+        self._scope.pop()
+    
+    def visit_AsyncFunctionDef(self, node):
+        self.visit_FunctionDef(node, is_async=True)
+    
+    def visit_ClassDef(self, node):
+        parent = self._scope[-1] if self._scope else None
+        record = ClassRecord(
+            node.name,
+            f"{parent.qualname}.{node.name}" if parent else node.name,
+            [_dotted_name(b) for b in node.bases],
+            node.lineno,
+            node.end_lineno,
+            parent.qualname if parent else None,
+            [_dotted_name(d) for d in node.decorator_list]
+        )
+        self.classes.append(record)
+        
+        self._scope.append(record)
+        self.generic_visit(node)
+        self._scope.pop()
+    
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append(alias.name)
+    
+    def visit_ImportFrom(self, node):
+        if node.module:
+            self.imports.append(node.module)
+    
+    def visit_If(self, node):
+        self.control_flow.append('If', node.lineno)
+        self.generic_visit(node)
+    
+    def visit_For(self, node):
+        self.control_flow.append('For', node.lineno)
+        self.generic_visit(node)
+    
+    visit_AsyncFor = visit_For
+    
+    def visit_While(self, node):
+        self.control_flow.append('While', node.lineno)
+        self.generic_visit(node)
+
 
 class CodeParser:
     """Parse different code file types and extract structure"""
     
+    def __init__(self, cell_cache=None):
+        # Per-cell notebook results, reused by later parse_cells calls on this parser
+        self.cell_cache = cell_cache if cell_cache is not None else CellCache()
+    
     def parse_file(self, content, file_type):
         """Main entry point for parsing files"""
         if file_type == 'py':
@@ -17,129 +401,298 @@ class CodeParser:
             raise ValueError(f"Unsupported file type: {file_type}")
     
     def parse_python(self, code):
-        """Parse Python code using AST"""
+        """Parse Python code using AST
+        
+        A single scoped pass over the statement tree. Functions, classes and
+        methods come back as compact records that also read like dicts
+        (record['name'], record.get('methods')); control flow is array-backed.
+        """
         try:
             tree = ast.parse(code)
-            structure = {
-                'functions': [],
-                'classes': [],
-                'imports': [],
-                'control_flow': []
-            }
-            
-            for node in ast.walk(tree):
-                # Extract functions
-                if isinstance(node, ast.FunctionDef):
-                    structure['functions'].append({
-                        'name': node.name,
-                        'args': [arg.arg for arg in node.args.args],
-                        'line': node.lineno
-                    })
-                
-                # Extract classes
-                elif isinstance(node, ast.ClassDef):
-                    methods = [n.name for n in node.body if isinstance(n, ast.FunctionDef)]
-                    structure['classes'].append({
-                        'name': node.name,
-                        'methods': methods,
-                        'line': node.lineno
-                    })
-                
-                # Extract imports
-                elif isinstance(node, ast.Import):
-                    for alias in node.names:
-                        structure['imports'].append(alias.name)
-                
-                elif isinstance(node, ast.ImportFrom):
-                    if node.module:
-                        structure['imports'].append(node.module)
-                
-                # Extract control flow
-                elif isinstance(node, (ast.If, ast.For, ast.While)):
-                    structure['control_flow'].append({
-                        'type': type(node).__name__,
-                        'line': node.lineno
-                    })
-            
-            return structure
-        
         except SyntaxError as e:
             return {
                 'error': f'Syntax error in Python code: {str(e)}',
                 'functions': [],
                 'classes': [],
+                'methods': [],
                 'imports': [],
-                'control_flow': []
+                'control_flow': [],
+                'metrics': []
             }
+        
+        visitor = _StructureVisitor()
+        visitor.visit(tree)
+        return {
+            'functions': visitor.functions,
+            'classes': visitor.classes,
+            'methods': visitor.methods,
+            'imports': visitor.imports,
+            'control_flow': visitor.control_flow,
+            'metrics': visitor.metrics
+        }
     
     def parse_jupyter(self, content):
-        """Parse Jupyter notebook and extract Python code"""
-        try:
-            notebook = json.loads(content)
-            all_code = []
-            
-            # Extract code from all code cells
-            for cell in notebook.get('cells', []):
-                if cell.get('cell_type') == 'code':
-                    code_lines = cell.get('source', [])
-                    if isinstance(code_lines, list):
-                        all_code.append(''.join(code_lines))
-                    else:
-                        all_code.append(code_lines)
-            
-            # Parse combined code
-            combined_code = '\n\n'.join(all_code)
-            return self.parse_python(combined_code)
+        """Parse the code cells of a notebook (str, bytes, path or binary file)
         
-        except json.JSONDecodeError:
+        The notebook is streamed, so outputs are never loaded into memory.
+        """
+        try:
+            cells = read_code_cells(content)
+        except NotebookFormatError:
             return {
                 'error': 'Invalid Jupyter notebook format',
                 'functions': [],
                 'classes': [],
+                'methods': [],
                 'imports': [],
-                'control_flow': []
+                'control_flow': [],
+                'metrics': []
             }
+        return self.parse_cells(cells)
     
-    def parse_cpp(self, code):
-        """Parse C++ code using regex (simple approach)"""
+    def parse_cells(self, cells):
+        """Parse notebook code cells one at a time
+        
+        Line numbers refer to the cells joined with blank lines (see
+        join_cells). structure['cells'] maps each cell to its index and byte
+        offset in the notebook, its first line and a digest of its source; a
+        cell that fails to parse gets an 'error' there instead of failing the
+        whole notebook. Cells are cached by source, so re-parsing an edited
+        notebook only parses the edited cells. structure['digests'] holds a
+        hash of every definition's source for diff_structures.
+        """
         structure = {
             'functions': [],
             'classes': [],
-            'includes': [],
-            'control_flow': []
+            'methods': [],
+            'imports': [],
+            'control_flow': ControlFlowTable(),
+            'metrics': MetricsTable(),
+            'cells': [],
+            'digests': {}
         }
+        line = 1
+        for cell in cells:
+            parsed = self.cell_cache.get(cell.source, self._parse_cell)
+            offset = line - 1
+            entry = {'index': cell.index, 'offset': cell.offset, 'line': line, 'digest': parsed['digest']}
+            if 'error' in parsed:
+                entry['error'] = f"Syntax error in cell {cell.index + 1}: {parsed['error']}"
+            structure['cells'].append(entry)
+            
+            for key in ('functions', 'classes', 'methods'):
+                structure[key].extend(record.shifted(offset) for record in parsed[key])
+            structure['imports'].extend(parsed['imports'])
+            structure['control_flow'].extend(parsed['control_flow'], offset)
+            structure['metrics'].extend(parsed['metrics'])
+            # Later cells redefine names, as they would when the notebook runs
+            structure['digests'].update(parsed['digests'])
+            line += cell.source.count('\n') + CELL_SEPARATOR.count('\n')
+        return structure
+    
+    def _parse_cell(self, source):
+        """Structure of one cell, with cell-local line numbers and per-definition digests"""
+        parsed = {'digest': CellCache.digest(source), 'digests': {}}
+        visitor = _StructureVisitor()
+        try:
+            tree = ast.parse(_MAGIC_LINE.sub('', source))
+        except SyntaxError as e:
+            parsed['error'] = str(e)
+        else:
+            visitor.visit(tree)
         
-        # Extract includes
-        include_pattern = r'#include\s*[<"]([^>"]+)[>"]'
-        structure['includes'] = re.findall(include_pattern, code)
-        
-        # Extract function definitions (simplified)
-        func_pattern = r'(?:void|int|float|double|char|bool|string|auto)\s+(\w+)\s*\([^)]*\)\s*{'
-        functions = re.findall(func_pattern, code)
-        structure['functions'] = [{'name': f, 'line': 0} for f in functions]
-        
-        # Extract class definitions
-        class_pattern = r'class\s+(\w+)\s*(?::\s*public\s+\w+)?\s*{'
-        classes = re.findall(class_pattern, code)
-        structure['classes'] = [{'name': c, 'methods': []} for c in classes]
-        
-        # Extract control flow keywords
-        lines = code.split('\n')
-        for i, line in enumerate(lines, 1):
-            if re.search(r'\bif\s*\(', line):
-                structure['control_flow'].append({'type': 'If', 'line': i})
-            elif re.search(r'\bfor\s*\(', line):
-                structure['control_flow'].append({'type': 'For', 'line': i})
-            elif re.search(r'\bwhile\s*\(', line):
-                structure['control_flow'].append({'type': 'While', 'line': i})
+        lines = source.splitlines()
+        for record in visitor.functions + visitor.methods + visitor.classes:
+            text = '\n'.join(lines[record.line - 1:record.end_line])
+            text += repr(record.decorators)
+            parsed['digests'][record.qualname] = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
         
-        return structure
+        parsed.update(functions=visitor.functions, classes=visitor.classes, methods=visitor.methods,
+                      imports=visitor.imports, control_flow=visitor.control_flow, metrics=visitor.metrics)
+        return parsed
     
-    def get_code_complexity(self, structure):
-        """Calculate basic complexity metrics"""
+    def parse_cpp(self, code):
+        """Parse C++ code with a single linear scan
+        
+        Comments, string literals and preprocessor lines are skipped, so
+        keywords inside them are ignored. Free functions and methods (inline
+        or out-of-line Class::method definitions) come back as records with
+        real line numbers, like parse_python.
+        """
+        scan = CppScanner(code).scan()
+        
+        classes = []
+        for cls in scan.classes:
+            record = ClassRecord(cls['name'], cls['qualname'], cls['bases'], cls['line'],
+                                 cls['end_line'], cls['parent'])
+            record.methods = cls['methods']
+            classes.append(record)
+        
+        functions = []
+        methods = []
+        metrics = MetricsTable()
+        for func in scan.functions:
+            record = FunctionRecord(func['name'], func['qualname'], func['args'], func['line'],
+                                    func['end_line'], func['parent'])
+            (methods if func['parent'] else functions).append(record)
+            complexity, depth, fan_out = func['metrics']
+            metrics.append(func['qualname'], complexity, depth, func['end_line'] - func['line'] + 1, fan_out)
+        
+        control_flow = ControlFlowTable()
+        for type_name, line in scan.control_flow:
+            control_flow.append(type_name, line)
+        
+        return {
+            'functions': functions,
+            'classes': classes,
+            'methods': methods,
+            'includes': [path for path, _ in scan.includes],
+            'control_flow': control_flow,
+            'metrics': metrics
+        }
+    
+    def get_code_complexity(self, structure, top=5):
+        """Calculate complexity metrics from the parse result
+        
+        Besides the definition counts, aggregates the per-function metrics
+        recorded during parsing: average and maximum cyclomatic complexity,
+        deepest nesting, total lines in functions and the `top` most complex
+        functions as (qualname, complexity) pairs.
+        """
+        metrics = MetricsTable.from_rows(structure.get('metrics', []))
+        count = len(metrics)
+        hotspots = heapq.nlargest(top, range(count), key=lambda i: (metrics.complexity[i], metrics.depth[i]))
         return {
             'num_functions': len(structure.get('functions', [])),
+            'num_methods': len(structure.get('methods', [])),
             'num_classes': len(structure.get('classes', [])),
             'num_imports': len(structure.get('imports', [])) + len(structure.get('includes', [])),
-            'num_control_structures': len(structure.get('control_flow', []))
-        }
\ No newline at end of file
+            'num_control_structures': len(structure.get('control_flow', [])),
+            'avg_complexity': round(sum(metrics.complexity) / count, 2) if count else 0,
+            'max_complexity': max(metrics.complexity, default=0),
+            'max_depth': max(metrics.depth, default=0),
+            'function_loc': sum(metrics.loc),
+            'hotspots': [(metrics.qualnames[i], metrics.complexity[i]) for i in hotspots]
+        }
+    
+    def split_chunks(self, content, file_type, max_chars=6000):
+        """Split source into summarization chunks along top-level boundaries
+        
+        Python is split into top-level functions, classes and the module code
+        between them, notebooks into code cells and C++ into top-level blocks.
+        Small neighbouring units are grouped using content-defined boundaries,
+        so editing one unit only changes the chunk that contains it.
+        Returns a list of {'name', 'line', 'source'} dicts.
+        """
+        if file_type == 'ipynb':
+            units = self._notebook_units(content)
+        elif file_type == 'py':
+            units = self._python_units(content)
+        else:
+            units = self._block_units(content)
+        
+        # Break oversized units into line-based pieces
+        sized_units = []
+        for name, line, source in units:
+            if len(source) <= max_chars:
+                sized_units.append((name, line, source))
+                continue
+            for part, (offset, piece) in enumerate(self._split_lines(source, max_chars), 1):
+                sized_units.append((f"{name} (part {part})", line + offset, piece))
+        
+        # Group small units; a boundary falls after any unit whose hash says so
+        chunks = []
+        names, sources, start_line, size = [], [], None, 0
+        for name, line, source in sized_units:
+            if sources and size + len(source) > max_chars:
+                chunks.append({'name': ', '.join(names), 'line': start_line, 'source': '\n'.join(sources)})
+                names, sources, start_line, size = [], [], None, 0
+            
+            names.append(name)
+            sources.append(source)
+            start_line = line if start_line is None else start_line
+            size += len(source)
+            
+            digest = hashlib.md5(source.encode('utf-8')).digest()
+            if size >= max_chars // 4 and digest[0] % 4 == 0:
+                chunks.append({'name': ', '.join(names), 'line': start_line, 'source': '\n'.join(sources)})
+                names, sources, start_line, size = [], [], None, 0
+        
+        if sources:
+            chunks.append({'name': ', '.join(names), 'line': start_line, 'source': '\n'.join(sources)})
+        return chunks
+    
+    def _python_units(self, code):
+        """Top-level statements as (name, line, source), keeping comments with the next unit"""
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return self._block_units(code)
+        
+        lines = code.splitlines(keepends=True)
+        units = []
+        prev_end = 0
+        module_start = None
+        
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if module_start is not None:
+                    units.append(('module code', module_start + 1, ''.join(lines[module_start:prev_end])))
+                    module_start = None
+                kind = 'class' if isinstance(node, ast.ClassDef) else 'function'
+                units.append((f"{kind} {node.name}", prev_end + 1, ''.join(lines[prev_end:node.end_lineno])))
+            elif module_start is None:
+                module_start = prev_end
+            prev_end = node.end_lineno
+        
+        if module_start is not None or prev_end < len(lines):
+            start = prev_end if module_start is None else module_start
+            units.append(('module code', start + 1, ''.join(lines[start:])))
+        return units
+    
+    def _notebook_units(self, content):
+        """Code cells of a notebook as (name, line, source)"""
+        try:
+            cells = read_code_cells(content)
+        except NotebookFormatError:
+            return self._block_units(content)
+        return [(f"cell {cell.index + 1}", 1, cell.source) for cell in cells if cell.source.strip()]
+    
+    def _block_units(self, code):
+        """Split brace-delimited code (or anything unparsable) at top-level block ends"""
+        units = []
+        lines = code.splitlines(keepends=True)
+        depth = 0
+        start = 0
+        
+        for i, line in enumerate(lines):
+            stripped = re.sub(r'//.*|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'', '', line)
+            depth = max(0, depth + stripped.count('{') - stripped.count('}'))
+            if depth == 0 and stripped.rstrip().endswith(('}', '};')):
+                block = ''.join(lines[start:i + 1])
+                units.append((self._block_name(block), start + 1, block))
+                start = i + 1
+        
+        if start < len(lines):
+            block = ''.join(lines[start:])
+            units.append((self._block_name(block), start + 1, block))
+        return units
+    
+    def _block_name(self, block):
+        for line in block.splitlines():
+            line = line.strip()
+            if line and not line.startswith(('//', '#', '/*', '*')):
+                return line[:60]
+        return 'declarations'
+    
+    def _split_lines(self, source, max_chars):
+        """Yield (line_offset, piece) pieces of at most ~max_chars on line boundaries"""
+        piece, offset, size = [], 0, 0
+        for i, line in enumerate(source.splitlines(keepends=True)):
+            if piece and size + len(line) > max_chars:
+                yield offset, ''.join(piece)
+                piece, offset, size = [], i, 0
+            piece.append(line)
+            size += len(line)
+        if piece:
+            yield offset, ''.join(piece)
@@ -0,0 +1,143 @@
+import bisect
+import math
+import os
+import re
+from collections import Counter
+
+from code_parser import CONTROL_FLOW_TYPES, ControlFlowTable, MetricsTable
+
+# Approximate token budget for the structure context in the diagram prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CODETODIAGRAM_CONTEXT_TOKENS', '1500'))
+
+# Imports listed before the rest are only counted
+MAX_IMPORTS = 15
+
+# Roughly one token per word piece of up to 4 characters and per punctuation mark
+_PIECES = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d]')
+_CALL = re.compile(r'\b([A-Za-z_]\w*)\s*\(')
+
+
+def estimate_tokens(text):
+    """Local estimate of the model's token count for text, within about 15% for code and prose"""
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text))
+
+
+def _complexity(functions, structure):
+    """Cyclomatic complexity of each function, from the parse metrics when the structure has them
+
+    Without metrics (older cached results), the control-flow statements inside
+    each function, counted for the innermost one, stand in for its decision points.
+    """
+    if structure.get('metrics'):
+        rows = MetricsTable.from_rows(structure['metrics']).by_name()
+        return [rows[f['qualname']]['complexity'] if f['qualname'] in rows else 1 for f in functions]
+    control_flow = structure.get('control_flow', [])
+    order = sorted(range(len(functions)), key=lambda i: functions[i]['line'])
+    starts = [functions[i]['line'] for i in order]
+    counts = Counter()
+    # A ControlFlowTable exposes its line numbers as an array; plain parse results are lists of dicts
+    lines = control_flow.lines if isinstance(control_flow, ControlFlowTable) else [n['line'] for n in control_flow]
+    for line in lines:
+        i = bisect.bisect_right(starts, line) - 1
+        while i >= 0 and functions[order[i]]['end_line'] < line:
+            i -= 1
+        if i >= 0:
+            counts[order[i]] += 1
+    return [1 + counts[i] for i in range(len(functions))]
+
+
+def rank_functions(structure, code_content=None):
+    """Functions and methods, most informative first
+
+    Public names rank above private ones; call fan-in within the file (when
+    code_content is given) and cyclomatic complexity rank the rest.
+    Returns [(score, record, fan_in, complexity)].
+    """
+    functions = list(structure.get('functions', [])) + list(structure.get('methods', []))
+    calls = Counter(_CALL.findall(code_content)) if code_content else Counter()
+    definitions = Counter(f['name'] for f in functions)
+    complexity = _complexity(functions, structure)
+
+    ranked = []
+    for i, func in enumerate(functions):
+        name = func['name']
+        public = not name.startswith('_') or (name.startswith('__') and name.endswith('__'))
+        fan_in = max(0, calls[name] - definitions[name])
+        score = 3 * public + 2 * math.log2(1 + fan_in) + math.log2(complexity[i])
+        ranked.append((score, func, fan_in, complexity[i]))
+    ranked.sort(key=lambda entry: (-entry[0], entry[1]['line']))
+    return ranked
+
+
+def _function_line(func, fan_in, complexity):
+    args = list(func.get('args') or ())
+    if func.get('parent') and args and args[0] in ('self', 'cls'):
+        args = args[1:]
+    args = ', '.join(args)
+    notes = [f"L{func['line']}-{func['end_line']}"]
+    if fan_in:
+        notes.append(f"called {fan_in}x")
+    if complexity > 1:
+        notes.append(f"complexity {complexity}")
+    prefix = 'async ' if func.get('is_async') else ''
+    return f"- {prefix}{func['qualname']}({args}) [{', '.join(notes)}]"
+
+
+def build_context(structure, code_content=None, budget=CONTEXT_TOKEN_BUDGET):
+    """Compact structure description for the diagram prompt, within about `budget` tokens
+
+    Control-flow totals and dependencies come first, then classes (up to a
+    third of the budget) and functions and methods in rank order until the
+    budget is spent; whatever doesn't fit is counted instead of listed.
+    """
+    lines = []
+    control_flow = structure.get('control_flow', [])
+    if isinstance(control_flow, ControlFlowTable):
+        control_flow = Counter({CONTROL_FLOW_TYPES[code]: n for code, n in Counter(control_flow.types).items()})
+    else:
+        control_flow = Counter(node['type'] for node in control_flow)
+    if control_flow:
+        lines.append("Control structures: " + ', '.join(f"{t} x{n}" for t, n in control_flow.most_common()))
+
+    imports = list(dict.fromkeys(structure.get('imports', []) + structure.get('includes', [])))
+    if imports:
+        more = f" (+{len(imports) - MAX_IMPORTS} more)" if len(imports) > MAX_IMPORTS else ""
+        lines.append(f"Dependencies: {', '.join(imports[:MAX_IMPORTS])}{more}")
+
+    used = estimate_tokens("\n".join(lines))
+    ranked = rank_functions(structure, code_content)
+
+    # Classes are listed in the order of their best-ranked method; the methods themselves are ranked below
+    classes = structure.get('classes', [])
+    if classes:
+        best = {}
+        for position, (_, func, _, _) in enumerate(ranked):
+            best.setdefault(func.get('parent'), position)
+        lines.append("Classes:")
+        used += estimate_tokens(lines[-1])
+        ordered = sorted(classes, key=lambda cls: (best.get(cls['qualname'], len(ranked)), cls['line']))
+        for i, cls in enumerate(ordered):
+            bases = f"({', '.join(cls['bases'])})" if cls.get('bases') else ""
+            count = len(cls.get('methods', []))
+            line = f"- {cls['qualname']}{bases}" + (f", {count} methods" if count else "")
+            cost = estimate_tokens(line)
+            # Classes get at most a third of the budget, so the functions always have room
+            if used + cost > budget // 3:
+                lines.append(f"- ... {len(ordered) - i} more classes")
+                break
+            lines.append(line)
+            used += cost
+
+    if ranked:
+        lines.append("Functions and methods (most important first):")
+        used += estimate_tokens(lines[-1])
+        for i, (_, func, fan_in, complexity) in enumerate(ranked):
+            line = _function_line(func, fan_in, complexity)
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                lines.append(f"- ... {len(ranked) - i} more functions and methods not listed")
+                break
+            lines.append(line)
+            used += cost
+
+    return "\n".join(lines) if lines else "Empty or simple code structure"
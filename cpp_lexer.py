@@ -0,0 +1,660 @@
+import re
+
+CPP_KEYWORDS = {
+    'if', 'else', 'for', 'while', 'do', 'switch', 'case', 'default', 'return', 'break',
+    'continue', 'try', 'catch', 'throw', 'goto', 'sizeof', 'new', 'delete', 'class',
+    'struct', 'namespace', 'enum', 'union', 'template', 'typename', 'using', 'operator',
+    'static_assert', 'decltype', 'alignof', 'co_return', 'co_await', 'co_yield', 'noexcept',
+    'requires'
+}
+ACCESS_SPECIFIERS = {'public', 'private', 'protected'}
+CPP_QUALIFIERS = {'const', 'noexcept', 'override', 'final', 'volatile', '&', '&&', 'mutable', 'constexpr'}
+CLASS_KEYWORDS = {'class', 'struct', 'union'}
+
+# Full tokenizer, used on the (short) declaration heads and on function bodies
+_TOKEN = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<comment>//[^\n]*|/\*(?:.*?\*/|.*))
+  | (?P<pp>^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>(?<![\w])(?:u8|u|U|L)?R"(?P<delim>[^(\s"]{0,16})\((?:.*?\)(?P=delim)"|.*)
+               |[uUL8]*"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<number>\.?\d[\w.']*)
+  | (?P<op>::|->|\+\+|--|&&|\|\||[<>=!+\-*/%&|^]=|<<|>>|.)
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+# Comments, literals and preprocessor lines. Every branch starts with a literal
+# character so the regex engine can skip ahead between matches.
+_NOISE = re.compile(
+    r"//[^\n]*|/\*(?:.*?\*/|.*)"             # comments (an unterminated block comment runs to EOF)
+    r"|#(?:\\\n|[^\n])*"                   # preprocessor lines, with continuations
+    r'|"(?:\\.|[^"\\\n])*"'                # string literals
+    r"|'(?:\\.|[^'\\\n])*'"                # character literals
+    r'|R"([^(\s"]{0,16})\((?:.*?\)\1"|.*)',  # raw string literals
+    re.DOTALL
+)
+
+# Structural scan over the blanked text: scope braces and control-flow keywords
+_BRACES = re.compile(r'[{}]')
+_CONTROL = re.compile(r'(?<!\w)(?:if|for|while)(?=\s*\()')
+# Function bodies: decision points (keywords, &&, ||, ?) and called names
+# (the lookaheads let the regex engine skip positions that can't start a match)
+_DECISIONS = re.compile(r'(?=[&|?cfiw])(?:&&|\|\||\?|\b(?:if|for|while|case|catch)\b)')
+_CALLS = re.compile(r'(?=[A-Za-z_])(?<![\w~])(\w+)\s*\(')
+
+# Tokenizer for blanked text (no comments or preprocessor lines, literals emptied)
+_CLEAN_TOKEN = re.compile(
+    r'(\s*)(?:([A-Za-z_]\w*)|(\.?\d[\w.\']*)|("[^"\n]*"|\'[^\'\n]*\')'
+    r'|(::|->|\+\+|--|&&|\|\||[<>=!+\-*/%&|^]=|<<|>>|\S))'
+)
+
+_INCLUDE = re.compile(r'#\s*include\s*[<"]([^>"]+)[>"]')
+
+# Fast path for the common head shape: [type] name(params) [qualifiers], with no
+# nested parens or multi-argument templates in the parameters. Anything else is tokenized.
+# Matched against the reversed text before '(' so only the name itself is examined
+_REVERSED_NAME = re.compile(r'\s*(\w*[A-Za-z_]~?(?:\s*::\s*\w*[A-Za-z_])*)(?![\w:~.])')
+_TRAILING_QUALIFIERS = re.compile(r'(?:\s*(?:const|noexcept|override|final|volatile|&&|&))*\s*$')
+_TEMPLATE_COMMA = re.compile(r'<[^<>]*,')
+# A parameter name follows its type: `int x`, `T* p`, `vector<int> v`, `Args&&... args`
+_PARAM_NAME = re.compile(r'(?:[*&>.]|\w\s)\s*([A-Za-z_]\w*)\s*(?:\[[^\]]*\]+\s*)*$')
+_ACCESS_LABEL = re.compile(r'\b(?:public|private|protected)\s*:(?!:)')
+
+
+def tokenize(code, start=0, end=None, line=1):
+    """Return significant tokens (kind, text, line) of code[start:end]
+
+    Comments, whitespace and preprocessor lines are dropped.
+    """
+    tokens = []
+    append = tokens.append
+    for m in _TOKEN.finditer(code, start, len(code) if end is None else end):
+        kind = m.lastgroup if m.lastgroup != 'delim' else 'string'
+        text = m.group()
+        if kind in ('ws', 'comment', 'pp'):
+            line += text.count('\n')
+            continue
+        append((kind, text, line))
+        if kind == 'string':
+            line += text.count('\n')
+    return tokens
+
+
+def _tokenize_clean(text, start, end, line):
+    """tokenize() for blanked text, using findall to keep per-token overhead low"""
+    tokens = []
+    append = tokens.append
+    for ws, word, number, string, op in _CLEAN_TOKEN.findall(text, start, end):
+        if ws and '\n' in ws:
+            line += ws.count('\n')
+        if word:
+            append(('word', word, line))
+        elif op:
+            append(('op', op, line))
+        elif number:
+            append(('number', number, line))
+        elif string:
+            append(('string', string, line))
+    return tokens
+
+
+def tokens_text(tokens):
+    """Join tokens back into compact source text"""
+    out = []
+    prev_word = False
+    for kind, text, _ in tokens:
+        is_word = kind in ('word', 'number')
+        if prev_word and is_word:
+            out.append(' ')
+        out.append(text)
+        prev_word = is_word
+    return ''.join(out)
+
+
+def _simple_function(head):
+    """Match head against the common function shape, returning (name_parts, params, name_offset) or None"""
+    close = head.rfind(')')
+    if close < 0 or not _TRAILING_QUALIFIERS.match(head, close + 1):
+        return None
+    open_ = head.rfind('(', 0, close)
+    if open_ < 0 or head.find(')', open_, close) != -1:
+        return None
+    params = head[open_ + 1:close]
+    if '{' in params or '}' in params:
+        return None
+    m = _REVERSED_NAME.match(head[max(0, open_ - 256):open_][::-1])
+    if m is None:
+        return None
+    name_start = open_ - m.end(1)
+    parts = [p.strip() for p in m.group(1)[::-1].split('::')]
+    if parts[-1] in CPP_KEYWORDS or parts[0] == 'operator':
+        return None
+    before = head[:name_start].rstrip()
+    if before.endswith('operator') or 'namespace' in before:
+        # namespace std _GLIBCXX_VISIBILITY(default) {
+        return None
+    # Initializer lists, calls, assignments and template-qualified names need the full analysis
+    if before.endswith((',', '=', '(', '->', '.', ':', 'return')):
+        return None
+    names = []
+    if '<' in params and _TEMPLATE_COMMA.search(params):
+        return None
+    if params.strip():
+        for param in params.split(','):
+            name = _PARAM_NAME.search(param.split('=', 1)[0])
+            if name:
+                names.append(name.group(1))
+    return parts, names, name_start
+
+
+def _signature_text(head):
+    """Whitespace-normalized declaration text, without a leading access label"""
+    return ' '.join(_ACCESS_LABEL.split(head)[-1].split())
+
+
+def _match_back(tokens, i, open_tok, close_tok):
+    depth = 0
+    while i >= 0:
+        t = tokens[i][1]
+        if t == close_tok:
+            depth += 1
+        elif t == open_tok:
+            depth -= 1
+            if depth == 0:
+                return i
+        i -= 1
+    return 0
+
+
+def function_signature(tokens):
+    """If head tokens end in a function declarator, return (name_parts, name_index, open_paren, close_paren)
+
+    Handles qualified names, destructors, operators, trailing return types,
+    noexcept/qualifiers, pure/defaulted/deleted members and constructor
+    initializer lists. Returns None for anything else.
+    """
+    j = len(tokens) - 1
+    # Pure virtual / defaulted / deleted declarations
+    if j >= 1 and tokens[j - 1][1] == '=' and tokens[j][1] in ('0', 'default', 'delete'):
+        j -= 2
+
+    # Initializer list ending in a braced member: Foo() : x{1} {
+    if j >= 0 and tokens[j][1] == '}':
+        open_brace = _match_back(tokens, j, '{', '}')
+        if open_brace > 1 and tokens[open_brace - 1][0] == 'word' and tokens[open_brace - 2][1] in (',', ':'):
+            j = open_brace - 2
+            while j >= 0 and tokens[j][1] != ':':
+                if tokens[j][1] in (')', '}'):
+                    j = _match_back(tokens, j, '(' if tokens[j][1] == ')' else '{', tokens[j][1])
+                j -= 1
+            j -= 1
+
+    while j >= 0:
+        while j >= 0 and tokens[j][1] in CPP_QUALIFIERS:
+            j -= 1
+        # Trailing return type: auto f() -> T
+        k = j
+        while k >= 0 and tokens[k][1] not in (')', ';', '{', '}'):
+            if tokens[k][1] == '->':
+                j = k - 1
+                break
+            k -= 1
+        if j < 0 or tokens[j][1] != ')':
+            return None
+        open_paren = _match_back(tokens, j, '(', ')')
+        # noexcept(...) / throw(...) specifications sit after the parameter list
+        if open_paren > 0 and tokens[open_paren - 1][1] in ('noexcept', 'throw'):
+            j = open_paren - 2
+            continue
+        break
+    else:
+        return None
+
+    close_paren = j
+    name_end = open_paren - 1
+    if name_end < 0:
+        return None
+
+    # Constructor initializer lists: Foo::Foo(int a) : x(a), y{b}
+    if tokens[name_end][0] == 'word' and name_end > 0 and tokens[name_end - 1][1] in (',', ':'):
+        k = name_end - 1
+        while k >= 0 and tokens[k][1] != ':':
+            if tokens[k][1] in (')', '}'):
+                k = _match_back(tokens, k, '(' if tokens[k][1] == ')' else '{', tokens[k][1])
+            k -= 1
+        j = k - 1
+        while j >= 0 and tokens[j][1] in CPP_QUALIFIERS:
+            j -= 1
+        if j < 0 or tokens[j][1] != ')':
+            return None
+        close_paren = j
+        open_paren = _match_back(tokens, j, '(', ')')
+        name_end = open_paren - 1
+        if name_end < 0:
+            return None
+
+    kind, word, _ = tokens[name_end]
+    if name_end > 0 and tokens[name_end - 1][1] == 'operator':
+        # operator overloads: operator==, operator() and conversions: operator bool
+        word = 'operator' + (' ' + word if kind == 'word' else word)
+        name_end -= 1
+    elif kind != 'word' or word in CPP_KEYWORDS:
+        if word == ')' and name_end > 1 and tokens[name_end - 2][1] == 'operator':
+            word = 'operator()'
+            name_end -= 2
+        else:
+            return None
+
+    # Calls on an object or assignments are expressions, not declarators
+    if name_end > 0 and tokens[name_end - 1][1] in ('.', '->', '=', '(', ',', 'return'):
+        return None
+
+    parts = [word]
+    k = name_end - 1
+    if k >= 0 and tokens[k][1] == '~':
+        parts[0] = '~' + parts[0]
+        name_end = k
+        k -= 1
+    while k >= 1 and tokens[k][1] == '::' and tokens[k - 1][0] == 'word':
+        parts.insert(0, tokens[k - 1][1])
+        k -= 2
+    return parts, name_end, open_paren, close_paren
+
+
+def parameter_names(tokens, open_paren, close_paren):
+    """Names of the parameters between open_paren and close_paren
+
+    Unnamed parameters (`int`, `const T&`) contribute nothing.
+    """
+    names = []
+    depth = 0
+    name = None
+    prev = None
+    in_default = False
+    for kind, text, _ in tokens[open_paren + 1:close_paren] + [('op', ',', 0)]:
+        if text in ('(', '<', '[', '{'):
+            depth += 1
+        elif text in (')', '>', ']', '}', '>>'):
+            depth -= 2 if text == '>>' else 1
+            prev = text
+        elif depth > 0:
+            continue
+        elif text == ',':
+            if name:
+                names.append(name)
+            name = prev = None
+            in_default = False
+        elif in_default:
+            continue
+        elif text == '=':
+            in_default = True
+        elif kind == 'word':
+            follows_type = prev is not None and (prev[0].isalnum() or prev[0] == '_' or
+                                                 prev in ('*', '&', '&&', '>', '>>', '...', '.'))
+            name = text if follows_type else None
+            prev = text
+        else:
+            name = None
+            prev = text
+    return names
+
+
+def _class_head(tokens):
+    """Return (kind, name, bases) if head tokens open a class/struct/union body"""
+    angle = 0
+    for i, (kind, text, _) in enumerate(tokens):
+        if text == '<':
+            angle += 1
+        elif text == '>':
+            angle -= 1
+        elif text == '>>':
+            angle -= 2
+        elif angle <= 0 and text in CLASS_KEYWORDS and not (i > 0 and tokens[i - 1][1] == 'enum'):
+            break
+    else:
+        return None
+
+    keyword = text
+    words = []
+    bases = []
+    j = i + 1
+    while j < len(tokens):
+        t = tokens[j][1]
+        if t == '[' or (t == '(' and words):
+            # [[attributes]], alignas(...), __declspec(...)
+            close, open_ = (']', '[') if t == '[' else (')', '(')
+            depth = 0
+            while j < len(tokens):
+                depth += tokens[j][1] == open_
+                depth -= tokens[j][1] == close
+                if depth == 0:
+                    break
+                j += 1
+            if t == '(' and words:
+                words.pop()
+        elif t == '<':
+            # Specialization arguments: class X<int>
+            depth = 0
+            while j < len(tokens):
+                depth += tokens[j][1] == '<'
+                depth -= tokens[j][1] == '>'
+                if depth <= 0:
+                    break
+                j += 1
+        elif t == ':':
+            bases = _base_names(tokens[j + 1:])
+            break
+        elif tokens[j][0] == 'word' and t != 'final':
+            words.append(t)
+        j += 1
+
+    name = words[-1] if words else '(anonymous)'
+    return keyword, name, bases
+
+
+def _base_names(tokens):
+    bases = []
+    current = []
+    angle = 0
+    for kind, text, _ in tokens + [('op', ',', 0)]:
+        if text == '<':
+            angle += 1
+        elif text == '>':
+            angle -= 1
+        elif text == ',' and angle <= 0:
+            if current:
+                bases.append(''.join(current))
+            current = []
+        elif angle <= 0 and (kind == 'word' and text not in ACCESS_SPECIFIERS and text != 'virtual' or text == '::'):
+            current.append(text)
+    return bases
+
+
+def _is_initializer_brace(tokens):
+    """True if the head ends inside a constructor initializer list, e.g. Foo() : x{"""
+    if tokens[-1][0] != 'word' or len(tokens) < 3 or tokens[-2][1] not in (',', ':'):
+        return False
+    if tokens[-2][1] == ':' and tokens[-3][1] in ACCESS_SPECIFIERS:
+        return False
+    depth = 0
+    for i in range(len(tokens) - 2, -1, -1):
+        t = tokens[i][1]
+        if t in (')', '}'):
+            depth += 1
+        elif t in ('(', '{'):
+            depth -= 1
+        elif t == ':' and depth == 0:
+            return i > 0 and tokens[i - 1][1] in CPP_QUALIFIERS | {')'}
+    return False
+
+
+class CppScan:
+    """Result of a CppScanner pass"""
+
+    def __init__(self):
+        self.includes = []       # (path, line)
+        self.functions = []      # dicts: name, qualname, parent, args, line, end_line, signature, body, metrics
+        self.classes = []        # dicts: name, qualname, kind, bases, methods, line, end_line, parent
+        self.control_flow = []   # (type, line)
+
+
+class CppScanner:
+    """Linear-time C++ structure scanner
+
+    Comments, literals and preprocessor lines are blanked in one regex pass,
+    then a single scan over braces tracks scope. Declaration heads before a
+    '{' (and ';'-terminated members inside a class) are matched against the
+    common function shape first and only tokenized when that fails, so
+    function bodies are never tokenized at all.
+    """
+
+    def __init__(self, code):
+        self.code = code
+
+    def scan(self):
+        result = CppScan()
+        clean = self.clean = self._blank_noise(result)
+        # Scope stack entries: [kind, record, qualname]
+        stack = [['namespace', None, '']]
+        namespaces = set()
+        head_start = 0
+        # Where ';' may end a declaration again after braces inside a head
+        resume = 0
+        line = 1
+        last = 0
+        classes_by_name = {}
+
+        pos = 0
+        search = _BRACES.search
+        while True:
+            m = search(clean, pos)
+            if m is None:
+                break
+            start = m.start()
+            pos = start + 1
+            line += clean.count('\n', last, start)
+            last = start
+
+            scope = stack[-1][0]
+            # Declarations ending in ';' since the previous brace are handled in bulk
+            semi = clean.rfind(';', max(head_start, resume), start) if scope != 'init' else -1
+            if semi != -1:
+                if scope == 'class':
+                    self._member_declarations(stack[-1][1], clean[head_start:semi])
+                head_start = semi + 1
+
+            if m.group() == '{':
+                if scope == 'init':
+                    stack.append(['init', None, stack[-1][2]])
+                    continue
+                if clean.count('(', head_start, start) > clean.count(')', head_start, start):
+                    # Inside a parameter list, e.g. a default argument T value = T{}
+                    stack.append(['init', None, stack[-1][2]])
+                    continue
+                head_line = line - clean.count('\n', head_start, start)
+                opened = self._open_scope(result, stack, head_start, start, head_line,
+                                          namespaces, classes_by_name)
+                if opened[0] == 'init':
+                    # Keep accumulating the constructor head up to its body
+                    stack.append(opened)
+                    continue
+                if opened[0] == 'function':
+                    # Function bodies only need their closing brace
+                    record = opened[1]
+                    end, record['metrics'] = self._body_metrics(clean, pos)
+                    line += clean.count('\n', last, end)
+                    last = end
+                    record['end_line'] = line
+                    record['body'] = (record['body'], end)
+                    pos = end + 1
+                else:
+                    stack.append(opened)
+            elif len(stack) > 1:
+                kind, record, _ = stack.pop()
+                if kind == 'init':
+                    resume = pos
+                    continue
+                if record is not None:
+                    record['end_line'] = line
+
+            head_start = pos
+
+        # Out-of-line definitions: void Foo::bar() { } belongs to class Foo
+        for func in result.functions:
+            if func['parent'] is None and '::' in func['qualname']:
+                owner = func['qualname'].rsplit('::', 1)[0]
+                cls = classes_by_name.get(owner) or classes_by_name.get(owner.rsplit('::', 1)[-1])
+                if cls is not None:
+                    func['parent'] = cls['qualname']
+                    if func['name'] not in cls['methods']:
+                        cls['methods'].append(func['name'])
+                elif owner not in namespaces:
+                    func['parent'] = owner
+
+        line = 1
+        last = 0
+        for m in _CONTROL.finditer(clean):
+            start = m.start()
+            line += clean.count('\n', last, start)
+            last = start
+            result.control_flow.append((m.group().capitalize(), line))
+        return result
+
+    def _body_metrics(self, clean, pos):
+        """Index of the '}' closing the function body that starts at pos, and the body's metrics
+
+        Metrics are (cyclomatic complexity, maximum brace nesting depth, number
+        of distinct called names); the depth comes from the brace scan that
+        finds the end, the rest from one regex pass over the body.
+        """
+        depth = 1
+        max_depth = 1
+        end = len(clean)
+        for m in _BRACES.finditer(clean, pos):
+            if m.group() == '{':
+                depth += 1
+                if depth > max_depth:
+                    max_depth = depth
+            else:
+                depth -= 1
+                if depth == 0:
+                    end = m.start()
+                    break
+        # Counting over the body slice keeps the per-match work in the regex engine
+        complexity = 1 + len(_DECISIONS.findall(clean, pos, end))
+        callees = set(_CALLS.findall(clean, pos, end)) - CPP_KEYWORDS
+        return end, (complexity, max_depth - 1, len(callees))
+
+    def _blank_noise(self, result):
+        """Return the code with comments and preprocessor lines blanked and literals emptied
+
+        Offsets and line breaks are preserved, so positions in the blanked
+        text map straight back to the source. Includes are collected on the way.
+        """
+        code = self.code
+        includes = []
+
+        def blank(m):
+            text = m.group()
+            first = text[0]
+            if first == '#':
+                include = _INCLUDE.match(text)
+                if include:
+                    includes.append((include.group(1), m.start()))
+            elif first in '"\'':
+                return first + ' ' * (len(text) - 2) + text[-1] if len(text) >= 2 else text
+            elif first == 'R':
+                # Raw strings may span lines; keep an empty literal plus the line breaks
+                return '""' + re.sub(r'[^\n]', ' ', text[2:])
+            if '\n' not in text:
+                return ' ' * len(text)
+            return re.sub(r'[^\n]', ' ', text)
+
+        clean = _NOISE.sub(blank, code)
+
+        line = 1
+        last = 0
+        for path, pos in includes:
+            line += code.count('\n', last, pos)
+            last = pos
+            result.includes.append((path, line))
+        return clean
+
+    def _open_scope(self, result, stack, head_start, brace, head_line, namespaces, classes_by_name):
+        """Classify the declaration head before a '{' outside function bodies"""
+        prefix = stack[-1][2]
+        head = self.clean[head_start:brace]
+        enclosing = stack[-1][1] if stack[-1][0] == 'class' else None
+
+        simple = _simple_function(head) if '(' in head else None
+        if simple is not None:
+            parts, args, offset = simple
+            name_line = head_line + head.count('\n', 0, offset)
+            return self._add_function(result, parts, args, name_line, head, brace, enclosing, prefix)
+
+        tokens = _tokenize_clean(self.clean, head_start, brace, head_line)
+        # Access labels aren't terminated by ';', so they lead the next member's head
+        while len(tokens) > 2 and tokens[0][1] in ACCESS_SPECIFIERS and tokens[1][1] == ':':
+            tokens = tokens[2:]
+        if not tokens:
+            return ['block', None, prefix]
+
+        texts = [t[1] for t in tokens]
+        if 'namespace' in texts[:2]:
+            name = ''.join(t for t in texts[texts.index('namespace') + 1:] if t not in ('=', 'inline'))
+            qualname = f"{prefix}::{name}" if prefix and name else (name or prefix)
+            namespaces.add(qualname)
+            return ['namespace', None, qualname]
+        if texts[0] == 'extern' and len(texts) == 2:
+            # extern "C" { ... } is transparent
+            return ['namespace', None, prefix]
+        if 'enum' in texts and '(' not in texts:
+            return ['block', None, prefix]
+
+        if _is_initializer_brace(tokens):
+            # Brace-initialized member in a constructor initializer list: x{1}
+            return ['init', None, prefix]
+
+        signature = function_signature(tokens)
+        if signature is not None:
+            parts, name_index, open_paren, close_paren = signature
+            return self._add_function(result, parts, parameter_names(tokens, open_paren, close_paren),
+                                      tokens[name_index][2], head, brace, enclosing, prefix)
+
+        class_head = _class_head(tokens)
+        if class_head is not None:
+            keyword, name, bases = class_head
+            qualname = f"{prefix}::{name}" if prefix else name
+            record = {
+                'name': name,
+                'qualname': qualname,
+                'kind': keyword,
+                'bases': bases,
+                'methods': [],
+                'line': next((t[2] for t in tokens if t[1] == keyword), head_line),
+                'end_line': head_line,
+                'parent': enclosing['qualname'] if enclosing else None
+            }
+            result.classes.append(record)
+            classes_by_name.setdefault(qualname, record)
+            classes_by_name.setdefault(name, record)
+            return ['class', record, qualname]
+
+        return ['block', None, prefix]
+
+    def _add_function(self, result, parts, args, line, head, brace, enclosing, prefix):
+        qualname = '::'.join(parts)
+        record = {
+            'name': parts[-1],
+            'qualname': f"{enclosing['qualname']}::{qualname}" if enclosing else
+                        (f"{prefix}::{qualname}" if prefix else qualname),
+            'parent': enclosing['qualname'] if enclosing else None,
+            'args': args,
+            'line': line,
+            'end_line': line,
+            'signature': _signature_text(head),
+            'body': brace + 1
+        }
+        if enclosing is not None and parts[-1] not in enclosing['methods']:
+            enclosing['methods'].append(parts[-1])
+        result.functions.append(record)
+        return ['function', record, record['qualname']]
+
+    def _member_declarations(self, cls, text):
+        """Record the methods declared (not defined) in a run of ';'-terminated class members"""
+        if '(' not in text:
+            return
+        for head in text.split(';'):
+            if '(' not in head:
+                continue
+            simple = _simple_function(head) if 'friend' not in head else None
+            if simple is not None:
+                name = simple[0][-1]
+            else:
+                tokens = _tokenize_clean(head, 0, len(head), 0)
+                signature = function_signature(tokens)
+                if signature is None or 'friend' in (t[1] for t in tokens):
+                    continue
+                name = signature[0][-1]
+            if name not in cls['methods']:
+                cls['methods'].append(name)
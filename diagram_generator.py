@@ -1,22 +1,129 @@
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import context_builder
+import instrumentation
+import mermaid_validator
+from code_parser import CodeParser
+from local_diagram import LocalDiagramEngine
+from result_cache import ResultCache
+from scheduler import INTERACTIVE, Scheduler
 load_dotenv()
 
+MODEL_NAME = 'gemini-2.5-pro'
+
+# Bump whenever a prompt template changes so stale cache entries are not reused
+PROMPT_VERSION = 3
+
+# Default per-call deadline (seconds) for a single Gemini request
+DEFAULT_TIMEOUT = 120
+
+# Shared, bounded pool so concurrent sessions cannot spawn unbounded threads
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gemini')
+
+# Files longer than this are summarized chunk by chunk (map) and then merged (reduce)
+MAX_SUMMARY_CHARS = 8000
+
+# Concurrent chunk summaries; a separate pool so nested map calls can't starve _executor
+CHUNK_CONCURRENCY = 4
+_chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix='gemini-chunk')
+
+# 'local': instant control-flow graph built from the AST, no LLM call
+# 'ai': Gemini draws the diagram from the structure context
+# 'refine': the local diagram is drawn first, then Gemini polishes it
+DIAGRAM_MODES = ('local', 'ai', 'refine')
+
+LANGUAGE_NAMES = {'py': 'Python', 'ipynb': 'Python (Jupyter)', 'cpp': 'C++'}
+
+class Degraded(str):
+    """Text shown in place of a result that couldn't be generated
+
+    A fallback diagram or an error notice. It reads like any other result,
+    and `reason` says what went wrong. Degraded results are never cached, so
+    callers should show them without keeping them and try again next time.
+    """
+
+    def __new__(cls, text, reason):
+        result = super().__new__(cls, text)
+        result.reason = reason
+        return result
+
+
+# One configured, scheduled client per model name, shared by every generator in the process
+_models = {}
+_models_lock = threading.Lock()
+
+
+def shared_model(model_name=MODEL_NAME):
+    """Process-wide Scheduler around the Gemini model client, configured on first use"""
+    with _models_lock:
+        if model_name not in _models:
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+            _models[model_name] = Scheduler(genai.GenerativeModel(model_name))
+        return _models[model_name]
+
 class DiagramGenerator:
     """Generate Mermaid diagrams and summaries using Gemini API"""
     
-    def __init__(self):
-        """Initialize Gemini API"""
-        api_key = os.getenv('GEMINI_API_KEY')
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+    def __init__(self, cache=None, model=None, priority=INTERACTIVE):
+        """Initialize Gemini API and the result cache
+        
+        Pass `model` (e.g. a stub_model.StubModel) to run without the Gemini API.
+        Otherwise calls go through the shared scheduler in the `priority` lane.
+        """
+        self.model_name = MODEL_NAME
+        if model is None:
+            model = shared_model(self.model_name).lane(priority)
+        else:
+            self.model_name = getattr(model, 'model_name', type(model).__name__)
+        self.model = model
+        self.cache = cache if cache is not None else ResultCache()
+        self.local_engine = LocalDiagramEngine()
     
-    def generate_mermaid_diagram(self, code_structure, file_type):
-        """Generate Mermaid diagram code based on code structure"""
+    def generate_mermaid_diagram(self, code_structure, file_type, use_cache=True, timeout=DEFAULT_TIMEOUT,
+                                 mode='ai', code_content=None, context=None):
+        """Generate Mermaid diagram code based on code structure
+        
+        mode is one of DIAGRAM_MODES; 'local' and 'refine' need code_content.
+        With use_cache=False the cached result is ignored and replaced by a fresh one.
+        Pass `context` (from build_context) to reuse an already built structure context.
+        """
+        if mode not in DIAGRAM_MODES:
+            raise ValueError(f"Unsupported diagram mode: {mode}")
+        
+        if mode == 'local':
+            return self._generate_fallback_diagram(code_structure, file_type, code_content)
         
         # Build context for Gemini
-        context = self._build_structure_context(code_structure, file_type)
+        if context is None:
+            with instrumentation.stage('context') as info:
+                context = self.build_context(code_structure, file_type, code_content)
+                info['tokens'] = context_builder.estimate_tokens(context)
+        
+        draft = None
+        if mode == 'refine' and code_content is not None:
+            try:
+                draft = self.generate_local_diagram(code_content, file_type)
+            except Exception as e:
+                # Gemini still gets the structure context, just without the draft to follow
+                print(f"Error generating local diagram: {e}")
+        if draft is not None:
+            context += (
+                "\n\nDraft control-flow diagram generated directly from the code (structurally accurate):\n"
+                f"{draft}\n\n"
+                "Keep the draft's structure, but rewrite its labels as short plain-English descriptions "
+                "and merge trivial steps where it improves readability."
+            )
+        
+        cache_key = self._cache_key('diagram', context, file_type)
+        if use_cache:
+            cached = self._cache_get(cache_key, 'diagram')
+            if cached is not None:
+                return cached
         
         prompt = f"""
 You are a code visualization expert. Given the following code structure, generate a Mermaid diagram.
@@ -44,89 +151,408 @@ flowchart TD
     E --> F
 """
         
-        try:
-            response = self.model.generate_content(prompt)
-            mermaid_code = response.text.strip()
-            
-            # Clean up the response (remove markdown if present)
-            mermaid_code = mermaid_code.replace('```mermaid', '').replace('```', '').strip()
+        with instrumentation.stage('gemini', kind='diagram') as info:
+            try:
+                response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+                instrumentation.record_usage(info, response)
+                mermaid_code = response.text.strip()
+                
+                # Clean up the response (remove markdown if present)
+                mermaid_code = mermaid_code.replace('```mermaid', '').replace('```', '').strip()
+            except Exception as e:
+                print(f"Error generating diagram with Gemini: {e}")
+                info['error'] = str(e)
+                mermaid_code = ''
             
             # Fallback if Gemini fails
             if not mermaid_code or len(mermaid_code) < 20:
-                return self._generate_fallback_diagram(code_structure, file_type)
+                info['fallback'] = 'error' if 'error' in info else 'empty_response'
+        
+        if 'fallback' in info:
+            return Degraded(self._generate_fallback_diagram(code_structure, file_type, code_content),
+                            info.get('error', 'empty response'))
+
+        # Repair common syntax mistakes locally instead of discarding the response
+        with instrumentation.stage('validate', kind='diagram') as info:
+            result = mermaid_validator.repair(mermaid_code)
+            info['fixes'] = len(result['fixes'])
+            if result['code'] is None:
+                print(f"Gemini returned an invalid diagram: {result['errors'][0]['message']}")
+                info['fallback'] = 'invalid_mermaid'
+
+        if 'fallback' in info:
+            return Degraded(self._generate_fallback_diagram(code_structure, file_type, code_content),
+                            f"invalid diagram: {result['errors'][0]['message']}")
+
+        mermaid_code = result['code']
+        self.cache.set(cache_key, mermaid_code)
+        return mermaid_code
+    
+    def generate_local_diagram(self, code_content, file_type, structure=None):
+        """Build a control-flow diagram locally from the source, without Gemini
+        
+        The metrics in `structure` (the parse result of code_content), when
+        given, annotate each function with its complexity.
+        """
+        with instrumentation.stage('local_diagram'):
+            return self.local_engine.build(code_content, file_type, structure.get('metrics') if structure else None)
+    
+    def generate_summary(self, code_content, file_type, use_cache=True, timeout=DEFAULT_TIMEOUT, structure=None):
+        """Generate AI-powered code summary
+        
+        With use_cache=False the cached result is ignored and replaced by a fresh one.
+        The metrics in `structure` (the parse result of code_content), when given,
+        are quoted in the prompt so the complexity assessment rests on measurements.
+        """
+        
+        # The metrics note is part of the prompt, so a summary written without it isn't reused with it
+        metrics = self._metrics_note(structure)
+        cache_key = self._cache_key('summary', code_content + metrics, file_type)
+        if use_cache:
+            cached = self._cache_get(cache_key, 'summary')
+            if cached is not None:
+                return cached
+        
+        with instrumentation.stage('gemini', kind='summary') as info:
+            try:
+                # Inside the try: a chunk that can't be summarized fails the whole summary
+                prompt = self._summary_prompt(code_content, file_type, metrics, use_cache, timeout)
+                response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+                instrumentation.record_usage(info, response)
+                summary = response.text.strip()
+            except Exception as e:
+                info['error'] = str(e)
+                return Degraded(f"⚠️ Could not generate summary: {str(e)}\n\nPlease check your API key or try again.",
+                                str(e))
+        
+        self.cache.set(cache_key, summary)
+        return summary
+    
+    def generate_change_summary(self, changes, file_type, use_cache=True, timeout=DEFAULT_TIMEOUT):
+        """Review-style summary of a structural diff (from structural_diff.compare)
+        
+        Only the list of changed definitions and the unified diff are sent, so
+        the prompt grows with the size of the change rather than the file.
+        """
+        if not changes['patch']:
+            return "The two versions are identical."
+        
+        prompt = self._build_change_prompt(changes, file_type)
+        cache_key = self._cache_key('change_summary', prompt, file_type)
+        if use_cache:
+            cached = self._cache_get(cache_key, 'change_summary')
+            if cached is not None:
+                return cached
+        
+        with instrumentation.stage('gemini', kind='change_summary') as info:
+            try:
+                response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+                instrumentation.record_usage(info, response)
+                summary = response.text.strip()
+            except Exception as e:
+                info['error'] = str(e)
+                return Degraded(f"⚠️ Could not generate change summary: {str(e)}\n\n"
+                                "Please check your API key or try again.", str(e))
+        
+        self.cache.set(cache_key, summary)
+        return summary
+    
+    def generate_summary_stream(self, code_content, file_type, use_cache=True, timeout=DEFAULT_TIMEOUT,
+                                structure=None):
+        """Yield the AI summary in text chunks as Gemini produces them
+        
+        The complete text is cached once the stream finishes, so a cached
+        summary is yielded as a single chunk.
+        """
+        
+        # The metrics note is part of the prompt, so a summary written without it isn't reused with it
+        metrics = self._metrics_note(structure)
+        cache_key = self._cache_key('summary', code_content + metrics, file_type)
+        if use_cache:
+            cached = self._cache_get(cache_key, 'summary')
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        
+        with instrumentation.stage('gemini', kind='summary', stream=True) as info:
+            start = time.perf_counter()
+            try:
+                prompt = self._summary_prompt(code_content, file_type, metrics, use_cache, timeout)
+                response = self.model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+                chunk = None
+                for chunk in response:
+                    if chunk.text:
+                        if not parts:
+                            info['first_chunk_seconds'] = round(time.perf_counter() - start, 6)
+                        parts.append(chunk.text)
+                        yield chunk.text
+                # The last chunk carries the usage of the whole response
+                instrumentation.record_usage(info, chunk)
             
-            return mermaid_code
+            except Exception as e:
+                info['error'] = str(e)
+                yield Degraded(f"\n\n⚠️ Could not generate summary: {str(e)}\n\nPlease check your API key or try again.",
+                               str(e))
+                return
         
-        except Exception as e:
-            print(f"Error generating diagram with Gemini: {e}")
-            return self._generate_fallback_diagram(code_structure, file_type)
+        summary = ''.join(parts).strip()
+        if summary:
+            self.cache.set(cache_key, summary)
     
-    def generate_summary(self, code_content, file_type):
-        """Generate AI-powered code summary"""
+    def generate_concurrently(self, code_structure, code_content, file_type, use_cache=True,
+                              diagram_timeout=DEFAULT_TIMEOUT, summary_timeout=DEFAULT_TIMEOUT,
+                              stream_summary=False, mode='ai', context=None):
+        """Run diagram and summary generation at the same time
         
-        lang_map = {'py': 'Python', 'ipynb': 'Python (Jupyter)', 'cpp': 'C++'}
-        language = lang_map.get(file_type, 'Unknown')
+        Yields ('diagram', mermaid_code) and ('summary', text) in completion order.
+        With stream_summary=True, ('summary_chunk', text) events are yielded as the
+        summary streams in, before the final ('summary', full_text). In 'refine'
+        mode the local diagram is yielded first as ('diagram_draft', mermaid_code).
+        A call that misses its deadline is cancelled and replaced by the fallback
+        diagram or a timeout notice, so a slow summary never holds back the diagram.
+        Results that failed like this, or whose call failed, are Degraded.
+        """
+        events = queue.Queue()
+        cancelled = threading.Event()
         
-        # Truncate code if too long (Gemini has token limits)
-        max_length = 8000
-        if len(code_content) > max_length:
-            code_content = code_content[:max_length] + "\n... (truncated)"
+        def run_diagram():
+            if mode == 'refine':
+                events.put(('diagram_draft', self._generate_fallback_diagram(code_structure, file_type, code_content)))
+            events.put(('diagram', self.generate_mermaid_diagram(code_structure, file_type, use_cache,
+                                                                  diagram_timeout, mode, code_content, context)))
         
-        prompt = f"""
-Analyze this {language} code and provide a comprehensive summary.
+        def run_summary():
+            if not stream_summary:
+                events.put(('summary', self.generate_summary(code_content, file_type, use_cache,
+                                                             summary_timeout, code_structure)))
+                return
+            parts = []
+            for chunk in self.generate_summary_stream(code_content, file_type, use_cache, summary_timeout,
+                                                      code_structure):
+                if cancelled.is_set():
+                    return
+                parts.append(chunk)
+                events.put(('summary_chunk', chunk))
+            summary = ''.join(parts).strip()
+            failed = [chunk for chunk in parts if isinstance(chunk, Degraded)]
+            events.put(('summary', Degraded(summary, failed[0].reason) if failed else summary))
+        
+        start = time.monotonic()
+        deadlines = {'diagram': start + diagram_timeout, 'summary': start + summary_timeout}
+        futures = [_executor.submit(instrumentation.propagate(run_diagram)),
+                   _executor.submit(instrumentation.propagate(run_summary))]
+        pending = set(deadlines)
+        streamed = []
+        
+        try:
+            while pending:
+                next_deadline = min(deadlines[k] for k in pending)
+                try:
+                    kind, result = events.get(timeout=max(0, next_deadline - time.monotonic()))
+                except queue.Empty:
+                    # Give up on anything past its deadline
+                    now = time.monotonic()
+                    for kind in [k for k in pending if deadlines[k] <= now]:
+                        pending.discard(kind)
+                        instrumentation.event('fallback', kind=kind, reason='timeout')
+                        if kind == 'diagram':
+                            yield kind, Degraded(self._generate_fallback_diagram(code_structure, file_type,
+                                                                                 code_content), 'timed out')
+                        else:
+                            partial = ''.join(streamed)
+                            yield kind, Degraded(partial + "\n\n⚠️ Summary generation timed out.\n\nPlease try again.",
+                                                 'timed out')
+                    continue
+                
+                if kind == 'summary_chunk':
+                    if 'summary' in pending:
+                        streamed.append(result)
+                        yield kind, result
+                elif kind == 'diagram_draft':
+                    if 'diagram' in pending:
+                        yield kind, result
+                elif kind in pending:
+                    pending.discard(kind)
+                    yield kind, result
+        finally:
+            # Timed out or consumer stopped early (e.g. Streamlit rerun): drop remaining work
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+    
+    def _cache_get(self, cache_key, kind):
+        """Look up a cached result, recording the lookup as a 'cache' stage"""
+        with instrumentation.stage('cache', kind=kind) as info:
+            cached = self.cache.get(cache_key)
+            info['cache'] = 'miss' if cached is None else 'hit'
+        return cached
+    
+    def _cache_key(self, kind, content, file_type):
+        """Key a result by its prompt inputs, model and prompt version"""
+        return ResultCache.make_key(kind, content, file_type, self.model_name, PROMPT_VERSION)
+    
+    def _summary_prompt(self, code_content, file_type, metrics='', use_cache=True, timeout=DEFAULT_TIMEOUT):
+        """Return the prompt for the final summary, running the map stage for large files"""
+        if len(code_content) <= MAX_SUMMARY_CHARS:
+            return self._build_summary_prompt(code_content, file_type, metrics)
+        
+        chunks = CodeParser().split_chunks(code_content, file_type)
+        partials = self._summarize_chunks(chunks, file_type, use_cache, timeout)
+        return self._build_reduce_prompt(chunks, partials, file_type, metrics)
+    
+    def _metrics_note(self, structure):
+        """One line of measured complexity for the summary prompt, or '' without metrics"""
+        if not structure or not structure.get('metrics'):
+            return ''
+        stats = CodeParser().get_code_complexity(structure)
+        hotspots = ', '.join(f"{name} ({complexity})" for name, complexity in stats['hotspots'] if complexity > 1)
+        return (f"\nMeasured metrics: {len(structure['metrics'])} functions, cyclomatic complexity "
+                f"{stats['avg_complexity']} average and {stats['max_complexity']} max, deepest nesting "
+                f"{stats['max_depth']}" + (f"; most complex: {hotspots}" if hotspots else "") + "\n")
+    
+    def _summarize_chunks(self, chunks, file_type, use_cache=True, timeout=DEFAULT_TIMEOUT):
+        """Map stage: summarize each chunk in parallel, reusing cached chunk summaries
+
+        Raises if any chunk fails; the partials that did succeed stay cached.
+        """
+        language = LANGUAGE_NAMES.get(file_type, 'Unknown')
+        
+        def summarize(chunk):
+            cache_key = self._cache_key('chunk', chunk['source'], file_type)
+            if use_cache:
+                cached = self._cache_get(cache_key, 'chunk')
+                if cached is not None:
+                    return cached
+            
+            prompt = f"""
+Summarize this part of a larger {language} file ({chunk['name']}) in 2-4 sentences.
+Cover what it defines, its key logic, and any notable issues. No emoji, formal tone.
 
-Code:
 ```
-{code_content}
+{chunk['source']}
 ```
+"""
+            with instrumentation.stage('gemini', kind='chunk') as info:
+                try:
+                    response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+                    instrumentation.record_usage(info, response)
+                    partial = response.text.strip()
+                except Exception as e:
+                    print(f"Error summarizing chunk {chunk['name']}: {e}")
+                    info['error'] = str(e)
+                    # A merged summary missing a part must not be cached under the whole file's key
+                    raise RuntimeError(f"part {chunk['name']} could not be summarized: {e}") from e
+            self.cache.set(cache_key, partial)
+            return partial
+        
+        return list(_chunk_executor.map(instrumentation.propagate(summarize), chunks))
+    
+    def _build_reduce_prompt(self, chunks, partials, file_type, metrics=''):
+        """Reduce stage: merge the partial summaries into one summary prompt"""
+        language = LANGUAGE_NAMES.get(file_type, 'Unknown')
+        sections = "\n\n".join(
+            f"[{chunk['name']} (line {chunk['line']})]\n{partial}"
+            for chunk, partial in zip(chunks, partials)
+        )
+        
+        return f"""
+The following are summaries of consecutive parts of one large {language} file, in order.
+Combine them into a comprehensive summary of the whole file.
 
+Part summaries:
+{sections}
+{metrics}
 Provide:
 1. **Purpose**: What does this code do? (2-3 sentences)
 2. **Key Components**: Main functions, classes, or modules
 3. **Logic Flow**: How does the code work?
-4. **Complexity**: Is it simple, moderate, or complex?
+4. **Complexity**: Is it simple, moderate, or complex? Base this on the measured metrics when given
 5. **Potential Issues**: Any code smells or improvements?
 
 Note: There should not be any emoji in the output. keep it formal. also try to keep it small and concise, just enough to explain things. Use only markdown formatting
 """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        
-        except Exception as e:
-            return f"⚠️ Could not generate summary: {str(e)}\n\nPlease check your API key or try again."
     
-    def _build_structure_context(self, structure, file_type):
-        """Build a text description of code structure"""
-        context_parts = []
-        
-        # Functions
-        if structure.get('functions'):
-            func_names = [f['name'] for f in structure['functions']]
-            context_parts.append(f"Functions: {', '.join(func_names)}")
+    def _build_summary_prompt(self, code_content, file_type, metrics=''):
+        """Build the summary prompt for a piece of code"""
         
-        # Classes
-        if structure.get('classes'):
-            for cls in structure['classes']:
-                methods = ', '.join(cls.get('methods', []))
-                context_parts.append(f"Class {cls['name']} with methods: {methods}")
+        language = LANGUAGE_NAMES.get(file_type, 'Unknown')
         
-        # Imports/Includes
-        imports = structure.get('imports', []) + structure.get('includes', [])
-        if imports:
-            context_parts.append(f"Dependencies: {', '.join(imports[:5])}")  # Limit to 5
+        return f"""
+Analyze this {language} code and provide a comprehensive summary.
+
+Code:
+```
+{code_content}
+```
+{metrics}
+Provide:
+1. **Purpose**: What does this code do? (2-3 sentences)
+2. **Key Components**: Main functions, classes, or modules
+3. **Logic Flow**: How does the code work?
+4. **Complexity**: Is it simple, moderate, or complex? Base this on the measured metrics when given
+5. **Potential Issues**: Any code smells or improvements?
+
+Note: There should not be any emoji in the output. keep it formal. also try to keep it small and concise, just enough to explain things. Use only markdown formatting
+"""
+    
+    def _build_change_prompt(self, changes, file_type):
+        """Build the prompt describing only what changed between two versions"""
+        language = LANGUAGE_NAMES.get(file_type, 'Unknown')
+        lines = []
+        for kind in ('functions', 'classes'):
+            for status in ('added', 'removed', 'changed'):
+                if changes[kind][status]:
+                    lines.append(f"{status.capitalize()} {kind}: {', '.join(changes[kind][status])}")
+        for status in ('added', 'removed'):
+            if changes['imports'][status]:
+                lines.append(f"{status.capitalize()} dependencies: {', '.join(changes['imports'][status])}")
+        flow = changes['control_flow']
+        if flow['before'] != flow['after']:
+            counts = ', '.join(f"{t} {flow['before'].get(t, 0)} -> {flow['after'].get(t, 0)}"
+                               for t in sorted(set(flow['before']) | set(flow['after'])))
+            lines.append(f"Control structures: {counts}")
+        structural = "\n".join(lines) or "No structural changes (formatting, comments or literals only)"
         
-        # Control flow
-        if structure.get('control_flow'):
-            flow_types = [cf['type'] for cf in structure['control_flow']]
-            context_parts.append(f"Control structures: {', '.join(set(flow_types))}")
+        return f"""
+Review this change to a {language} file.
+
+Structural changes:
+{structural}
+
+Unified diff:
+```diff
+{changes['patch']}
+```
+
+Provide:
+1. **What Changed**: The behavior change in 2-3 sentences
+2. **Affected Components**: Functions and classes whose behavior changed, and how
+3. **Risks**: Possible regressions or edge cases the change introduces
+
+Note: There should not be any emoji in the output. keep it formal. also try to keep it small and concise, just enough to explain things. Use only markdown formatting
+"""
+    
+    def build_context(self, structure, file_type, code_content=None, budget=context_builder.CONTEXT_TOKEN_BUDGET):
+        """Build a ranked text description of code structure within about `budget` tokens
         
-        return "\n".join(context_parts) if context_parts else "Empty or simple code structure"
+        With code_content, functions called more often within the file rank higher.
+        """
+        return context_builder.build_context(structure, code_content, budget)
     
-    def _generate_fallback_diagram(self, structure, file_type):
+    def _generate_fallback_diagram(self, structure, file_type, code_content=None):
         """Generate a basic Mermaid diagram without Gemini (fallback)"""
         
+        # Prefer the local control-flow graph when the source is available
+        error = None
+        if code_content is not None:
+            try:
+                return self.generate_local_diagram(code_content, file_type, structure)
+            except Exception as e:
+                print(f"Error generating local diagram: {e}")
+                error = f"local diagram failed: {e}"
+        
         mermaid_lines = ["flowchart TD"]
         mermaid_lines.append("    Start([Start]) --> Main")
         
@@ -158,4 +584,5 @@ Note: There should not be any emoji in the output. keep it formal. also try to k
         
         mermaid_lines.append("    Main --> End([End])")
         
-        return "\n".join(mermaid_lines)
\ No newline at end of file
+        diagram = "\n".join(mermaid_lines)
+        return Degraded(diagram, error) if error else diagram
\ No newline at end of file
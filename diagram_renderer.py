@@ -0,0 +1,152 @@
+import base64
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import instrumentation
+from result_cache import ResultCache
+
+# mermaid-cli command line, e.g. "npx -y @mermaid-js/mermaid-cli" when mmdc isn't installed globally
+MMDC = os.getenv('CODETODIAGRAM_MMDC', 'mmdc')
+
+# Puppeteer config passed to mmdc with -p (e.g. {"args": ["--no-sandbox"]} when running as root)
+PUPPETEER_CONFIG = os.getenv('CODETODIAGRAM_PUPPETEER_CONFIG')
+
+# Seconds before a single render is abandoned
+RENDER_TIMEOUT = float(os.getenv('CODETODIAGRAM_RENDER_TIMEOUT', '60'))
+
+# Seconds a failed render is remembered, so reruns don't wait on mermaid-cli again
+ERROR_TTL = float(os.getenv('CODETODIAGRAM_RENDER_ERROR_TTL', '300'))
+
+# Each render starts a headless browser, so only a few run at once
+RENDER_CONCURRENCY = 2
+
+# Kept apart from the Gemini result cache so large images don't evict generated diagrams
+DEFAULT_RENDER_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'codetodiagram-renders')
+
+FORMATS = ('svg', 'png')
+MIME_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+# Bump whenever the render options change so cached images are not reused
+RENDER_VERSION = 1
+
+
+class DiagramRenderer:
+    """Render Mermaid to SVG or PNG with mermaid-cli, caching the images by diagram hash"""
+
+    def __init__(self, cache=None, command=MMDC, timeout=RENDER_TIMEOUT, theme='default'):
+        self.command = shlex.split(command)
+        self.timeout = timeout
+        self.theme = theme
+        if cache is None:
+            cache_dir = os.getenv('CODETODIAGRAM_RENDER_CACHE_DIR', DEFAULT_RENDER_CACHE_DIR)
+            cache = ResultCache(cache_dir=cache_dir, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 3600)
+        self.cache = cache
+        self._slots = threading.BoundedSemaphore(RENDER_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @property
+    def available(self):
+        """Whether the mermaid-cli command can be found"""
+        return bool(self.command) and shutil.which(self.command[0]) is not None
+
+    def render(self, diagram_code, fmt='svg', use_cache=True):
+        """Render diagram_code to fmt ('svg' or 'png')
+
+        Returns {'format', 'data', 'cache'} with the SVG text or PNG bytes, or
+        {'error': message} if mermaid-cli is missing or rejects the diagram.
+        Concurrent requests for the same image render it once, and a failure
+        is cached for ERROR_TTL seconds under the same key.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported image format: {fmt}")
+
+        key = ResultCache.make_key('render', RENDER_VERSION, fmt, self.theme, diagram_code)
+        with instrumentation.stage('render_image', kind=fmt) as info:
+            with self._key_lock(key):
+                value = self.cache.get(key) if use_cache else None
+                if isinstance(value, dict) and time.time() >= value['until']:
+                    value = None
+                info['cache'] = 'hit' if value is not None else 'miss'
+                if value is None:
+                    result = self._run(diagram_code, fmt)
+                    if 'error' in result:
+                        value = {'error': result['error'], 'until': time.time() + ERROR_TTL}
+                    else:
+                        value = result['data']
+                    self.cache.set(key, value)
+                if isinstance(value, dict):
+                    info['error'] = value['error']
+                    return {'error': value['error']}
+
+        data = base64.b64decode(value) if fmt == 'png' else value
+        return {'format': fmt, 'data': data, 'cache': info['cache']}
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = _KeyLock(self, key)
+            lock.users += 1
+            return lock
+
+    def _run(self, diagram_code, fmt):
+        """Run mermaid-cli once; PNG data is returned base64-encoded so it can be cached as JSON"""
+        if not self.available:
+            return {'error': f"mermaid-cli not found ({self.command[0] if self.command else 'no command'})"}
+
+        with self._slots, tempfile.TemporaryDirectory(prefix='codetodiagram-render-') as tmp:
+            source = os.path.join(tmp, 'diagram.mmd')
+            output = os.path.join(tmp, f'diagram.{fmt}')
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write(diagram_code)
+
+            cmd = self.command + ['-i', source, '-o', output, '-t', self.theme, '-q',
+                                  '-b', 'white' if fmt == 'png' else 'transparent']
+            if fmt == 'png':
+                # Twice the CSS pixel size, so exported images stay sharp when zoomed
+                cmd += ['-s', '2']
+            if PUPPETEER_CONFIG:
+                cmd += ['-p', PUPPETEER_CONFIG]
+            try:
+                proc = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                return {'error': f"Rendering timed out after {self.timeout:g}s"}
+            except OSError as e:
+                return {'error': f"Could not run mermaid-cli: {e}"}
+
+            if proc.returncode != 0 or not os.path.exists(output):
+                message = (proc.stderr or proc.stdout).strip().splitlines()
+                return {'error': message[-1] if message else f"mermaid-cli exited with status {proc.returncode}"}
+
+            if fmt == 'png':
+                with open(output, 'rb') as f:
+                    return {'data': base64.b64encode(f.read()).decode('ascii')}
+            with open(output, 'r', encoding='utf-8') as f:
+                return {'data': f.read()}
+
+
+class _KeyLock:
+    """Lock for one image key, dropped from the renderer once nobody holds or waits for it"""
+
+    def __init__(self, renderer, key):
+        self.renderer = renderer
+        self.key = key
+        self.users = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        with self.renderer._lock:
+            self.users -= 1
+            if not self.users:
+                self.renderer._key_locks.pop(self.key, None)
@@ -0,0 +1,319 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# JSON-lines request log: a file path, '-' for stderr, unset to disable
+LOG_FILE = os.getenv('CODETODIAGRAM_LOG_FILE')
+
+# Prometheus text file, rewritten after every request (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.getenv('CODETODIAGRAM_METRICS_FILE')
+
+# Serve /metrics on this port when set
+METRICS_PORT = int(os.getenv('CODETODIAGRAM_METRICS_PORT', '0'))
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PREFIX = 'codetodiagram_'
+
+_current = ContextVar('codetodiagram_trace', default=None)
+
+
+class Metrics:
+    """Process-wide counters, gauges and stage latency histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(b), s, c)) for key, (b, s, c) in self._histograms.items())
+
+        lines = []
+        for kind, series in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({key[0] for key, _ in series}):
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for (series_name, labels), value in series:
+                    if series_name == name:
+                        lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+        for name in sorted({key[0] for key, _ in histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (series_name, labels), (buckets, total, count) in histograms:
+                if series_name != name:
+                    continue
+                for bound, n in zip(BUCKETS, buckets):
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {n}")
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total:g}")
+                lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Stage records of one request, in completion order"""
+
+    def __init__(self, name, **fields):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.fields = fields
+        self.started = time.time()
+        self.seconds = None
+        self.stages = []
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.stages.append(record)
+
+    def totals(self):
+        """Sum seconds and tokens per stage (and kind, e.g. 'gemini:summary')"""
+        totals = {}
+        with self._lock:
+            for record in self.stages:
+                key = f"{record['stage']}:{record['kind']}" if 'kind' in record else record['stage']
+                entry = totals.setdefault(key, {'calls': 0, 'seconds': 0.0,
+                                                'prompt_tokens': 0, 'response_tokens': 0})
+                entry['calls'] += 1
+                entry['seconds'] += record['seconds']
+                entry['prompt_tokens'] += record.get('prompt_tokens', 0)
+                entry['response_tokens'] += record.get('response_tokens', 0)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'trace': self.id,
+                'request': self.name,
+                **self.fields,
+                'started': round(self.started, 3),
+                'seconds': self.seconds,
+                'stages': list(self.stages),
+                'events': list(self.events)
+            }
+
+
+def current_trace():
+    """The Trace of the request running in this context, or None"""
+    return _current.get()
+
+
+@contextmanager
+def request(name, **fields):
+    """Trace one request; on exit it is logged and the metrics file is refreshed"""
+    trace = Trace(name, **fields)
+    token = _current.set(trace)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield trace
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        _current.reset(token)
+        trace.seconds = round(time.perf_counter() - start, 6)
+        metrics.inc('requests_total', request=name, status=status)
+        metrics.observe('request_seconds', trace.seconds, request=name)
+        _log(trace.to_dict())
+        write_metrics_file()
+
+
+@contextmanager
+def stage(name, **fields):
+    """Time a pipeline stage
+
+    The yielded dict is recorded with the stage, so the block can add fields
+    such as cache='hit', fallback='error' or token counts (see record_usage).
+    Setting 'error' marks the stage as failed even if nothing was raised.
+    """
+    info = dict(fields)
+    start = time.perf_counter()
+    status = None
+    try:
+        yield info
+    except GeneratorExit:
+        # A streaming consumer stopped early
+        status = 'cancelled'
+        raise
+    except Exception as e:
+        status = 'error'
+        info.setdefault('error', f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if status is None:
+            status = 'error' if info.get('error') else 'ok'
+        record(name, time.perf_counter() - start, status, **info)
+
+
+def record(name, seconds, status='ok', **fields):
+    """Record a stage timed elsewhere (e.g. in a worker process)
+
+    A 'kind' field (e.g. which Gemini call) is added to the metric labels.
+    """
+    labels = {'stage': name}
+    if 'kind' in fields:
+        labels['kind'] = fields['kind']
+    metrics.observe('stage_seconds', seconds, **labels)
+    metrics.inc('stage_total', status=status, **labels)
+    if 'cache' in fields:
+        metrics.inc('cache_total', result=fields['cache'], **labels)
+    if fields.get('fallback'):
+        metrics.inc('fallbacks_total', reason=fields['fallback'], **labels)
+    if fields.get('retries'):
+        metrics.inc('retries_total', fields['retries'], **labels)
+    for direction in ('prompt', 'response'):
+        if fields.get(f'{direction}_tokens'):
+            metrics.inc('tokens_total', fields[f'{direction}_tokens'], direction=direction, **labels)
+
+    trace = _current.get()
+    if trace is not None:
+        trace.add({'stage': name, 'seconds': round(seconds, 6), 'status': status, **fields})
+
+
+def event(name, **fields):
+    """Count something that has no duration of its own, such as a deadline fallback
+
+    The fields are also metric labels, so keep their values few.
+    """
+    metrics.inc('events_total', event=name, **fields)
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.events.append({'event': name, 'at': round(time.time() - trace.started, 6), **fields})
+
+
+def record_usage(info, response):
+    """Copy Gemini token counts from response.usage_metadata into a stage's info
+
+    For a stream, pass the last chunk: its usage covers the whole response.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    info['prompt_tokens'] = getattr(usage, 'prompt_token_count', 0) or 0
+    info['response_tokens'] = getattr(usage, 'candidates_token_count', 0) or 0
+
+
+def propagate(func):
+    """Wrap func so it runs under the caller's trace when called from a worker thread"""
+    trace = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+_log_lock = threading.Lock()
+
+
+def _log(entry):
+    if not LOG_FILE:
+        return
+    line = json.dumps(entry, default=str)
+    with _log_lock:
+        try:
+            if LOG_FILE == '-':
+                print(line, file=sys.stderr)
+            else:
+                with open(LOG_FILE, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            print(f"Error writing request log: {e}")
+
+
+def write_metrics_file(path=None):
+    """Atomically rewrite the Prometheus text file, if one is configured"""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(metrics.render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing metrics file: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(port=METRICS_PORT):
+    """Serve /metrics from a background thread (once per process); returns the server or None"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics server on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return _server
@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from code_parser import CodeParser
+
+DEFAULT_WORKERS = int(os.getenv('CODETODIAGRAM_PARSE_WORKERS', '2'))
+DEFAULT_TIMEOUT = float(os.getenv('CODETODIAGRAM_PARSE_TIMEOUT', '20'))
+DEFAULT_MAX_RSS = int(os.getenv('CODETODIAGRAM_PARSE_MAX_RSS_MB', '1024')) * 1024 * 1024
+POLL_INTERVAL = 0.02
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss(pid):
+    """Resident set size of a process in bytes, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _worker_main(conn, max_rss, rlimit):
+    """Serve parse jobs from conn until it is closed"""
+    if rlimit and resource is not None and max_rss:
+        # Without /proc the parent can't watch RSS; cap the address space instead
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (max_rss, max_rss))
+        except (ValueError, OSError):
+            pass
+
+    parser = CodeParser()
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except EOFError:
+            return
+        try:
+            if kind == 'cells':
+                result = parser.parse_cells(payload)
+            elif kind == 'sources':
+                result = [parser._parse_cell(source) for source in payload]
+            else:
+                content, file_type = payload
+                result = parser.parse_file(content, file_type)
+            conn.send(('ok', result))
+        except MemoryError:
+            conn.send(('memory', None))
+            return
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, max_rss):
+        self.conn, child_conn = context.Pipe()
+        rlimit = _rss(os.getpid()) is None
+        self.process = context.Process(target=_worker_main, args=(child_conn, max_rss, rlimit), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class IsolatedParser:
+    """Run CodeParser in a warm pool of worker processes with time and memory limits
+
+    Each job gets a wall-clock deadline and an RSS cap. A worker that
+    exceeds either is killed and replaced, and the job comes back as a
+    structure with an 'error' (and 'limit') key, like any other failed
+    parse, so one pathological upload can't hold up other sessions. A job
+    that finds no idle worker within its deadline fails with limit 'busy'.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, max_rss=DEFAULT_MAX_RSS,
+                 mp_context='spawn'):
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.stats = {'jobs': 0, 'timeouts': 0, 'memory_kills': 0, 'crashes': 0, 'busy': 0}
+        self._context = multiprocessing.get_context(mp_context)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._idle.put(_Worker(self._context, max_rss))
+
+    def parse_file(self, content, file_type, timeout=None):
+        """CodeParser.parse_file in a worker process"""
+        return self._run(('file', (content, file_type)), timeout)
+
+    def parse_cells(self, cells, timeout=None, parser=None):
+        """CodeParser.parse_cells in a worker process
+
+        Given a CodeParser, only the cells missing from its cell cache are
+        parsed in the worker; their results go into the cache and the
+        structure is assembled by that parser, so edited notebooks still
+        re-parse only the edited cells.
+        """
+        cells = list(cells)
+        if parser is None:
+            return self._run(('cells', cells), timeout)
+        missing = list(dict.fromkeys(cell.source for cell in cells if cell.source not in parser.cell_cache))
+        if missing:
+            parsed = self._run(('sources', missing), timeout)
+            if isinstance(parsed, dict):
+                # Stopped at a limit or failed: the failure structure
+                return parsed
+            parsed = dict(zip(missing, parsed))
+            for source in missing:
+                parser.cell_cache.get(source, parsed.__getitem__)
+        return parser.parse_cells(cells)
+
+    def close(self):
+        """Stop all workers"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+    def _run(self, job, timeout):
+        if self._closed:
+            raise RuntimeError("IsolatedParser is closed")
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats['busy'] += 1
+            return self._failure(f"No parser process was free within {timeout:g}s", limit='busy')
+        with self._lock:
+            self.stats['jobs'] += 1
+        try:
+            worker.conn.send(job)
+            status, result = self._wait(worker, timeout)
+        except (BrokenPipeError, EOFError, OSError):
+            status, result = 'crashed', None
+
+        if status == 'ok':
+            self._idle.put(worker)
+            return result
+        if status == 'error':
+            # The parser raised; the worker itself is fine
+            self._idle.put(worker)
+            return self._failure(f"Parser error: {result}")
+
+        worker.kill()
+        self._idle.put(_Worker(self._context, self.max_rss))
+        key, message = {
+            'timeout': ('timeouts', f"Parsing took longer than {timeout:g}s and was stopped"),
+            'memory': ('memory_kills', f"Parsing used more than {self.max_rss // (1024 * 1024)} MB and was stopped"),
+            'crashed': ('crashes', "The parser process crashed")
+        }[status]
+        with self._lock:
+            self.stats[key] += 1
+        return self._failure(message, limit=status)
+
+    def _wait(self, worker, timeout):
+        """Wait for the reply, enforcing the deadline and RSS cap; return (status, result)"""
+        deadline = time.monotonic() + timeout
+        pid = worker.process.pid
+        while not worker.conn.poll(POLL_INTERVAL):
+            if not worker.process.is_alive():
+                return 'crashed', None
+            if time.monotonic() > deadline:
+                return 'timeout', None
+            rss = _rss(pid)
+            if rss is not None and rss > self.max_rss:
+                return 'memory', None
+        return worker.conn.recv()
+
+    def _failure(self, message, limit=None):
+        structure = {
+            'error': message,
+            'functions': [],
+            'classes': [],
+            'methods': [],
+            'imports': [],
+            'control_flow': [],
+            'metrics': []
+        }
+        if limit:
+            structure['limit'] = limit
+        return structure
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_parser():
+    """Process-wide IsolatedParser, or None when CODETODIAGRAM_PARSE_WORKERS is 0"""
+    global _shared
+    if DEFAULT_WORKERS <= 0:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = IsolatedParser()
+        return _shared
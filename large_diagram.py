@@ -0,0 +1,219 @@
+import os
+from collections import deque
+
+import mermaid_validator
+
+# Diagrams with more nodes than this are drawn with groups collapsed
+NODE_BUDGET = int(os.getenv('CODETODIAGRAM_NODE_BUDGET', '120'))
+
+# Show part of a group only if at least this many of its nodes fit in the budget
+MIN_PARTIAL = 8
+
+COLLAPSED_STYLE = "classDef collapsed fill:#EEF2FF,stroke:#6366F1,stroke-dasharray:4 3"
+
+
+def _label(text):
+    return '"' + text.replace('"', '#quot;') + '"'
+
+
+def _owner(title):
+    """Class or namespace of a function subgraph such as 'def Service.run(self)'; '' at module level"""
+    words = title.split('(')[0].split()
+    name = words[-1] if words else ''
+    for sep in ('::', '.'):
+        if sep in name:
+            return name.rsplit(sep, 1)[0]
+    return ''
+
+
+def _reach_order(nodes, links):
+    """Nodes in breadth-first order from the group's entry points, so a prefix stays connected"""
+    members = set(nodes)
+    successors = {node: [] for node in nodes}
+    has_pred = set()
+    for src, _, dst in links:
+        if src in members and dst in members and src != dst:
+            successors[src].append(dst)
+            has_pred.add(dst)
+    order = []
+    seen = set()
+    for root in [n for n in nodes if n not in has_pred] + nodes:
+        if root in seen:
+            continue
+        seen.add(root)
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for nxt in successors[node]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(nxt)
+    return order
+
+
+def collapse(code, budget=NODE_BUDGET, expanded=()):
+    """Fit a large flowchart into about `budget` nodes
+
+    Top-level subgraphs (one per function in local diagrams) are grouped into
+    clusters by class or namespace. Clusters, then subgraphs, are drawn as
+    single summary nodes until the rest fits; a subgraph that only partly
+    fits shows its first nodes and one "+N more" node. Edges into collapsed
+    groups are merged, with a count. Keys from 'groups' passed in `expanded`
+    are always drawn in full.
+
+    Returns {'code', 'nodes', 'visible', 'groups'}; 'groups' is empty when the
+    diagram already fits and is returned unchanged.
+    """
+    graph = mermaid_validator.parse(code)
+    nodes = graph['nodes']
+    if len(nodes) <= budget:
+        return {'code': code, 'nodes': len(nodes), 'visible': len(nodes), 'groups': []}
+
+    subgraphs = graph['subgraphs']
+
+    def top(sid):
+        while sid is not None and subgraphs[sid]['parent'] is not None:
+            sid = subgraphs[sid]['parent']
+        return sid
+
+    # cluster key -> unit keys, unit key -> (subgraph id or None, [nodes])
+    clusters = {}
+    units = {}
+    for node in nodes:
+        sid = top(graph['parents'].get(node))
+        unit = f"unit:{sid or ''}"
+        if unit not in units:
+            owner = _owner(subgraphs[sid]['title']) if sid else ''
+            units[unit] = (sid, [])
+            clusters.setdefault(f"cluster:{owner}", []).append(unit)
+        units[unit][1].append(node)
+
+    expanded = set(expanded)
+    for key, members in clusters.items():
+        if expanded.intersection(members):
+            expanded.add(key)
+
+    def by_choice(keys):
+        return sorted(keys, key=lambda k: k not in expanded)
+
+    open_clusters = set()
+    visible = len(clusters)
+    for key in by_choice(clusters):
+        cost = len(clusters[key]) - 1
+        if key in expanded or len(clusters) == 1 or visible + cost <= budget:
+            open_clusters.add(key)
+            visible += cost
+
+    open_units = set()
+    partial = {}
+    candidates = [u for key in clusters if key in open_clusters for u in clusters[key]]
+    for unit in by_choice(candidates):
+        cost = len(units[unit][1]) - 1
+        if unit in expanded or visible + cost <= budget:
+            open_units.add(unit)
+            visible += cost
+        elif not partial and budget - visible >= MIN_PARTIAL:
+            shown = _reach_order(units[unit][1], graph['links'])[:budget - visible]
+            partial[unit] = set(shown)
+            visible += len(shown)
+
+    # Where each node is drawn: itself, or the summary node standing in for it
+    cluster_ids = {key: f"cluster_{i}" for i, key in enumerate(clusters)}
+    unit_ids = {key: f"group_{i}" for i, key in enumerate(units)}
+    rep = {}
+    for key, members in clusters.items():
+        for unit in members:
+            for node in units[unit][1]:
+                if key not in open_clusters:
+                    rep[node] = cluster_ids[key]
+                elif unit in open_units or node in partial.get(unit, ()):
+                    rep[node] = node
+                elif unit in partial:
+                    rep[node] = f"more_{unit_ids[unit]}"
+                else:
+                    rep[node] = unit_ids[unit]
+
+    children = {}
+    for sid, info in subgraphs.items():
+        children.setdefault(info['parent'], []).append(sid)
+    placed = {}
+    for node in nodes:
+        placed.setdefault(graph['parents'].get(node), []).append(node)
+
+    lines = [graph['header']]
+    summaries = []
+
+    def unit_title(unit):
+        sid = units[unit][0]
+        return subgraphs[sid]['title'] if sid else "top level"
+
+    def emit_subgraph(sid, shown, indent):
+        title = subgraphs[sid]['title']
+        lines.append(f"{indent}subgraph {sid}" + (f"[{_label(title)}]" if title != sid else ""))
+        for node in placed.get(sid, []):
+            if node in shown:
+                lines.append(f"{indent}    {nodes[node]}")
+        for child in children.get(sid, []):
+            emit_subgraph(child, shown, indent + "    ")
+        lines.append(f"{indent}end")
+
+    for key, members in clusters.items():
+        owner = key.split(':', 1)[1] or "module level"
+        size = sum(len(units[u][1]) for u in members)
+        if key not in open_clusters:
+            lines.append(f"    {cluster_ids[key]}[[{_label(f'{owner}: {len(members)} groups, {size} nodes')}]]")
+            summaries.append(cluster_ids[key])
+            continue
+        indent = "    "
+        if len(clusters) > 1:
+            lines.append(f"    subgraph {cluster_ids[key]}[{_label(owner)}]")
+            indent = "        "
+        for unit in members:
+            sid, unit_nodes = units[unit]
+            if unit not in open_units and unit not in partial:
+                lines.append(f"{indent}{unit_ids[unit]}[[{_label(f'{unit_title(unit)}: {len(unit_nodes)} nodes')}]]")
+                summaries.append(unit_ids[unit])
+                continue
+            shown = partial.get(unit, set(unit_nodes))
+            if sid is None:
+                lines.extend(f"{indent}{nodes[node]}" for node in unit_nodes if node in shown)
+            else:
+                emit_subgraph(sid, shown, indent)
+            if unit in partial:
+                hidden = len(unit_nodes) - len(shown)
+                lines.append(f"{indent}more_{unit_ids[unit]}[[{_label(f'+{hidden} more nodes')}]]")
+                summaries.append(f"more_{unit_ids[unit]}")
+        if len(clusters) > 1:
+            lines.append("    end")
+
+    # Merge the edges that now run between the same pair of drawn nodes
+    merged = {}
+    for src, link, dst in graph['links']:
+        a, b = rep[src], rep[dst]
+        if a == b and a != src:
+            continue
+        entry = merged.setdefault((a, b), [link, 0, a != src or b != dst])
+        entry[1] += 1
+    for (a, b), (link, count, summarized) in merged.items():
+        if summarized and count > 1 and '|' not in link and ' ' not in link:
+            link = f"{link}|{count} links|"
+        lines.append(f"    {a} {link} {b}")
+
+    for ids, line in graph['extras']:
+        if all(rep.get(i) == i for i in ids):
+            lines.append(f"    {line}")
+    if summaries:
+        lines.append(f"    {COLLAPSED_STYLE}")
+        lines.append(f"    class {','.join(summaries)} collapsed")
+
+    groups = []
+    for key, members in clusters.items():
+        if len(clusters) > 1:
+            size = sum(len(units[u][1]) for u in members)
+            groups.append({'key': key, 'label': f"{key.split(':', 1)[1] or 'module level'} ({size} nodes)",
+                           'nodes': size, 'expanded': key in open_clusters})
+        for unit in members:
+            groups.append({'key': unit, 'label': f"{unit_title(unit)} ({len(units[unit][1])} nodes)",
+                           'nodes': len(units[unit][1]), 'expanded': unit in open_units})
+    return {'code': "\n".join(lines), 'nodes': len(nodes), 'visible': visible, 'groups': groups}
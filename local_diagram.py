@@ -0,0 +1,607 @@
+import ast
+
+from code_parser import MetricsTable
+from cpp_lexer import CPP_KEYWORDS, CppScanner, tokens_text, tokenize
+from notebook_reader import CellCache, NotebookFormatError, read_code_cells
+
+# --- Control-flow IR shared by the Python and C++ front ends ---
+# Each statement is a tuple whose first item is its kind:
+#   ('simple', text, calls)            straight-line code, calls = names called
+#   ('if', cond, then, orelse, calls)  orelse may be []
+#   ('loop', header, body, orelse, calls)
+#   ('switch', subject, [(label, body)], calls)  C++ switch: break leaves it
+#   ('match', subject, [(label, body)], calls)   Python match: break leaves the enclosing loop
+#   ('with', header, body, calls) / ('block', body)
+#   ('try', body, [(label, body)], orelse, final)
+#   ('return', text, calls) / ('raise', text, calls)
+#   ('break',) / ('continue',)
+
+MAX_LABEL = 40
+# Title prefix of functions nested too deeply to lower or draw (labels are cut at MAX_LABEL)
+TOO_DEEP = "[too deep to draw] "
+
+
+class ParseError(ValueError):
+    """Source nested too deeply for Python's own parser"""
+
+# Functions at or above this cyclomatic complexity get a highlighted subgraph
+HOT_COMPLEXITY = 10
+HOT_STYLE = "fill:#FFF7ED,stroke:#EA580C,stroke-width:2px"
+
+
+class LocalDiagramEngine:
+    """Build per-function control-flow-graph Mermaid diagrams without an LLM"""
+
+    def __init__(self, max_functions=60, cell_cache=None):
+        self.max_functions = max_functions
+        # Lowered notebook cells, so re-diagramming an edited notebook only redoes changed cells
+        self.cell_cache = cell_cache if cell_cache is not None else CellCache()
+
+    def build(self, code_content, file_type, metrics=None):
+        """Return a Mermaid flowchart of the control flow in code_content
+
+        With the parse result's `metrics`, each function title is prefixed
+        with its cyclomatic complexity and functions of HOT_COMPLEXITY or more
+        are highlighted.
+        """
+        functions = self.functions(code_content, file_type)[:self.max_functions]
+        if not metrics:
+            return MermaidCFGWriter(functions).render()
+
+        rows = MetricsTable.from_rows(metrics).by_name()
+        titled = []
+        hot = []
+        for index, (name, signature, body) in enumerate(functions):
+            row = rows.get(name)
+            if row is not None:
+                signature = f"[CC {row['complexity']}] {signature}"
+                if row['complexity'] >= HOT_COMPLEXITY and body is not None:
+                    hot.append(f"f{index}")
+            titled.append((name, signature, body))
+        lines = [MermaidCFGWriter(titled).render()]
+        lines.extend(f"    style {function_id} {HOT_STYLE}" for function_id in hot)
+        return "\n".join(lines)
+
+    def functions(self, code_content, file_type, select=None):
+        """Return [(qualified_name, signature, body_ir)] for every function (and module code or cell)
+
+        With `select(name, first_line, last_line)`, only the functions it
+        accepts are lowered; the others are listed with a body of None.
+        Notebook cells are always lowered (unchanged cells come from the cache).
+        Raises ParseError for Python source too deeply nested to parse.
+        """
+        if file_type == 'ipynb':
+            return self._notebook_functions(code_content)
+        if file_type == 'py':
+            return PythonFrontEnd().functions(code_content, select)
+        if file_type == 'cpp':
+            return CppFrontEnd().functions(code_content, select)
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+    def _notebook_functions(self, content):
+        """Lower each code cell separately, so one broken cell doesn't hide the rest"""
+        try:
+            cells = read_code_cells(content)
+        except NotebookFormatError:
+            return []
+        functions = []
+        for cell in cells:
+            try:
+                lowered = self.cell_cache.get(cell.source, self._lower_cell)
+            except ParseError:
+                functions.append((f"<cell {cell.index + 1}>", f"{TOO_DEEP}cell {cell.index + 1}", None))
+                continue
+            for name, signature, body in lowered:
+                if name == '<module>':
+                    name, signature = f"<cell {cell.index + 1}>", f"cell {cell.index + 1}"
+                functions.append((name, signature, body))
+        return functions
+
+    def _lower_cell(self, source):
+        # Drop IPython magics and shell escapes, which are not Python
+        code = '\n'.join(l for l in source.splitlines() if not l.lstrip().startswith(('%', '!')))
+        return PythonFrontEnd().functions(code)
+
+
+class PythonFrontEnd:
+    """Lower Python functions to the control-flow IR"""
+
+    def functions(self, code, select=None):
+        """Return [(qualified_name, signature, body_ir)] for every function, plus module code"""
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return []
+        except (RecursionError, MemoryError) as e:
+            raise ParseError(f"Could not parse Python code: too deeply nested ({type(e).__name__})") from e
+
+        self.select = select
+        result = []
+        module_body = [n for n in tree.body if not isinstance(
+            n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom))]
+        if module_body:
+            lower = select is None or any(select('<module>', n.lineno, n.end_lineno) for n in module_body)
+            result.append(('<module>', 'module', self.block(module_body) if lower else None))
+        self._collect(tree.body, '', result)
+        return result
+
+    def _collect(self, body, prefix, result):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                args = ', '.join(a.arg for a in node.args.args)
+                prefix_kw = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+                name = prefix + node.name
+                first_line = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+                lower = self.select is None or self.select(name, first_line, node.end_lineno)
+                signature = f"{prefix_kw} {name}({args})"
+                body = None
+                if lower:
+                    try:
+                        body = self.block(node.body)
+                    except RecursionError:
+                        signature = TOO_DEEP + signature
+                result.append((name, signature, body))
+            elif isinstance(node, ast.ClassDef):
+                self._collect(node.body, f"{prefix}{node.name}.", result)
+
+    def block(self, stmts):
+        # Docstrings and other bare string literals are not control flow
+        return [self.stmt(s) for s in stmts
+                if not (isinstance(s, ast.Expr) and isinstance(s.value, ast.Constant) and isinstance(s.value.value, str))]
+
+    def stmt(self, node):
+        if isinstance(node, ast.If):
+            return ('if', self._src(node.test), self.block(node.body), self.block(node.orelse), self._calls(node.test))
+        if isinstance(node, (ast.For, ast.AsyncFor)):
+            header = f"for {self._src(node.target)} in {self._src(node.iter)}"
+            return ('loop', header, self.block(node.body), self.block(node.orelse), self._calls(node.iter))
+        if isinstance(node, ast.While):
+            return ('loop', f"while {self._src(node.test)}", self.block(node.body), self.block(node.orelse),
+                    self._calls(node.test))
+        if isinstance(node, (ast.Try, getattr(ast, 'TryStar', ast.Try))):
+            handlers = [
+                (f"except {self._src(h.type)}" if h.type is not None else "except", self.block(h.body))
+                for h in node.handlers
+            ]
+            return ('try', self.block(node.body), handlers, self.block(node.orelse), self.block(node.finalbody))
+        if isinstance(node, (ast.With, ast.AsyncWith)):
+            items = ', '.join(self._src(i.context_expr) for i in node.items)
+            calls = set().union(*(self._calls(i.context_expr) for i in node.items))
+            return ('with', f"with {items}", self.block(node.body), calls)
+        if isinstance(node, getattr(ast, 'Match', ())):
+            cases = [(f"case {self._src(c.pattern)}", self.block(c.body)) for c in node.cases]
+            return ('match', f"match {self._src(node.subject)}", cases, self._calls(node.subject))
+        if isinstance(node, ast.Return):
+            text = f"return {self._src(node.value)}" if node.value is not None else "return"
+            return ('return', text, self._calls(node))
+        if isinstance(node, ast.Raise):
+            text = f"raise {self._src(node.exc)}" if node.exc is not None else "raise"
+            return ('raise', text, self._calls(node))
+        if isinstance(node, ast.Break):
+            return ('break',)
+        if isinstance(node, ast.Continue):
+            return ('continue',)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return ('simple', f"def {node.name}", set())
+        if isinstance(node, ast.ClassDef):
+            return ('simple', f"class {node.name}", set())
+        return ('simple', self._src(node), self._calls(node))
+
+    def _src(self, node):
+        return ast.unparse(node).split('\n', 1)[0]
+
+    def _calls(self, node):
+        names = set()
+        for sub in ast.walk(node):
+            if isinstance(sub, ast.Call):
+                if isinstance(sub.func, ast.Name):
+                    names.add(sub.func.id)
+                elif isinstance(sub.func, ast.Attribute):
+                    names.add(sub.func.attr)
+        return names
+
+
+class CppFrontEnd:
+    """Lower C++ function bodies to the control-flow IR"""
+
+    def functions(self, code, select=None):
+        """Return [(qualified_name, signature, body_ir)] for every function definition"""
+        result = []
+        for func in CppScanner(code).scan().functions:
+            if select is not None and not select(func['qualname'], func['line'], func['end_line']):
+                result.append((func['qualname'], func['signature'], None))
+                continue
+            body_start, body_end = func['body']
+            # Only the function bodies are tokenized; the scanner already found them
+            self.toks = tokenize(code, body_start, body_end)
+            self.pos, self.end = 0, len(self.toks)
+            self.closers = self._pair_brackets()
+            try:
+                result.append((func['qualname'], func['signature'], self._block_until_end()))
+            except RecursionError:
+                result.append((func['qualname'], TOO_DEEP + func['signature'], None))
+        return result
+
+    def _pair_brackets(self):
+        """{index of each '(' and '{': index of its closing token}, in one pass over the body"""
+        closers = {}
+        stacks = {'(': [], '{': []}
+        for i, (_, t, _) in enumerate(self.toks):
+            if t in stacks:
+                stacks[t].append(i)
+            elif t == ')' and stacks['('] or t == '}' and stacks['{']:
+                closers[stacks['(' if t == ')' else '{'].pop()] = i
+        return closers
+
+    def _match(self, i, limit=None):
+        """Index of the token closing the bracket at i, or limit - 1 when it isn't closed before limit
+
+        Looked up in the pairs found once per body, so nested blocks don't rescan the rest of it.
+        """
+        limit = len(self.toks) if limit is None else limit
+        close = self.closers.get(i)
+        return close if close is not None and close < limit else limit - 1
+
+    def _text(self, start, end):
+        return tokens_text(self.toks[start:end])
+
+    # --- statement parsing ---
+
+    def _peek(self):
+        return self.toks[self.pos][1] if self.pos < self.end else None
+
+    def _block_until_end(self):
+        stmts = []
+        while self.pos < self.end:
+            stmts.append(self._stmt())
+        return [s for s in stmts if s is not None]
+
+    def _paren(self):
+        """Consume a parenthesized header and return its inner text"""
+        if self._peek() != '(':
+            return '', set()
+        close = self._match(self.pos, self.end)
+        text = self._text(self.pos + 1, close)
+        calls = self._calls(self.pos + 1, close)
+        self.pos = close + 1
+        return text, calls
+
+    def _body(self):
+        """Parse a statement or braced block as a list of IR statements"""
+        if self._peek() == '{':
+            close = self._match(self.pos, self.end)
+            saved_end = self.end
+            self.pos, self.end = self.pos + 1, close
+            stmts = self._block_until_end()
+            self.pos, self.end = close + 1, saved_end
+            return stmts
+        stmt = self._stmt()
+        return [stmt] if stmt is not None else []
+
+    def _stmt(self):
+        tok = self._peek()
+        if tok == ';':
+            self.pos += 1
+            return None
+        if tok == '{':
+            body = self._body()
+            return ('block', body)
+        if tok == 'if':
+            self.pos += 1
+            if self._peek() == 'constexpr':
+                self.pos += 1
+            cond, calls = self._paren()
+            then = self._body()
+            orelse = []
+            if self._peek() == 'else':
+                self.pos += 1
+                orelse = self._body()
+            return ('if', cond, then, orelse, calls)
+        if tok in ('for', 'while'):
+            self.pos += 1
+            header, calls = self._paren()
+            return ('loop', f"{tok} ({header})", self._body(), [], calls)
+        if tok == 'do':
+            self.pos += 1
+            body = self._body()
+            header, calls = ('', set())
+            if self._peek() == 'while':
+                self.pos += 1
+                header, calls = self._paren()
+            if self._peek() == ';':
+                self.pos += 1
+            return ('loop', f"do ... while ({header})", body, [], calls)
+        if tok == 'switch':
+            self.pos += 1
+            subject, calls = self._paren()
+            return ('switch', f"switch ({subject})", self._cases(), calls)
+        if tok == 'try':
+            self.pos += 1
+            body = self._body()
+            handlers = []
+            while self._peek() == 'catch':
+                self.pos += 1
+                header, _ = self._paren()
+                handlers.append((f"catch ({header})", self._body()))
+            return ('try', body, handlers, [], [])
+        if tok in ('break', 'continue'):
+            self._simple_text()
+            return (tok,)
+        if tok in ('return', 'co_return', 'throw'):
+            text, calls = self._simple_text()
+            return ('raise' if tok == 'throw' else 'return', text, calls)
+        text, calls = self._simple_text()
+        return ('simple', text, calls) if text else None
+
+    def _simple_text(self):
+        """Consume tokens up to the terminating ';' (skipping nested brackets)"""
+        start = self.pos
+        depth = 0
+        while self.pos < self.end:
+            t = self.toks[self.pos][1]
+            if t in ('(', '[', '{'):
+                depth += 1
+            elif t in (')', ']', '}'):
+                depth -= 1
+            elif t == ';' and depth <= 0:
+                break
+            self.pos += 1
+        text = self._text(start, self.pos)
+        calls = self._calls(start, self.pos)
+        self.pos += 1
+        return text, calls
+
+    def _cases(self):
+        """Parse a switch body into [(label, body)] branches"""
+        if self._peek() != '{':
+            return [('case', self._body())]
+        close = self._match(self.pos, self.end)
+        saved_end = self.end
+        self.pos, self.end = self.pos + 1, close
+        cases = []
+        while self.pos < self.end:
+            if self._peek() in ('case', 'default'):
+                start = self.pos
+                while self.pos < self.end and self.toks[self.pos][1] != ':':
+                    self.pos += 1
+                label = self._text(start, self.pos)
+                self.pos += 1
+                cases.append((label, []))
+            else:
+                stmt = self._stmt()
+                if stmt is not None:
+                    if not cases:
+                        cases.append(('case', []))
+                    cases[-1][1].append(stmt)
+        self.pos, self.end = close + 1, saved_end
+        return cases
+
+    def _calls(self, start, end):
+        names = set()
+        for i in range(start, min(end, len(self.toks)) - 1):
+            kind, text, _ = self.toks[i]
+            if kind == 'word' and text not in CPP_KEYWORDS and self.toks[i + 1][1] == '(':
+                names.add(text)
+        return names
+
+
+class MermaidCFGWriter:
+    """Turn control-flow IR into a Mermaid flowchart with one subgraph per function
+
+    `ids` names each function's subgraph (default f0, f1, ...); its nodes are
+    prefixed with it. A function whose body is None is drawn as a single node.
+    """
+
+    def __init__(self, functions, ids=None):
+        self.functions = functions
+        self.ids = ids if ids is not None else [f"f{index}" for index in range(len(functions))]
+        self.lines = ["flowchart TD"]
+        self.call_edges = []
+
+    def render(self):
+        if not self.functions:
+            self.lines.append('    empty(["No functions found"])')
+            return "\n".join(self.lines)
+
+        # Map short and qualified names to each function's entry node
+        entries = {}
+        for function_id, (name, _, _) in zip(self.ids, self.functions):
+            entries.setdefault(name, f"{function_id}_start")
+            entries.setdefault(name.split('.')[-1].split('::')[-1], f"{function_id}_start")
+
+        for function_id, (name, signature, body) in zip(self.ids, self.functions):
+            self._function(function_id, name, signature, body)
+
+        # Calls between known functions, drawn once per caller/callee pair
+        seen = set()
+        for src, names in self.call_edges:
+            for callee in sorted(names):
+                dst = entries.get(callee)
+                if dst and (src, dst) not in seen:
+                    seen.add((src, dst))
+                    self.lines.append(f"    {src} -.->|calls| {dst}")
+        return "\n".join(self.lines)
+
+    def _function(self, function_id, name, signature, body):
+        self.prefix = f"{function_id}_"
+        self.counter = 0
+        if body is None:
+            self.lines.append(f'    {self.prefix}start[["{self._escape(signature)}"]]')
+            return
+        title = len(self.lines)
+        self.lines.append(f'    subgraph {function_id}["{self._escape(signature)}"]')
+        start = f"{self.prefix}start"
+        end = f"{self.prefix}end"
+        self.lines.append(f'    {start}(["{self._escape(name)}"])')
+        self.end = end
+        # Loop nodes (continue targets) and the exits collected for each break target
+        self.loops = []
+        self.breaks = []
+        # Return and raise exits collected for each enclosing finally
+        self.finals = []
+
+        mark = len(self.lines), len(self.call_edges)
+        try:
+            exits = self._block(body, [(start, None)])
+        except RecursionError:
+            del self.lines[mark[0]:], self.call_edges[mark[1]:]
+            self.lines[title] = f'    subgraph {function_id}["{self._escape(TOO_DEEP + signature)}"]'
+            exits = [(start, None)]
+        self.lines.append(f'    {end}(["end"])')
+        self._connect(exits, end)
+        self.lines.append("    end")
+
+    # --- graph building ---
+
+    def _node(self, shape, text):
+        node_id = f"{self.prefix}n{self.counter}"
+        self.counter += 1
+        open_, close = {
+            'process': ('["', '"]'),
+            'decision': ('{"', '"}'),
+            'loop': ('{{"', '"}}'),
+            'terminal': ('(["', '"])'),
+        }[shape]
+        self.lines.append(f"    {node_id}{open_}{self._escape(text)}{close}")
+        return node_id
+
+    def _connect(self, preds, dst):
+        for src, label in preds:
+            if label:
+                self.lines.append(f'    {src} -->|"{self._escape(label)}"| {dst}')
+            else:
+                self.lines.append(f"    {src} --> {dst}")
+
+    def _block(self, stmts, preds):
+        """Emit stmts after preds; return the dangling exits [(node, label)]"""
+        pending_simple = []
+        for stmt in stmts:
+            if stmt[0] == 'simple':
+                pending_simple.append(stmt)
+                continue
+            preds = self._flush(pending_simple, preds)
+            pending_simple = []
+            if not preds:
+                # Unreachable code after return/break/raise
+                break
+            preds = self._stmt(stmt, preds)
+        return self._flush(pending_simple, preds)
+
+    def _leave(self, preds):
+        """Leave the function from preds, through the innermost enclosing finally"""
+        if self.finals:
+            self.finals[-1].extend(preds)
+        else:
+            self._connect(preds, self.end)
+
+    def _flush(self, simple, preds):
+        """Collapse a run of straight-line statements into one process node"""
+        if not simple or not preds:
+            return preds
+        text = '; '.join(s[1] for s in simple[:3])
+        if len(simple) > 3:
+            text += f"; ... (+{len(simple) - 3})"
+        node = self._node('process', text)
+        self._connect(preds, node)
+        self.call_edges.append((node, set().union(*(s[2] for s in simple))))
+        return [(node, None)]
+
+    def _stmt(self, stmt, preds):
+        kind = stmt[0]
+
+        if kind == 'block':
+            return self._block(stmt[1], preds)
+
+        if kind == 'if':
+            _, cond, then, orelse, calls = stmt
+            node = self._node('decision', cond)
+            self._connect(preds, node)
+            self.call_edges.append((node, calls))
+            exits = self._block(then, [(node, 'Yes')])
+            exits += self._block(orelse, [(node, 'No')]) if orelse else [(node, 'No')]
+            return exits
+
+        if kind == 'loop':
+            _, header, body, orelse, calls = stmt
+            node = self._node('loop', header)
+            self._connect(preds, node)
+            self.call_edges.append((node, calls))
+            self.loops.append(node)
+            self.breaks.append([])
+            body_exits = self._block(body, [(node, 'loop')])
+            self.loops.pop()
+            breaks = self.breaks.pop()
+            self._connect(body_exits, node)
+            done = [(node, 'done')]
+            if orelse:
+                done = self._block(orelse, done)
+            return done + breaks
+
+        if kind == 'with':
+            _, header, body, calls = stmt
+            node = self._node('process', header)
+            self._connect(preds, node)
+            self.call_edges.append((node, calls))
+            return self._block(body, [(node, None)])
+
+        if kind in ('switch', 'match'):
+            _, subject, cases, calls = stmt
+            node = self._node('decision', subject)
+            self._connect(preds, node)
+            self.call_edges.append((node, calls))
+            # break inside a C++ case leaves the switch; in a Python case it leaves the loop
+            if kind == 'switch':
+                self.breaks.append([])
+            exits = []
+            for label, body in cases:
+                exits += self._block(body, [(node, label)])
+            if kind == 'switch':
+                exits += self.breaks.pop()
+            return exits
+
+        if kind == 'try':
+            _, body, handlers, orelse, final = stmt
+            node = self._node('process', 'try')
+            self._connect(preds, node)
+            if final:
+                self.finals.append([])
+            exits = self._block(body, [(node, None)])
+            if orelse:
+                exits = self._block(orelse, exits)
+            for label, handler_body in handlers:
+                handler = self._node('process', label)
+                self._connect([(node, 'raises')], handler)
+                exits += self._block(handler_body, [(handler, None)])
+            if final:
+                # finally is drawn once; returns and raises leave the function after it
+                leaving = self.finals.pop()
+                final_exits = self._block(final, exits + leaving)
+                if leaving:
+                    self._leave(final_exits)
+                exits = final_exits if exits else []
+            return exits
+
+        if kind in ('return', 'raise'):
+            _, text, calls = stmt
+            node = self._node('terminal', text)
+            self._connect(preds, node)
+            self.call_edges.append((node, calls))
+            self._leave([(node, None)])
+            return []
+
+        if kind == 'break':
+            if self.breaks:
+                self.breaks[-1].extend(preds)
+            return []
+
+        if kind == 'continue':
+            if self.loops:
+                self._connect(preds, self.loops[-1])
+            return []
+
+        return preds
+
+    def _escape(self, text):
+        if len(text) > MAX_LABEL:
+            text = text[:MAX_LABEL - 3] + '...'
+        return text.replace('"', '#quot;').replace('<', '#lt;').replace('>', '#gt;')
@@ -0,0 +1,513 @@
+import re
+
+# Shape openers, longest first, with the closers each may end with
+SHAPES = (
+    ('(((', (')))',)), ('((', ('))',)), ('([', ('])',)), ('[[', (']]',)), ('[(', (')]',)),
+    ('{{', ('}}',)), ('[/', ('/]', '\\]')), ('[\\', ('\\]', '/]')), ('(', (')',)), ('[', (']',)),
+    ('{', ('}',)), ('>', (']',)),
+)
+
+_OPENERS = {opener[0] for opener, _ in SHAPES}
+
+# Characters that end an unquoted label early or open a new shape
+LABEL_SPECIALS = set('()[]{}"')
+
+# Node ids that break the flowchart grammar
+RESERVED_IDS = {'end', 'subgraph', 'graph', 'flowchart', 'style', 'class', 'classDef', 'click', 'linkStyle'}
+
+# Give up on repair when more statements than this would have to be dropped
+MAX_DROPPED_FRACTION = 0.25
+
+_HEADER = re.compile(r'(flowchart|graph)(?:\s+(TB|TD|BT|RL|LR))?\s*;?\s*$')
+_OTHER_DIAGRAM = re.compile(
+    r'(sequenceDiagram|classDiagram|stateDiagram(?:-v2)?|erDiagram|gantt|pie|journey|gitGraph|mindmap|'
+    r'timeline|quadrantChart|requirementDiagram|C4\w+|sankey-beta|xychart-beta|block-beta)\b')
+_ID = re.compile(r'\s*(\w+(?:-\w+)*)')
+_CLASS_SUFFIX = re.compile(r':::[\w-]+')
+_LINK = re.compile(r'''\s*(?:
+    (?P<text_arrow><?(?:--|==|-\.)\s+(?P<inline>[^|\n]+?)\s+(?:-{2,}[>ox]?|={2,}>?|\.+->?))
+  | (?P<arrow><?(?:-{2,}|={2,}|-\.+-)(?:>|[ox](?=\s))?)
+  | (?P<bad>=>|->)
+)\s*(?:\|(?P<label>[^|\n]*)\|)?''', re.X)
+_AFTER_NODE = re.compile(r'\s*(?:$|;|&|:::|<?(?:--|==|-\.|->|=>))')
+_LABEL_LINK = re.compile(r'\s(?:<?-{2,}[>ox]?|<?={2,}>?|<?-\.+->?)\s')
+_STATEMENT = re.compile(r'''\s*(?:
+    (?P<comment>%%.*)
+  | (?P<subgraph>subgraph\b.*)
+  | (?P<end>end)\s*;?\s*$
+  | (?P<direction>direction\s+(?:TB|TD|BT|RL|LR))\s*;?\s*$
+  | (?P<classdef>classDef\s+\S.*)
+  | class\s+(?P<class_ids>[\w-]+(?:\s*,\s*[\w-]+)*)\s+[\w-]+\s*;?\s*$
+  | style\s+(?P<style_id>[\w-]+)\s+\S.*
+  | linkStyle\s+(?P<link_ids>default|\d+(?:\s*,\s*\d+)*)\s+\S.*
+  | click\s+(?P<click_id>[\w-]+)\b.*
+)$''', re.X)
+_SUBGRAPH_ID = re.compile(r'subgraph\s+(\w+(?:-\w+)*)\s*(?:\[(.*)\])?\s*$')
+
+
+def _issue(line, message):
+    return {'line': line, 'message': message}
+
+
+def _quote(label):
+    """Wrap a label in quotes, turning inner quotes into the #quot; entity"""
+    return '"' + label.replace('"', '#quot;') + '"'
+
+
+def _label_problem(label):
+    """Describe what would break this label, or None"""
+    if len(label) >= 2 and label[0] == '"' and label[-1] == '"':
+        return "unescaped quote in label" if '"' in label[1:-1] else None
+    if not label.strip():
+        return "empty label"
+    if LABEL_SPECIALS.intersection(label):
+        return "unquoted brackets or quotes in label"
+    return None
+
+
+def _clean_label(label):
+    if len(label) >= 2 and label[0] == '"' and label[-1] == '"':
+        label = label[1:-1]
+    return _quote(label.strip())
+
+
+class _Checker:
+    """Single pass over a flowchart that records problems and, with fix=True, rewrites it"""
+
+    def __init__(self, fix):
+        self.fix = fix
+        self.errors = []
+        self.warnings = []
+        self.fixes = []
+        self.defined = {}      # id -> (opener, label) of its latest definition
+        self.aliases = {}      # id -> id it was renamed to after a conflicting redefinition
+        self.referenced = {}   # id -> first line it is used on
+        self.subgraphs = {}    # id -> {'title', 'parent'}
+        self.stack = []        # ids of the open subgraphs
+        self.edges = 0
+        self.statements = 0
+        self.dropped = 0
+        self.nodes = {}        # id -> text of its first definition (or the bare id)
+        self.parents = {}      # id -> innermost subgraph it first appears in
+        self.links = []        # (src, link text, dst) per edge
+        self.extras = []       # (ids it applies to, line) for style, class, click and classDef lines
+        self.late = []         # (line, kind, payload, output index) checked once all nodes are known
+        self.pending = []      # (id, line, definition or None) of the statement being parsed
+        self.out = []
+
+    def run(self, code):
+        lines = code.replace('\r\n', '\n').split('\n')
+        start = None
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if _HEADER.match(stripped) or _OTHER_DIAGRAM.match(stripped):
+                start = i
+                break
+        if start is None:
+            self._problem(1, "missing 'flowchart' header", "added 'flowchart TD' header")
+            self.out.append("flowchart TD")
+            start = -1
+        else:
+            for i in range(start):
+                stripped = lines[i].strip()
+                if stripped and not stripped.startswith(('%%', '```')):
+                    self._problem(i + 1, "text before the diagram header", "dropped text before the header")
+            if _OTHER_DIAGRAM.match(lines[start].strip()):
+                self.warnings.append(_issue(start + 1, "not a flowchart; only flowcharts are checked"))
+                self.out = lines[start:]
+                return
+            self.out.append(lines[start].rstrip())
+
+        for number, line in enumerate(lines[start + 1:], start + 2):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith('```'):
+                self._problem(number, "markdown fence inside the diagram", "dropped markdown fence")
+                continue
+            issues = len(self.errors), len(self.fixes)
+            indent = line[:len(line) - len(line.lstrip())]
+            rewritten = self._line(number, stripped)
+            if rewritten is not None:
+                self.statements += 1
+                self.out.append(indent + rewritten)
+            elif start < 0 and not self.statements:
+                # Without a header, prose before the first statement is the model's preamble
+                del self.errors[issues[0]:], self.fixes[issues[1]:]
+                self._problem(number, "text before the diagram", "dropped text before the diagram")
+            else:
+                self.statements += 1
+                self.dropped += 1
+
+        while self.stack:
+            self.stack.pop()
+            self._problem(len(lines), "subgraph without 'end'", "closed subgraph")
+            self.out.append("    end")
+        self._finish()
+
+    def _problem(self, line, message, fix_note, warning=False):
+        (self.warnings if warning else self.errors).append(_issue(line, message))
+        if self.fix:
+            self.fixes.append(_issue(line, fix_note))
+
+    def _line(self, number, text):
+        """Check one line; return its (possibly rewritten) text, or None to drop it"""
+        m = _STATEMENT.match(text)
+        if m:
+            return self._keyword(number, text, m)
+        if _HEADER.match(text):
+            self._problem(number, "second diagram header", "dropped repeated header")
+            return None
+
+        statements = []
+        pos = 0
+        changed = False
+        while pos < len(text):
+            parsed = self._statement(number, text, pos)
+            if parsed is None:
+                return None
+            rendered, pos, statement_changed = parsed
+            statements.append(rendered)
+            changed = changed or statement_changed
+            pos = len(text) - len(text[pos:].lstrip())
+            if text.startswith(';', pos):
+                pos += 1
+        return '; '.join(statements) if changed else text
+
+    def _keyword(self, number, text, m):
+        if m.group('subgraph'):
+            sid = _SUBGRAPH_ID.match(text)
+            if sid:
+                sid, title = sid.group(1), (sid.group(2) or sid.group(1)).strip('"')
+            else:
+                sid, title = f"subgraph{len(self.subgraphs)}", text[len('subgraph'):].strip()
+            self.subgraphs[sid] = {'title': title, 'parent': self.stack[-1] if self.stack else None}
+            self.stack.append(sid)
+        elif m.group('end'):
+            if not self.stack:
+                self._problem(number, "'end' without a subgraph", "dropped unmatched 'end'")
+                return None
+            self.stack.pop()
+        elif m.group('class_ids'):
+            ids = [i.strip() for i in m.group('class_ids').split(',')]
+            self.late.append((number, 'ids', ids))
+            self.extras.append((ids, text))
+        elif m.group('style_id'):
+            self.late.append((number, 'ids', [m.group('style_id')]))
+            self.extras.append(([m.group('style_id')], text))
+        elif m.group('click_id'):
+            self.late.append((number, 'ids', [m.group('click_id')]))
+            self.extras.append(([m.group('click_id')], text))
+        elif m.group('classdef'):
+            self.extras.append(([], text))
+        elif m.group('link_ids') and m.group('link_ids') != 'default':
+            self.late.append((number, 'links', [int(i) for i in m.group('link_ids').split(',')]))
+        # linkStyle, style, class and click are resolved at the end; keep a slot for them
+        if m.group('class_ids') or m.group('style_id') or m.group('click_id') or \
+                (m.group('link_ids') and m.group('link_ids') != 'default'):
+            self.late[-1] += (len(self.out),)
+        return text
+
+    def _statement(self, number, text, pos):
+        """Parse `node (& node)* (link node (& node)*)*` from pos
+
+        Returns (text, end position, changed) or None if the statement was dropped.
+        """
+        parts = []
+        changed = False
+        group = []
+        groups = [group]
+        links = []
+        while True:
+            node = self._node(number, text, pos)
+            if node is None and not group and text[pos:].strip() in ('', ';'):
+                self._problem(number, "link without a target node", "dropped dangling link")
+                parts.pop()
+                groups.pop()
+                links.pop()
+                changed = True
+                break
+            if node is None:
+                return self._unparseable(number, text, pos)
+            rendered, node_id, pos, node_changed = node
+            parts.append(rendered)
+            group.append(node_id)
+            changed = changed or node_changed
+
+            rest = text[pos:].lstrip()
+            if rest.startswith('&'):
+                parts.append(' & ')
+                pos = text.index('&', pos) + 1
+                continue
+            link = _LINK.match(text, pos)
+            if not rest or rest.startswith(';') or link is None:
+                break
+            rendered, link_changed = self._link(number, link)
+            parts.append(f" {rendered} ")
+            links.append(rendered)
+            changed = changed or link_changed
+            pos = link.end()
+            group = []
+            groups.append(group)
+
+        rest = text[pos:].lstrip()
+        if rest and not rest.startswith(';'):
+            return self._unparseable(number, text, pos)
+        parent = self.stack[-1] if self.stack else None
+        for node_id, line, definition in self.pending:
+            if definition is None:
+                self.referenced.setdefault(node_id, line)
+            if definition is not None and self.nodes.get(node_id, node_id) == node_id:
+                self.nodes[node_id] = definition
+            else:
+                self.nodes.setdefault(node_id, node_id)
+            self.parents.setdefault(node_id, parent)
+        self.pending = []
+        for src, link, dst in zip(groups, links, groups[1:]):
+            self.edges += len(src) * len(dst)
+            self.links.extend((a, link, b) for a in src for b in dst)
+        return ''.join(parts), pos, changed
+
+    def _unparseable(self, number, text, pos):
+        self.pending = []
+        self._problem(number, f"cannot parse {text[pos:pos + 30].strip()!r}", "dropped unparseable statement")
+        return None
+
+    def _node(self, number, text, pos):
+        """Parse one node reference or definition; return (text, id, end, changed) or None"""
+        m = _ID.match(text, pos)
+        if m is None:
+            return None
+        node_id = m.group(1)
+        pos = m.end()
+        changed = False
+
+        if node_id in RESERVED_IDS:
+            self._problem(number, f"reserved word {node_id!r} used as a node id",
+                          f"renamed node {node_id!r}")
+            self.aliases.setdefault(node_id, f"{node_id}_node")
+            changed = True
+
+        shape = None
+        opens = text[pos:pos + 1] in _OPENERS
+        for opener, closers in SHAPES if opens else ():
+            if not text.startswith(opener, pos):
+                continue
+            shape = self._shape(text, pos, opener, closers)
+            if shape is not None:
+                break
+        if shape is None and opens:
+            # An opener without a usable closer: take the label up to the next link
+            opener = text[pos]
+            closer = {'[': ']', '(': ')', '{': '}', '>': ']'}[opener]
+            link = _LINK.search(text, pos + 1)
+            label_end = link.start() if link else len(text)
+            if text.rstrip().endswith(';') and not link:
+                label_end = len(text.rstrip()) - 1
+            label = text[pos + 1:label_end].strip()
+            self._problem(number, f"unclosed label on node {node_id!r}", f"closed label on node {node_id!r}")
+            shape = (opener, closer, label.rstrip(closer) or node_id, label_end, True)
+
+        if shape is None:
+            self._reference(number, node_id)
+            target = self.aliases.get(node_id, node_id)
+            changed = changed or target != node_id
+            rendered = target
+            suffix = _CLASS_SUFFIX.match(text, pos)
+            if suffix:
+                rendered += suffix.group()
+                pos = suffix.end()
+                self.extras.append(([target], f"class {target} {suffix.group()[3:]}"))
+            return rendered, target, pos, changed
+
+        opener, closer, label, pos, shape_changed = shape
+        changed = changed or shape_changed
+        problem = _label_problem(label)
+        if problem:
+            self._problem(number, f"{problem} on node {node_id!r}", f"quoted label on node {node_id!r}")
+            label = _clean_label(label) if label.strip() else _quote(node_id)
+            changed = True
+
+        target = self._define(number, node_id, opener, label)
+        changed = changed or target != node_id
+        rendered = f"{target}{opener}{label}{closer}"
+        suffix = _CLASS_SUFFIX.match(text, pos)
+        if suffix:
+            rendered += suffix.group()
+            pos = suffix.end()
+        self.pending.append((target, number, rendered))
+        return rendered, target, pos, changed
+
+    def _shape(self, text, pos, opener, closers):
+        """Find where a shape closes: the first closer followed by a link, '&', ';' or the end"""
+        start = pos + len(opener)
+        quoted = text.startswith('"', start)
+        for closer in closers:
+            at = text.find(closer, start + quoted)
+            while at != -1:
+                end = at + len(closer)
+                if not quoted and _LABEL_LINK.search(text, start, at):
+                    # An unquoted label never spans a link; this closer belongs to a later node
+                    break
+                if quoted and (at == start + 1 or text[at - 1] != '"'):
+                    # A quoted label only closes right after its closing quote
+                    at = text.find(closer, at + 1)
+                    continue
+                if _AFTER_NODE.match(text, end):
+                    return opener, closer, text[start:at], end, False
+                at = text.find(closer, at + 1)
+        return None
+
+    def _define(self, number, node_id, opener, label):
+        """Record a node definition; returns the id to use, renaming conflicting redefinitions"""
+        written = node_id
+        node_id = self.aliases.get(node_id, node_id)
+        previous = self.defined.get(node_id)
+        if previous is None or previous == (opener, label):
+            self.defined[node_id] = (opener, label)
+            return node_id
+        self._problem(number, f"node id {written!r} is defined twice with different labels",
+                      f"renamed second {written!r}", warning=True)
+        if not self.fix:
+            self.defined[node_id] = (opener, label)
+            return node_id
+        n = 2
+        while f"{written}_{n}" in self.defined:
+            n += 1
+        renamed = f"{written}_{n}"
+        self.defined[renamed] = (opener, label)
+        # Later bare references mean the newest node with this id
+        self.aliases[written] = renamed
+        return renamed
+
+    def _reference(self, number, node_id):
+        self.pending.append((self.aliases.get(node_id, node_id), number, None))
+
+    def _link(self, number, m):
+        """Check one link; return (text, changed)"""
+        changed = False
+        if m.group('bad'):
+            fixed = {'->': '-->', '=>': '==>'}[m.group('bad')]
+            self._problem(number, f"invalid arrow {m.group('bad')!r}", f"replaced {m.group('bad')!r} with {fixed!r}")
+            arrow = fixed
+            changed = True
+        elif m.group('text_arrow'):
+            arrow = m.group('text_arrow')
+            inline = m.group('inline')
+            if LABEL_SPECIALS.intersection(inline):
+                self._problem(number, "brackets or quotes in link text", "quoted link text")
+                head = arrow[:len(arrow) - len(arrow.lstrip('<'))]
+                tail = re.search(r'(?:-{2,}[>ox]?|={2,}>?|\.+->?)$', arrow).group()
+                arrow = {'=': f"{head}==>", '.': f"{head}-.->"}.get(tail[0], f"{head}-->") \
+                    if tail.endswith('>') else {'=': "===", '.': "-.-"}.get(tail[0], "---")
+                return f"{arrow}|{_clean_label(inline)}|", True
+        else:
+            arrow = m.group('arrow')
+
+        label = m.group('label')
+        if label is None:
+            return arrow, changed
+        if label.strip() and '"' in (label[1:-1] if label[:1] == label[-1:] == '"' else label):
+            self._problem(number, "quote in link text", "escaped quote in link text")
+            return f"{arrow}|{_clean_label(label)}|", True
+        return f"{arrow}|{label}|", changed
+
+    def _finish(self):
+        known = set(self.defined) | set(self.subgraphs) | set(self.referenced)
+        if not self.defined and not self.referenced:
+            self.errors.append(_issue(0, "the diagram has no nodes"))
+
+        drop = set()
+        for number, kind, payload, index in self.late:
+            if kind == 'ids':
+                missing = [i for i in payload if self.aliases.get(i, i) not in known]
+                if missing:
+                    self._problem(number, f"reference to unknown node {missing[0]!r}",
+                                  "dropped statement about unknown node", warning=True)
+                    drop.add(index)
+            elif any(i >= self.edges for i in payload):
+                self._problem(number, f"linkStyle index {max(payload)} but only {self.edges} links",
+                              "dropped out-of-range linkStyle")
+                drop.add(index)
+        if self.fix and drop:
+            self.out = [line for i, line in enumerate(self.out) if i not in drop]
+
+        if self.fix:
+            # A renamed reserved id that is never given a label would be drawn as "end_node"; label it "end"
+            for word, target in self.aliases.items():
+                if word in RESERVED_IDS and target in self.referenced and target not in self.defined:
+                    self.defined[target] = ('[', _quote(word))
+                    self.nodes[target] = f"{target}[{_quote(word)}]"
+                    self.out.append(f"    {self.nodes[target]}")
+
+        bare = [node_id for node_id in self.referenced if node_id not in self.defined]
+        if len(bare) < len(self.defined):
+            # In a diagram that mostly labels its nodes, a bare id is usually a typo or a forgotten definition
+            for node_id, number in sorted(self.referenced.items(), key=lambda item: item[1]):
+                if node_id not in self.defined and node_id not in self.subgraphs:
+                    self.warnings.append(_issue(number, f"node {node_id!r} is used but never defined"))
+
+
+def validate(code):
+    """Check Mermaid flowchart syntax
+
+    Returns {'valid', 'errors', 'warnings', 'nodes', 'edges'}; errors are
+    problems Mermaid fails to render, warnings render but are likely mistakes
+    (e.g. an id redefined with another label, or never given one).
+    """
+    checker = _Checker(fix=False)
+    checker.run(code)
+    return {
+        'valid': not checker.errors,
+        'errors': checker.errors,
+        'warnings': checker.warnings,
+        'nodes': len(set(checker.defined) | set(checker.referenced)),
+        'edges': checker.edges
+    }
+
+
+def parse(code):
+    """Read a flowchart into its graph, for tools that restructure diagrams
+
+    Returns {'header', 'nodes', 'parents', 'subgraphs', 'links', 'extras',
+    'errors'}: node id -> its definition text, node id -> innermost subgraph
+    id (or None), subgraph id -> {'title', 'parent'}, (src, link, dst) per
+    edge, and (ids, line) for classDef, class, style and click lines.
+    Statements that can't be parsed are left out and reported in 'errors'.
+    """
+    checker = _Checker(fix=False)
+    checker.run(code)
+    return {
+        'header': checker.out[0] if checker.out else "flowchart TD",
+        'nodes': checker.nodes,
+        'parents': checker.parents,
+        'subgraphs': checker.subgraphs,
+        'links': checker.links,
+        'extras': checker.extras,
+        'errors': checker.errors
+    }
+
+
+def repair(code):
+    """Fix common model mistakes in a Mermaid flowchart
+
+    Quotes labels with brackets or quotes in them, closes unclosed labels and
+    subgraphs, renames reserved and conflicting node ids, fixes '->' arrows and
+    drops fences, preamble and statements that can't be parsed. Returns
+    {'code', 'fixes', 'errors', 'warnings'}; 'code' is None when the result is
+    still invalid or too much had to be dropped.
+    """
+    checker = _Checker(fix=True)
+    checker.run(code)
+    fixed = "\n".join(checker.out)
+    result = validate(fixed) if checker.errors else None
+    too_lossy = checker.dropped > max(2, MAX_DROPPED_FRACTION * checker.statements)
+    if result is not None and (not result['valid'] or too_lossy):
+        return {'code': None, 'fixes': checker.fixes, 'errors': result['errors'] or checker.errors,
+                'warnings': result['warnings']}
+    return {
+        'code': fixed if checker.fixes else code,
+        'fixes': checker.fixes,
+        'errors': [],
+        'warnings': (result or {'warnings': checker.warnings})['warnings']
+    }
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_STRUCTURAL = re.compile(rb'[\[\]{}"]')
+_SCALAR_END = re.compile(rb'[,\]}\s]')
+
+
+class NotebookFormatError(ValueError):
+    """The input is not a well-formed notebook"""
+
+
+class NotebookCell:
+    """One notebook cell; `offset` is the byte offset of the cell object in the file"""
+    __slots__ = ('index', 'cell_type', 'source', 'offset')
+
+    def __init__(self, index, cell_type, source, offset):
+        self.index = index
+        self.cell_type = cell_type
+        self.source = source
+        self.offset = offset
+
+    def __repr__(self):
+        return f"NotebookCell(index={self.index}, cell_type={self.cell_type!r}, offset={self.offset})"
+
+
+def _chunks(source, chunk_size):
+    """Yield the notebook as UTF-8 byte chunks from a path, str, bytes or file object"""
+    if isinstance(source, os.PathLike):
+        with open(source, 'rb') as f:
+            yield from _chunks(f, chunk_size)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            yield bytes(view[i:i + chunk_size])
+    elif isinstance(source, str):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size].encode('utf-8')
+    else:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+class _JSONStream:
+    """Pull parser over a chunked JSON document
+
+    Only the values a caller asks for are materialized; skipped values are
+    scanned in place and dropped with the chunk they arrived in, so memory is
+    bounded by the chunk size plus the largest value that is actually read.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.buf = b''
+        self.pos = 0
+        self.base = 0  # absolute offset of buf[0]
+
+    @property
+    def offset(self):
+        return self.base + self.pos
+
+    def _fill(self):
+        """Drop consumed input and append the next chunk; False at end of input"""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return NotebookFormatError(f"{message} at byte {self.offset}")
+
+    def peek(self):
+        """Return the next non-whitespace byte without consuming it"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos:self.pos + 1]
+            if not self._fill():
+                raise self._error("Unexpected end of notebook")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"Expected {char.decode()!r}")
+        self.pos += 1
+
+    def _string_rest(self, keep):
+        """Consume a string whose opening quote was consumed; return its raw bytes if keep"""
+        parts = []
+        while True:
+            buf = self.buf
+            quote = buf.find(b'"', self.pos)
+            end = len(buf) if quote == -1 else quote
+            # A run of backslashes escapes the quote (or the next chunk's first byte) if odd
+            run_start = end
+            while run_start > self.pos and buf[run_start - 1] == 0x5c:
+                run_start -= 1
+            if quote == -1:
+                # Keep the backslash run so its parity is known once more input arrives
+                if keep:
+                    parts.append(buf[self.pos:run_start])
+                self.pos = run_start
+                if not self._fill():
+                    raise self._error("Unterminated string")
+                continue
+            if keep:
+                parts.append(buf[self.pos:quote])
+            if (quote - run_start) % 2:
+                if keep:
+                    parts.append(b'"')
+                self.pos = quote + 1
+                continue
+            self.pos = quote + 1
+            return b''.join(parts)
+
+    def read_string(self):
+        self.expect(b'"')
+        raw = self._string_rest(True)
+        try:
+            if b'\\' not in raw:
+                return raw.decode('utf-8')
+            return json.loads(b'"' + raw + b'"')
+        except ValueError as e:
+            # UnicodeDecodeError is a ValueError too
+            raise self._error(f"Invalid string ({e})") from None
+
+    def read_value(self):
+        """Materialize the next value"""
+        char = self.peek()
+        if char == b'"':
+            return self.read_string()
+        if char == b'[':
+            return [self.read_value() for _ in self.items()]
+        if char == b'{':
+            return {key: self.read_value() for key in self.members()}
+        start = self.offset
+        raw = self._scalar()
+        try:
+            return json.loads(raw)
+        except ValueError:
+            raise NotebookFormatError(f"Invalid value {raw[:20]!r} at byte {start}") from None
+
+    def _scalar(self):
+        parts = []
+        while True:
+            m = _SCALAR_END.search(self.buf, self.pos)
+            end = m.start() if m else len(self.buf)
+            parts.append(self.buf[self.pos:end])
+            self.pos = end
+            if m or not self._fill():
+                return b''.join(parts)
+
+    def skip_value(self):
+        """Consume the next value without building it"""
+        char = self.peek()
+        if char == b'"':
+            self.pos += 1
+            self._string_rest(False)
+        elif char in (b'[', b'{'):
+            depth = 0
+            while True:
+                m = _STRUCTURAL.search(self.buf, self.pos)
+                if m is None:
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise self._error("Unexpected end of notebook")
+                    continue
+                self.pos = m.end()
+                char = m.group()
+                if char == b'"':
+                    self._string_rest(False)
+                elif char in (b'[', b'{'):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+        else:
+            self._scalar()
+
+    def members(self):
+        """Iterate over the keys of an object; the caller must consume each value"""
+        self.expect(b'{')
+        if self.peek() == b'}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(b':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == b'}':
+                return
+            if char != b',':
+                self.pos -= 1
+                raise self._error("Expected ',' or '}'")
+
+    def items(self):
+        """Iterate over the elements of an array; the caller must consume each value"""
+        self.expect(b'[')
+        if self.peek() == b']':
+            self.pos += 1
+            return
+        while True:
+            self.peek()
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == b']':
+                return
+            if char != b',':
+                self.pos -= 1
+                raise self._error("Expected ',' or ']'")
+
+
+def iter_cells(source, cell_types=('code',), chunk_size=CHUNK_SIZE):
+    """Yield NotebookCells of the given types (None for all) from a notebook
+
+    `source` may be a path, a str or bytes holding the notebook JSON, or a
+    file object. The document is read in chunks: outputs, attachments and
+    metadata are skipped without being decoded, so memory stays proportional
+    to the cell sources rather than to the notebook size.
+    """
+    stream = _JSONStream(_chunks(source, chunk_size))
+    for key in stream.members():
+        if key != 'cells':
+            stream.skip_value()
+            continue
+        for index, _ in enumerate(stream.items()):
+            offset = stream.offset
+            cell_type = None
+            text = ''
+            for field in stream.members():
+                if field == 'cell_type':
+                    cell_type = stream.read_value()
+                elif field == 'source':
+                    text = stream.read_value()
+                    if isinstance(text, list) and all(isinstance(line, str) for line in text):
+                        text = ''.join(text)
+                    elif not isinstance(text, str):
+                        raise stream._error(f"Cell {index + 1} source is not a string or list of strings")
+                else:
+                    stream.skip_value()
+            if cell_types is None or cell_type in cell_types:
+                yield NotebookCell(index, cell_type, text, offset)
+
+
+def read_code_cells(source, chunk_size=CHUNK_SIZE):
+    """List the code cells of a notebook (see iter_cells)"""
+    return list(iter_cells(source, chunk_size=chunk_size))
+
+
+def slim_notebook(cells):
+    """Serialize cells as a minimal notebook, without outputs or metadata
+
+    Empty markdown cells stand in for the cells that were left out, so cell
+    indices stay the same as in the original notebook.
+    """
+    slim = []
+    for cell in cells:
+        while len(slim) < cell.index:
+            slim.append({'cell_type': 'markdown', 'metadata': {}, 'source': ''})
+        slim.append({'cell_type': cell.cell_type, 'metadata': {}, 'source': cell.source})
+    return json.dumps({'cells': slim, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 4}, indent=1)
+
+
+class CellCache:
+    """Bounded LRU map from a cell's source to a value computed from it
+
+    Lets notebook consumers redo work only for the cells that changed.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(source):
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def __contains__(self, source):
+        with self._lock:
+            return self.digest(source) in self._entries
+
+    def get(self, source, compute):
+        """Return the cached value for source, computing and storing it on a miss"""
+        key = self.digest(source)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute(source)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
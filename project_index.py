@@ -0,0 +1,653 @@
+"""Cross-file index of definitions, imports and calls for a whole source tree.
+
+Usage:
+    python project_index.py ROOT [--db PATH] [--callers NAME] [--callees NAME]
+                                 [--deps PACKAGE] [--diagram OUT.mmd [--package PACKAGE]]
+                                 [--metrics PACKAGE]
+
+The index is an SQLite database. Each run re-parses only files whose mtime or
+size changed and whose content hash differs, so updating it after a small edit
+takes a fraction of a second even for large repositories.
+"""
+import argparse
+import ast
+import bisect
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import SKIP_DIRS, SUPPORTED_EXTENSIONS
+from code_parser import CELL_SEPARATOR, METRIC_COLUMNS, CodeParser, MetricsTable
+from cpp_lexer import CPP_KEYWORDS, CppScanner, tokenize
+from notebook_reader import NotebookFormatError, read_code_cells
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'codetodiagram-index')
+
+# Bump whenever the schema or what the extractors record changes; older indexes are rebuilt
+INDEX_VERSION = 3
+
+# Re-parse in a process pool once at least this many files changed
+POOL_THRESHOLD = 64
+
+SCHEMA = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    module TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX files_module ON files(module);
+CREATE TABLE symbols (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    qualname TEXT NOT NULL,
+    parent TEXT,
+    line INTEGER,
+    end_line INTEGER
+);
+CREATE INDEX symbols_name ON symbols(name);
+CREATE INDEX symbols_qualname ON symbols(qualname);
+CREATE INDEX symbols_file ON symbols(file_id, name);
+CREATE TABLE imports (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    module TEXT NOT NULL
+);
+CREATE INDEX imports_file ON imports(file_id);
+CREATE TABLE calls (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    caller TEXT NOT NULL,
+    callee TEXT NOT NULL,
+    name TEXT NOT NULL,
+    line INTEGER
+);
+CREATE INDEX calls_name ON calls(name);
+CREATE INDEX calls_file ON calls(file_id, caller);
+CREATE TABLE metrics (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    qualname TEXT NOT NULL,
+    complexity INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    loc INTEGER NOT NULL,
+    fan_out INTEGER NOT NULL
+);
+CREATE INDEX metrics_file ON metrics(file_id);
+"""
+
+_MAGIC_LINE = re.compile(r'^[ \t]*[%!].*$', re.MULTILINE)
+
+
+def module_name(rel_path):
+    """Import name of a Python file or notebook ('pkg/mod.py' -> 'pkg.mod'); C++ files keep their path"""
+    stem, ext = os.path.splitext(rel_path.replace(os.sep, '/'))
+    if ext == '.cpp':
+        return stem
+    parts = stem.split('/')
+    if parts[-1] == '__init__' and len(parts) > 1:
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _callee(func):
+    """Dotted text of a call target ('self.save', 'os.path.join'), or just its name"""
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if isinstance(func, ast.Name):
+        parts.append(func.id)
+    return '.'.join(reversed(parts)) or None
+
+
+class _CallVisitor(ast.NodeVisitor):
+    """Collect (caller qualname, callee, name, line) with the same scoping as the structure parser
+
+    Also collects imports: 'a.b' for `import a.b` and 'pkg:b' for
+    `from pkg import b`, since b may be a submodule or a name defined in pkg.
+    Relative imports keep their leading dots ('.:b', '..util:x').
+    """
+
+    def __init__(self, line_offset=0):
+        self.calls = []
+        self.imports = set()
+        self.line_offset = line_offset
+        self._scope = []
+
+    def visit_Import(self, node):
+        self.imports.update(alias.name for alias in node.names)
+
+    def visit_ImportFrom(self, node):
+        base = '.' * node.level + (node.module or '')
+        self.imports.update(base if alias.name == '*' else f"{base}:{alias.name}" for alias in node.names)
+
+    def visit_FunctionDef(self, node):
+        self._scope.append(node.name)
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        callee = _callee(node.func)
+        if callee:
+            caller = '.'.join(self._scope) or '<module>'
+            self.calls.append((caller, callee, callee.rsplit('.', 1)[-1], node.lineno + self.line_offset))
+        self.generic_visit(node)
+
+
+def _python_references(code, line_offset=0):
+    """(calls, import candidates) of Python code"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return [], set()
+    visitor = _CallVisitor(line_offset)
+    visitor.visit(tree)
+    return visitor.calls, visitor.imports
+
+
+def _cpp_calls(code):
+    newlines = [m.start() for m in re.finditer('\n', code)]
+    calls = []
+    for func in CppScanner(code).scan().functions:
+        start, end = func['body']
+        toks = tokenize(code, start, end, bisect.bisect_left(newlines, start) + 1)
+        for i in range(len(toks) - 1):
+            kind, text, line = toks[i]
+            if kind != 'word' or text in CPP_KEYWORDS or toks[i + 1][1] != '(':
+                continue
+            callee = text
+            if i >= 2 and toks[i - 1][1] in ('.', '->', '::') and toks[i - 2][0] == 'word':
+                callee = f"{toks[i - 2][1]}{toks[i - 1][1]}{text}"
+            calls.append((func['qualname'], callee, text, line))
+    return calls
+
+
+def extract(job):
+    """Hash and index one file (runs in a worker process)
+
+    Returns None when the content hash is unchanged, else the rows to store.
+    A file that can't be read or indexed at all (e.g. a RecursionError from a
+    deeply nested expression) still gets a files row, with only its error set.
+    """
+    root, rel_path, known_hash = job
+    try:
+        with open(os.path.join(root, rel_path), 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return _failed(rel_path, '', e)
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash == known_hash:
+        return None
+    try:
+        return _index(rel_path, data, content_hash)
+    except Exception as e:
+        return _failed(rel_path, content_hash, e)
+
+
+def _failed(rel_path, content_hash, e):
+    return {
+        'path': rel_path,
+        'module': module_name(rel_path),
+        'file_type': rel_path.rsplit('.', 1)[-1],
+        'hash': content_hash,
+        'error': f"{type(e).__name__}: {e}",
+        'symbols': [],
+        'imports': [],
+        'calls': [],
+        'metrics': []
+    }
+
+
+def _index(rel_path, data, content_hash):
+    file_type = rel_path.rsplit('.', 1)[-1]
+    parser = CodeParser()
+    if file_type == 'ipynb':
+        try:
+            cells = read_code_cells(data)
+        except NotebookFormatError:
+            cells = []
+        structure = parser.parse_cells(cells)
+        calls = []
+        imports = set()
+        line = 1
+        for cell in cells:
+            # Magics are blanked so the cell still parses and keeps its line numbers
+            cell_calls, cell_imports = _python_references(_MAGIC_LINE.sub('', cell.source), line - 1)
+            calls.extend(cell_calls)
+            imports.update(cell_imports)
+            line += cell.source.count('\n') + CELL_SEPARATOR.count('\n')
+        if not cells:
+            structure['error'] = 'Invalid Jupyter notebook format'
+    else:
+        content = data.decode('utf-8', errors='replace')
+        structure = parser.parse_file(content, file_type)
+        if file_type == 'py':
+            calls, imports = _python_references(content)
+        else:
+            calls = _cpp_calls(content)
+            imports = {os.path.splitext(p)[0] for p in structure.get('includes', [])}
+
+    symbols = [('class', r.name, r.qualname, r.parent, r.line, r.end_line) for r in structure['classes']]
+    symbols += [('function', r.name, r.qualname, r.parent, r.line, r.end_line) for r in structure['functions']]
+    symbols += [('method', r.name, r.qualname, r.parent, r.line, r.end_line) for r in structure['methods']]
+    metrics = MetricsTable.from_rows(structure.get('metrics', []))
+    return {
+        'path': rel_path,
+        'module': module_name(rel_path),
+        'file_type': file_type,
+        'hash': content_hash,
+        'error': structure.get('error'),
+        'symbols': symbols,
+        'imports': sorted(imports),
+        'calls': calls,
+        'metrics': list(zip(metrics.qualnames, *(getattr(metrics, column) for column in METRIC_COLUMNS)))
+    }
+
+
+class ProjectIndex:
+    """SQLite index of the functions, classes, imports and calls of every file under root"""
+
+    def __init__(self, root, db_path=None):
+        self.root = os.path.abspath(root)
+        if db_path is None:
+            index_dir = os.getenv('CODETODIAGRAM_INDEX_DIR', DEFAULT_INDEX_DIR)
+            os.makedirs(index_dir, exist_ok=True)
+            db_path = os.path.join(index_dir, hashlib.sha256(self.root.encode()).hexdigest()[:16] + '.sqlite')
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+            self._create()
+
+    def close(self):
+        self.db.close()
+
+    def _create(self):
+        with self.db:
+            for (table,) in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                self.db.execute(f'DROP TABLE "{table}"')
+            self.db.executescript(SCHEMA)
+            self.db.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    def scan(self):
+        """Yield (relative path, stat) of every supported file under root"""
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.rsplit('.', 1)[-1] in SUPPORTED_EXTENSIONS:
+                    try:
+                        yield os.path.relpath(entry.path, self.root), entry.stat()
+                    except OSError:
+                        continue
+
+    def update(self, workers=None):
+        """Bring the index up to date with the files on disk
+
+        Files whose mtime and size are unchanged are not opened; changed ones
+        are re-parsed only if their content hash differs. Returns counts of
+        'files', 'parsed', 'touched' (same content, new mtime) and 'removed'.
+        """
+        start = time.perf_counter()
+        known = {path: (file_id, mtime_ns, size, content_hash) for file_id, path, mtime_ns, size, content_hash
+                 in self.db.execute('SELECT id, path, mtime_ns, size, hash FROM files')}
+        stats = {'files': 0, 'parsed': 0, 'touched': 0, 'removed': 0}
+        seen = set()
+        changed = {}
+        for rel_path, st in self.scan():
+            seen.add(rel_path)
+            row = known.get(rel_path)
+            if row is None or row[1] != st.st_mtime_ns or row[2] != st.st_size:
+                changed[rel_path] = st
+        stats['files'] = len(seen)
+
+        jobs = [(self.root, rel_path, known[rel_path][3] if rel_path in known else None) for rel_path in changed]
+        if len(jobs) >= POOL_THRESHOLD and workers != 0:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(extract, jobs, chunksize=16))
+        else:
+            results = [extract(job) for job in jobs]
+
+        with self.db:
+            for rel_path in set(known) - seen:
+                self.db.execute('DELETE FROM files WHERE id = ?', (known[rel_path][0],))
+                stats['removed'] += 1
+            for (_, rel_path, _), result in zip(jobs, results):
+                st = changed[rel_path]
+                if result is None:
+                    self.db.execute('UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?',
+                                    (st.st_mtime_ns, st.st_size, rel_path))
+                    stats['touched'] += 1
+                    continue
+                self._store(result, st, known.get(rel_path))
+                stats['parsed'] += 1
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        return stats
+
+    def _store(self, result, st, row):
+        if row is not None:
+            self.db.execute('DELETE FROM files WHERE id = ?', (row[0],))
+        file_id = self.db.execute(
+            'INSERT INTO files (path, module, file_type, mtime_ns, size, hash, error) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (result['path'], result['module'], result['file_type'], st.st_mtime_ns, st.st_size, result['hash'],
+             result['error'])
+        ).lastrowid
+        self.db.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            [(file_id, *symbol) for symbol in result['symbols']])
+        self.db.executemany('INSERT INTO imports VALUES (?, ?)', [(file_id, m) for m in result['imports']])
+        self.db.executemany('INSERT INTO calls VALUES (?, ?, ?, ?, ?)',
+                            [(file_id, *call) for call in result['calls']])
+        self.db.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+                            [(file_id, *row) for row in result['metrics']])
+
+    # --- queries ---
+
+    def find(self, name):
+        """Definitions matching a name, qualified name or module-qualified name"""
+        rows = self.db.execute(
+            'SELECT f.id, f.path, f.module, f.file_type, s.kind, s.name, s.qualname, s.line FROM symbols s '
+            "JOIN files f ON f.id = s.file_id WHERE s.name = ? OR s.qualname = ? OR f.module || '.' || s.qualname = ?",
+            (name.rsplit('.', 1)[-1].rsplit('::', 1)[-1], name, name)
+        ).fetchall()
+        return [
+            {'file_id': r[0], 'file': r[1], 'module': r[2], 'file_type': r[3], 'kind': r[4], 'name': r[5],
+             'qualname': r[6], 'line': r[7]}
+            for r in rows if name in (r[5], r[6], f"{r[2]}.{r[6]}")
+        ]
+
+    def _resolve_modules(self, file_id, path, module, file_type, imports, modules):
+        """Indexed modules that a file's imports (or C++ includes) refer to"""
+        targets = set()
+        # A package's __init__ is its own package for relative imports
+        package = module if os.path.basename(path).startswith('__init__.') else module.rpartition('.')[0]
+        for name in imports:
+            if file_type == 'cpp':
+                stem = name.rsplit('/', 1)[-1]
+                targets.update(m for m in modules.get(stem, ())
+                               if (m == name or m.endswith(f"/{name}")) and m != module)
+                continue
+            name, _, member = name.partition(':')
+            if not name.startswith('.'):
+                full = name
+                target = self._lookup(name, modules)
+            else:
+                rest = name.lstrip('.')
+                base = package
+                for _ in range(len(name) - len(rest) - 1):
+                    base = base.rpartition('.')[0]
+                if not base:
+                    continue
+                full = f"{base}.{rest}" if rest else base
+                target = self._lookup(full, modules)
+                # '.missing' must not fall back to the package that contains it
+                if target == base and full != base:
+                    target = None
+            # `from x import y` hits the submodule x.y when there is one, else x itself
+            if member and f"{full}.{member}" in modules.get(member, ()):
+                target = f"{full}.{member}"
+            if target and target != module:
+                targets.add(target)
+        return targets
+
+    @staticmethod
+    def _lookup(name, modules):
+        """The longest indexed module that `name` is or lies inside"""
+        while name:
+            if name in modules.get(name.rsplit('.', 1)[-1], ()):
+                return name
+            name = name.rsplit('.', 1)[0] if '.' in name else None
+        return None
+
+    def _module_table(self):
+        """Indexed module names, grouped by their last component for fast lookups"""
+        modules = {}
+        for (module,) in self.db.execute('SELECT module FROM files'):
+            modules.setdefault(re.split(r'[./]', module)[-1], set()).add(module)
+        return modules
+
+    def _dependencies(self, file_ids=None):
+        """{file id: set of indexed modules it imports}"""
+        query = ('SELECT f.id, f.path, f.module, f.file_type, i.module FROM files f '
+                 'JOIN imports i ON i.file_id = f.id')
+        params = ()
+        if file_ids is not None:
+            query += f" WHERE f.id IN ({','.join('?' * len(file_ids))})"
+            params = tuple(file_ids)
+        imports = {}
+        for file_id, path, module, file_type, name in self.db.execute(query, params):
+            imports.setdefault((file_id, path, module, file_type), []).append(name)
+        modules = self._module_table()
+        return {key[0]: self._resolve_modules(*key, names, modules) for key, names in imports.items()}
+
+    def callers(self, name):
+        """Calls, anywhere in the tree, that resolve to the definition(s) named `name`
+
+        A call resolves to a definition in the same file, or in a module the
+        calling file imports (any file for C++). Bare calls don't match methods,
+        self.x doesn't match free functions, and self.x resolves only to the
+        caller's own method when its class defines x.
+        """
+        targets = self.find(name)
+        if not targets:
+            return []
+        rows = self.db.execute(
+            f"SELECT c.file_id, f.path, f.file_type, c.caller, c.callee, c.name, c.line FROM calls c "
+            f"JOIN files f ON f.id = c.file_id WHERE c.name IN ({','.join('?' * len(targets))})",
+            tuple(t['name'] for t in targets)
+        ).fetchall()
+        deps = self._dependencies({row[0] for row in rows})
+        methods = self._methods({row[0] for row in rows}, {t['name'] for t in targets})
+        result = []
+        for file_id, path, file_type, caller, callee, call_name, line in rows:
+            own = self._own_method(file_id, caller, callee, methods)
+            for target in targets:
+                if target['name'] == call_name and self._reaches(file_id, file_type, callee, target, deps, own):
+                    result.append({'file': path, 'caller': caller, 'line': line, 'callee': callee,
+                                   'target': target['qualname'], 'target_file': target['file']})
+        return sorted(result, key=lambda r: (r['file'], r['line']))
+
+    def callees(self, name):
+        """Calls made by the definition(s) named `name`, with the definitions they resolve to"""
+        result = []
+        for source in self.find(name):
+            rows = self.db.execute('SELECT callee, name, line FROM calls WHERE file_id = ? AND caller = ? '
+                                   'ORDER BY line', (source['file_id'], source['qualname'])).fetchall()
+            deps = self._dependencies([source['file_id']])
+            methods = self._methods([source['file_id']], {row[1] for row in rows})
+            for callee, call_name, line in rows:
+                own = self._own_method(source['file_id'], source['qualname'], callee, methods)
+                resolved = [t for t in self.find(call_name)
+                            if self._reaches(source['file_id'], source['file_type'], callee, t, deps, own)]
+                result.append({'caller': source['qualname'], 'file': source['file'], 'line': line,
+                               'callee': callee, 'targets': [f"{t['module']}.{t['qualname']}" for t in resolved]})
+        return result
+
+    def _methods(self, file_ids, names):
+        """{(file id, qualname)} of the methods called `names` defined in those files"""
+        file_ids, names = tuple(file_ids), tuple(names)
+        if not file_ids or not names:
+            return set()
+        return set(self.db.execute(
+            f"SELECT file_id, qualname FROM symbols WHERE kind = 'method' "
+            f"AND file_id IN ({','.join('?' * len(file_ids))}) AND name IN ({','.join('?' * len(names))})",
+            file_ids + names
+        ).fetchall())
+
+    @staticmethod
+    def _own_method(file_id, caller, callee, methods):
+        """Qualname of the method a self.x / cls.x call hits when the caller's own class defines x"""
+        if not callee.startswith(('self.', 'cls.')) or callee.count('.') != 1 or '.' not in caller:
+            return None
+        qualname = f"{caller.rsplit('.', 1)[0]}.{callee.split('.', 1)[1]}"
+        return qualname if (file_id, qualname) in methods else None
+
+    @staticmethod
+    def _reaches(file_id, file_type, callee, target, deps, own=None):
+        if own is not None:
+            return target['file_id'] == file_id and target['qualname'] == own
+        if file_type == 'py' or file_type == 'ipynb':
+            dotted = '.' in callee
+            if target['kind'] == 'method' and not dotted:
+                return False
+            if target['kind'] != 'method' and callee.startswith(('self.', 'cls.')):
+                return False
+        if target['file_id'] == file_id:
+            return True
+        if file_type == 'cpp':
+            return target['file_type'] == 'cpp'
+        return target['module'] in deps.get(file_id, ())
+
+    def module_graph(self, package=None):
+        """Modules (optionally only those in `package`) and their internal import edges
+
+        Returns {'modules': [...], 'edges': [(importer, imported, calls)]}, where
+        calls counts the importer's calls to names defined in the imported module.
+        """
+        files = self.db.execute('SELECT id, module FROM files ORDER BY module').fetchall()
+        if package:
+            files = [(i, m) for i, m in files if m == package or m.startswith((f"{package}.", f"{package}/"))]
+        ids = {module: file_id for file_id, module in files}
+        deps = self._dependencies([file_id for file_id, _ in files]) if files else {}
+
+        edges = {}
+        pairs = [(src, ids[dst]) for src, targets in deps.items() for dst in targets if dst in ids]
+        if pairs:
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS deps (src INTEGER, dst INTEGER)')
+            self.db.execute('DELETE FROM deps')
+            self.db.executemany('INSERT INTO deps VALUES (?, ?)', pairs)
+            counts = dict(((src, dst), n) for src, dst, n in self.db.execute(
+                'SELECT d.src, d.dst, COUNT(*) FROM deps d JOIN calls c ON c.file_id = d.src '
+                'JOIN symbols s ON s.file_id = d.dst AND s.name = c.name GROUP BY d.src, d.dst'))
+            names = {file_id: module for module, file_id in ids.items()}
+            for src, dst in pairs:
+                edges[(names[src], names[dst])] = counts.get((src, dst), 0)
+        return {'modules': [module for _, module in files],
+                'edges': [(src, dst, n) for (src, dst), n in sorted(edges.items())]}
+
+    def metrics(self, package=None):
+        """Per-function metrics of every indexed file (or those in `package`) as a RepoMetrics"""
+        from repo_metrics import RepoMetrics
+        query = ('SELECT f.path, m.qualname, m.complexity, m.depth, m.loc, m.fan_out '
+                 'FROM metrics m JOIN files f ON f.id = m.file_id')
+        params = ()
+        if package:
+            query += ' WHERE f.module = ? OR f.module LIKE ? OR f.module LIKE ?'
+            params = (package, f"{package}.%", f"{package}/%")
+        return RepoMetrics.from_rows(self.db.execute(query + ' ORDER BY f.path', params))
+
+    def repository_diagram(self, package=None):
+        """Mermaid flowchart of the module dependency graph, one subgraph per package"""
+        graph = self.module_graph(package)
+        node_ids = {module: f"m{i}" for i, module in enumerate(graph['modules'])}
+        packages = {}
+        for module in graph['modules']:
+            parent = re.split(r'[./](?=[^./]*$)', module)[0] if re.search(r'[./]', module) else ''
+            packages.setdefault(parent, []).append(module)
+
+        def label(text):
+            return '"' + text.replace('"', '#quot;') + '"'
+
+        lines = ["flowchart LR"]
+        if not node_ids:
+            lines.append('    empty(["No modules indexed"])')
+        for i, (parent, modules) in enumerate(sorted(packages.items())):
+            indent = "    "
+            if parent:
+                lines.append(f"    subgraph p{i}[{label(parent)}]")
+                indent = "        "
+            for module in modules:
+                lines.append(f"{indent}{node_ids[module]}[{label(re.split(r'[./]', module)[-1])}]")
+            if parent:
+                lines.append("    end")
+        for src, dst, calls in graph['edges']:
+            if calls:
+                lines.append(f'    {node_ids[src]} -->|"{calls} calls"| {node_ids[dst]}')
+            else:
+                lines.append(f"    {node_ids[src]} -.-> {node_ids[dst]}")
+        return "\n".join(lines)
+
+
+def print_metrics(metrics, top=15):
+    summary = metrics.summarize()
+    print(f"{summary['functions']} functions")
+    if not summary['functions']:
+        return
+    print(f"{'':12}{'mean':>8}" + ''.join(f"{f'p{p}':>8}" for p in next(iter(summary['percentiles'].values())))
+          + f"{'max':>8}")
+    for column in METRIC_COLUMNS:
+        print(f"{column:12}{summary['mean'][column]:>8}"
+              + ''.join(f"{value:>8g}" for value in summary['percentiles'][column].values())
+              + f"{summary['max'][column]:>8}")
+
+    print("\nHotspots:")
+    for row in metrics.hotspots(top):
+        print(f"  {row['complexity']:>4}  {row['file']}  {row['qualname']}  "
+              f"(depth {row['depth']}, {row['loc']} lines, {row['fan_out']} callees)")
+
+    heatmap = metrics.heatmap()
+    width = max(len(group) for group in heatmap['groups'])
+    print(f"\nFunctions by complexity:\n  {'':{width}}" + ''.join(f"{band:>8}" for band in heatmap['bands']))
+    for group, counts in zip(heatmap['groups'], heatmap['counts']):
+        print(f"  {group:{width}}" + ''.join(f"{n:>8}" for n in counts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a source tree and query its symbols and call graph")
+    parser.add_argument('root', help="directory to index")
+    parser.add_argument('--db', default=None, help="index file (default: one per root under ~/.cache)")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes for large updates")
+    parser.add_argument('--callers', metavar='NAME', help="list calls that resolve to NAME")
+    parser.add_argument('--callees', metavar='NAME', help="list calls made by NAME")
+    parser.add_argument('--deps', metavar='PACKAGE', nargs='?', const='',
+                        help="print the module dependency graph (of PACKAGE)")
+    parser.add_argument('--diagram', metavar='OUT', help="write a repository-level Mermaid diagram to OUT")
+    parser.add_argument('--package', default=None, help="limit --diagram to one package")
+    parser.add_argument('--metrics', metavar='PACKAGE', nargs='?', const='',
+                        help="print complexity percentiles, hotspots and a heatmap (of PACKAGE)")
+    args = parser.parse_args(argv)
+
+    index = ProjectIndex(args.root, args.db)
+    try:
+        stats = index.update(workers=args.workers)
+        print(f"Indexed {stats['files']} files: {stats['parsed']} parsed, {stats['touched']} touched, "
+              f"{stats['removed']} removed in {stats['seconds']}s", file=sys.stderr)
+
+        if args.callers:
+            for call in index.callers(args.callers):
+                print(f"{call['file']}:{call['line']}  {call['caller']} -> {call['callee']}  ({call['target']})")
+        if args.callees:
+            for call in index.callees(args.callees):
+                print(f"{call['file']}:{call['line']}  {call['callee']}  -> {', '.join(call['targets']) or '?'}")
+        if args.deps is not None:
+            for src, dst, calls in index.module_graph(args.deps or None)['edges']:
+                print(f"{src} -> {dst}" + (f"  ({calls} calls)" if calls else ""))
+        if args.diagram:
+            with open(args.diagram, 'w', encoding='utf-8') as f:
+                f.write(index.repository_diagram(args.package))
+        if args.metrics is not None:
+            print_metrics(index.metrics(args.metrics or None))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+from array import array
+
+import numpy as np
+
+from code_parser import METRIC_COLUMNS
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Lower bounds of the heatmap's complexity bands after the first (1-5 simple ... 51+ untestable)
+COMPLEXITY_BANDS = (6, 11, 21, 51)
+BAND_LABELS = ('1-5', '6-10', '11-20', '21-50', '51+')
+
+
+class RepoMetrics:
+    """Per-function metrics of a whole repository as NumPy columns
+
+    Rows are functions; `files` holds each distinct file path once and
+    `file_index` the row's position in it, so grouping by directory works on
+    integer arrays. `values` is an (n, 4) array in METRIC_COLUMNS order.
+    """
+
+    def __init__(self, files, file_index, qualnames, values):
+        self.files = files
+        self.file_index = file_index
+        self.qualnames = qualnames
+        self.values = values
+
+    @classmethod
+    def from_tables(cls, tables):
+        """From {path: MetricsTable}
+
+        Each column is joined as one array('I') and viewed by NumPy without a
+        copy, which beats one frombuffer call per file when files are small.
+        """
+        files = list(tables)
+        counts = [len(tables[path]) for path in files]
+        columns = []
+        for column in METRIC_COLUMNS:
+            joined = array('I')
+            for path in files:
+                joined.extend(getattr(tables[path], column))
+            columns.append(np.frombuffer(joined, dtype=np.uint32) if joined else np.zeros(0, dtype=np.uint32))
+        qualnames = [name for path in files for name in tables[path].qualnames]
+        file_index = np.repeat(np.arange(len(files)), counts)
+        return cls(files, file_index, qualnames, np.stack(columns, axis=1))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From (path, qualname, complexity, depth, loc, fan_out) rows, grouped by path"""
+        files = []
+        positions = {}
+        index = []
+        qualnames = []
+        values = []
+        for path, qualname, *metrics in rows:
+            position = positions.get(path)
+            if position is None:
+                position = positions[path] = len(files)
+                files.append(path)
+            index.append(position)
+            qualnames.append(qualname)
+            values.extend(metrics)
+        values = np.array(values, dtype=np.uint32).reshape(-1, len(METRIC_COLUMNS))
+        return cls(files, np.array(index, dtype=np.intp), qualnames, values)
+
+    def __len__(self):
+        return len(self.qualnames)
+
+    def column(self, name):
+        return self.values[:, METRIC_COLUMNS.index(name)]
+
+    def summarize(self):
+        """{'functions', 'percentiles': {column: {p: value}}, 'mean': {...}, 'max': {...}}"""
+        if not len(self):
+            return {'functions': 0, 'percentiles': {}, 'mean': {}, 'max': {}}
+        percentiles = np.percentile(self.values, PERCENTILES, axis=0)
+        means = self.values.mean(axis=0)
+        maxima = self.values.max(axis=0)
+        return {
+            'functions': len(self),
+            'percentiles': {column: {p: float(percentiles[i, c]) for i, p in enumerate(PERCENTILES)}
+                            for c, column in enumerate(METRIC_COLUMNS)},
+            'mean': {column: round(float(means[c]), 2) for c, column in enumerate(METRIC_COLUMNS)},
+            'max': {column: int(maxima[c]) for c, column in enumerate(METRIC_COLUMNS)},
+        }
+
+    def hotspots(self, top=20):
+        """The `top` most complex functions, ties broken by nesting depth and then length"""
+        if not len(self):
+            return []
+        values = self.values.astype(np.int64)
+        # lexsort sorts by its last key first; negated keys give descending order
+        order = np.lexsort((-values[:, 2], -values[:, 1], -values[:, 0]))[:top]
+        return [dict(file=self.files[self.file_index[i]], qualname=self.qualnames[i],
+                     **{column: int(values[i, c]) for c, column in enumerate(METRIC_COLUMNS)})
+                for i in order.tolist()]
+
+    def heatmap(self, level=1):
+        """Function counts per directory and complexity band
+
+        Files are grouped by their first `level` directories ('.' for files at
+        the top). Returns {'groups', 'bands', 'counts'}, counts being one row
+        of BAND_LABELS-many counts per group.
+        """
+        if not len(self):
+            return {'groups': [], 'bands': list(BAND_LABELS), 'counts': []}
+        directories = ['/'.join(path.replace('\\', '/').split('/')[:-1][:level]) or '.' for path in self.files]
+        groups, file_group = np.unique(directories, return_inverse=True)
+        row_group = file_group.reshape(-1)[self.file_index]
+        bands = np.digitize(self.column('complexity'), COMPLEXITY_BANDS)
+        counts = np.bincount(row_group * len(BAND_LABELS) + bands, minlength=len(groups) * len(BAND_LABELS))
+        return {'groups': groups.tolist(), 'bands': list(BAND_LABELS),
+                'counts': counts.reshape(len(groups), len(BAND_LABELS)).tolist()}
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'codetodiagram')
+
+
+class ResultCache:
+    """Content-addressed on-disk cache for generated diagrams and summaries"""
+
+    def __init__(self, cache_dir=None, max_bytes=64 * 1024 * 1024, max_age=7 * 24 * 3600):
+        """Open (or create) the cache directory and index its entries"""
+        self.cache_dir = cache_dir or os.getenv('CODETODIAGRAM_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}  # key -> [size, last_access, created]
+        self._total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the prompt inputs into a stable cache key"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # Expire entries older than max_age
+            if self.max_age and time.time() - entry[2] > self.max_age:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)['value']
+            except (OSError, ValueError, KeyError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # Touch the entry so eviction is least-recently-used
+            entry[1] = time.time()
+            try:
+                os.utime(self._path(key), (entry[1], entry[2]))
+            except OSError:
+                pass
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a JSON-serializable value under key"""
+        now = time.time()
+        data = json.dumps({'value': value}).encode('utf-8')
+        path = self._path(key)
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            os.utime(path, (now, now))
+
+            if key in self._index:
+                self._total_bytes -= self._index[key][0]
+            self._index[key] = [len(data), now, now]
+            self._total_bytes += len(data)
+            self._evict()
+
+    def invalidate(self, key=None):
+        """Drop a single entry, or the whole cache when key is None"""
+        with self._lock:
+            keys = [key] if key is not None else list(self._index)
+            for k in keys:
+                if k in self._index:
+                    self._remove(k)
+
+    def stats(self):
+        """Return hit/miss counters and current cache size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._index),
+                'bytes': self._total_bytes
+            }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the in-memory index from the files on disk"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                # atime holds the last access, mtime the creation time
+                self._index[name[:-5]] = [st.st_size, st.st_atime, st.st_mtime]
+                self._total_bytes += st.st_size
+
+    def _remove(self, key):
+        size = self._index.pop(key)[0]
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop expired entries, then least-recently-used ones until under max_bytes"""
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            for key in [k for k, e in self._index.items() if e[2] < cutoff]:
+                self._remove(key)
+
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self._index, key=lambda k: self._index[k][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
@@ -0,0 +1,262 @@
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+import instrumentation
+
+# Process-wide Gemini budget; 0 requests per minute means unlimited
+DEFAULT_RPM = float(os.getenv('CODETODIAGRAM_GEMINI_RPM', '60'))
+DEFAULT_BURST = int(os.getenv('CODETODIAGRAM_GEMINI_BURST', '4'))
+
+# Priority lanes: lower runs first
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+# Quota exhausted or a transient server error; anything else is returned to the caller at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+
+_STATUS_PREFIX = re.compile(r'^\s*(\d{3})\b')
+
+
+def retry_status(error):
+    """HTTP status of a retryable API error, or None
+
+    google.api_core errors carry the status in `code` and start their
+    message with it ("429 Resource has been exhausted"); both are checked so
+    other clients and test stubs can signal the same way.
+    """
+    for attr in ('code', 'status_code'):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code if code in RETRY_STATUSES else None
+    match = _STATUS_PREFIX.match(str(error))
+    if match and int(match.group(1)) in RETRY_STATUSES:
+        return int(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Allow `rate_per_minute` calls on average, with bursts of up to `burst`"""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self._lock = threading.Lock()
+        self.paused_until = 0.0
+        self.set_rate(rate_per_minute, burst)
+
+    def set_rate(self, rate_per_minute, burst=None):
+        with self._lock:
+            self.rate = rate_per_minute / 60.0
+            if burst is not None:
+                self.capacity = max(1, burst)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+
+    def try_take(self):
+        """Take a token and return 0, or return the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.rate <= 0:
+                return 0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds` (e.g. after the API reports exhausted quota)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class _Flight:
+    """One upstream call whose result or chunks are shared by every identical request"""
+
+    def __init__(self):
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.cond = threading.Condition()
+
+    def push(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def stream(self):
+        """Yield every chunk from the start, as they arrive"""
+        i = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: i < len(self.chunks) or self.done)
+                if i >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[i]
+            i += 1
+            yield chunk
+
+
+class Lane:
+    """Model-like view of a Scheduler that submits at a fixed priority"""
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.model_name = scheduler.model_name
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        return self.scheduler.generate_content(prompt, stream, request_options, priority=self.priority, **kwargs)
+
+
+class Scheduler:
+    """Shared front for a model's generate_content
+
+    Calls wait for a token-bucket permit, highest-priority lane first.
+    429 and 5xx errors are retried with jittered exponential backoff within the
+    request's timeout, and a 429 also pauses the bucket for every caller.
+    Identical prompts that are already in flight wait on that call instead of
+    making their own; streamed responses are replayed to each of them.
+    """
+
+    def __init__(self, model, rate_per_minute=DEFAULT_RPM, burst=DEFAULT_BURST, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.model = model
+        self.model_name = getattr(model, 'model_name', type(model).__name__)
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'calls': 0, 'coalesced': 0, 'retries': 0, 'failures': 0, 'queued_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._waiting = []
+        self._turn = threading.Condition()
+        self._seq = itertools.count()
+
+    def lane(self, priority):
+        return Lane(self, priority)
+
+    def set_rate(self, rate_per_minute, burst=None):
+        self.bucket.set_rate(rate_per_minute, burst)
+
+    def generate_content(self, prompt, stream=False, request_options=None, priority=INTERACTIVE, **kwargs):
+        """Same contract as the model's generate_content, scheduled and coalesced"""
+        key = self._key(prompt, stream, kwargs)
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+            else:
+                self.stats['coalesced'] += 1
+        if not leader:
+            instrumentation.event('coalesced', kind=LANE_NAMES.get(priority, str(priority)))
+            return flight.stream() if stream else flight.wait()
+
+        run = instrumentation.propagate(self._run)
+        args = (key, flight, prompt, stream, request_options, priority, kwargs)
+        if stream:
+            # Pump in the background so the call completes even if this consumer stops early
+            threading.Thread(target=run, args=args, name='gemini-stream', daemon=True).start()
+            return flight.stream()
+        run(*args)
+        return flight.wait()
+
+    def _run(self, key, flight, prompt, stream, request_options, priority, kwargs):
+        try:
+            timeout = (request_options or {}).get('timeout')
+            deadline = time.monotonic() + timeout if timeout else None
+            attempt = 0
+            while True:
+                self._acquire(priority)
+                try:
+                    with self._lock:
+                        self.stats['calls'] += 1
+                    response = self.model.generate_content(prompt, stream=stream, request_options=request_options,
+                                                           **kwargs)
+                    if not stream:
+                        flight.finish(result=response)
+                        return
+                    for chunk in response:
+                        flight.push(chunk)
+                    flight.finish()
+                    return
+                except Exception as e:
+                    status = retry_status(e)
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    # A partly delivered stream can't be replayed
+                    retryable = status is not None and not flight.chunks and attempt < self.max_retries
+                    if not retryable or (deadline is not None and time.monotonic() + delay > deadline):
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    instrumentation.event('retry', kind=LANE_NAMES.get(priority, str(priority)), reason=str(status))
+                    if status == 429:
+                        self.bucket.pause(delay)
+                    else:
+                        time.sleep(delay)
+        except Exception as e:
+            with self._lock:
+                self.stats['failures'] += 1
+            flight.finish(error=e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _acquire(self, priority):
+        """Block until this call holds a permit and no higher-priority call is waiting"""
+        start = time.monotonic()
+        ticket = (priority, next(self._seq))
+        with self._turn:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                if self._waiting[0] == ticket:
+                    wait = self.bucket.try_take()
+                    if not wait:
+                        heapq.heappop(self._waiting)
+                        self._turn.notify_all()
+                        break
+                    self._turn.wait(wait)
+                else:
+                    self._turn.wait()
+        waited = time.monotonic() - start
+        with self._lock:
+            self.stats['queued_seconds'] += waited
+        instrumentation.record('queue', waited, kind=LANE_NAMES.get(priority, str(priority)))
+
+    @staticmethod
+    def _key(prompt, stream, kwargs):
+        data = repr((prompt, stream, sorted(kwargs.items()))).encode('utf-8', errors='surrogatepass')
+        return hashlib.sha256(data).hexdigest()
+
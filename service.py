@@ -0,0 +1,656 @@
+"""Headless HTTP analysis service: parse, diagram and summarize code over a JSON API.
+
+Usage:
+    python service.py [--host HOST] [--port N] [--workers N] [--queue N] [--rpm N] [--stub]
+    python service.py --stub --rpm 0 --load-test 2000 [--concurrency 32]
+
+Endpoints:
+    POST /jobs               source in the body (?file_type=py&mode=ai&summary=1&name=x),
+                             or a JSON object {"content", "file_type" or "name", "mode", "summary"},
+                             summary being true/false or a string like the query parameter
+    POST /batches            a .zip, .tar, .tar.gz/.bz2/.xz archive; one job per supported file
+    GET  /jobs/ID            job status, and its result once done
+    GET  /jobs/ID/events     the job's progress as server-sent events, until it finishes
+    GET  /batches/ID         status of every job of a batch (?results=1 to include them)
+    GET  /health, /metrics   queue statistics; Prometheus metrics
+
+Jobs run on a fixed pool of worker threads fed by a bounded queue. When the
+queue is full, submissions get 503 with Retry-After instead of piling up.
+Submitting content that is already queued, running or done returns that job.
+"""
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import os
+import queue
+import secrets
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import instrumentation
+from batch import SKIP_DIRS, SUPPORTED_EXTENSIONS
+from code_parser import CodeParser
+from notebook_reader import NotebookFormatError, read_code_cells, slim_notebook
+
+SERVICE_PORT = int(os.getenv('CODETODIAGRAM_SERVICE_PORT', '8765'))
+SERVICE_WORKERS = int(os.getenv('CODETODIAGRAM_SERVICE_WORKERS', '4'))
+QUEUE_SIZE = int(os.getenv('CODETODIAGRAM_SERVICE_QUEUE', '64'))
+
+# Request bodies above this are refused unread; decompressed uploads may grow to MAX_EXTRACTED_BYTES
+MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+MAX_EXTRACTED_BYTES = 128 * 1024 * 1024
+MAX_BATCH_FILES = 5000
+
+# Finished jobs (and batches) kept for polling and deduplication; the oldest are dropped first
+RETAINED_JOBS = 10000
+RETAINED_BATCHES = 1000
+
+# Seconds suggested to a client whose submission was refused because the queue was full
+RETRY_AFTER = 1
+# Streams send a comment this often while nothing happens, so dead connections are noticed
+HEARTBEAT_SECONDS = 15
+
+DIAGRAM_MODES = ('local', 'ai', 'refine')
+FINISHED = ('done', 'failed')
+
+
+class ServiceBusy(Exception):
+    """The job queue has no room for the submission"""
+
+
+def _flag(value):
+    """A yes/no request option given as a JSON bool or a query-style string ('0'/'false' are no)"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() not in ('0', 'false')
+    raise TypeError(f"expected true, false or a string, got {value!r}")
+
+
+class Job:
+    """One analysis request, its progress events and its result"""
+
+    def __init__(self, key, name, file_type, content, mode, summary):
+        self.id = secrets.token_hex(8)
+        self.key = key
+        self.name = name
+        self.file_type = file_type
+        self.content = content
+        self.mode = mode
+        self.summary = summary
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    def emit(self, kind, data=None):
+        with self._changed:
+            self.events.append((kind, data))
+            if kind in ('running',) + FINISHED:
+                self.status = kind
+            self._changed.notify_all()
+
+    def finish(self):
+        """Set the final status from `error` and emit it with the finished job"""
+        with self._changed:
+            self.status = 'failed' if self.error else 'done'
+            self.events.append((self.status, self.to_dict()))
+            self._changed.notify_all()
+
+    def follow(self, start=0, heartbeat=HEARTBEAT_SECONDS):
+        """Yield events from index `start` as they happen until the job finishes; None as a heartbeat"""
+        index = start
+        while True:
+            with self._changed:
+                if index >= len(self.events) and self.status not in FINISHED:
+                    self._changed.wait(heartbeat)
+                new = self.events[index:]
+                finished = self.status in FINISHED
+            if not new:
+                if finished:
+                    return
+                yield None
+            for event in new:
+                yield event
+            index += len(new)
+
+    def to_dict(self, result=True):
+        job = {
+            'id': self.id,
+            'name': self.name,
+            'file_type': self.file_type,
+            'mode': self.mode,
+            'status': self.status,
+            'created': round(self.created, 3),
+            'queued_seconds': round((self.started or time.time()) - self.created, 6),
+        }
+        if self.finished:
+            job['run_seconds'] = round(self.finished - self.started, 6)
+        if self.error:
+            job['error'] = self.error
+        if result and self.result is not None:
+            job['result'] = self.result
+        return job
+
+
+class AnalysisService:
+    """Bounded worker pool that parses, diagrams and summarizes submitted files
+
+    `parser` is anything with CodeParser's parse_file/parse_cells (such as an
+    isolated_parser.IsolatedParser); by default files are parsed in-process.
+    """
+
+    def __init__(self, generator, parser=None, workers=SERVICE_WORKERS, queue_size=QUEUE_SIZE,
+                 retained=RETAINED_JOBS):
+        self.generator = generator
+        self.parser = parser or CodeParser()
+        self.retained = retained
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.batches = OrderedDict()
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'done': 0, 'failed': 0}
+        self._by_key = {}
+        self._finished = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'service-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, content, file_type, name=None, mode='ai', summary=True):
+        """Queue one file; returns (job, deduplicated) or raises ServiceBusy"""
+        return self.submit_many([(name, content)], file_type, mode, summary)[0]
+
+    def submit_many(self, files, file_type=None, mode='ai', summary=True):
+        """Queue [(name, content)] all together or not at all; returns [(job, deduplicated)]
+
+        The file type of each file is taken from its name unless `file_type` is given.
+        Raises ServiceBusy when the queue can't take every new job.
+        """
+        prepared = []
+        for name, content in files:
+            kind = file_type or (name or '').rsplit('.', 1)[-1].lower()
+            if kind not in SUPPORTED_EXTENSIONS:
+                raise ValueError(f"Unsupported file type: {kind or 'unknown'}")
+            if mode not in DIAGRAM_MODES:
+                raise ValueError(f"Unsupported diagram mode: {mode}")
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            key = hashlib.sha256(f"{kind}\0{mode}\0{int(bool(summary))}\0".encode() + content).hexdigest()
+            prepared.append((name, content, kind, key))
+
+        with self._lock:
+            results = []
+            new = []
+            for name, content, kind, key in prepared:
+                job = self._by_key.get(key)
+                if job is None or job.status == 'failed':
+                    job = Job(key, name, kind, content, mode, bool(summary))
+                    self._by_key[key] = job
+                    new.append(job)
+                    results.append((job, False))
+                else:
+                    results.append((job, True))
+            if len(new) > self.queue.maxsize - self.queue.qsize():
+                for job in new:
+                    del self._by_key[job.key]
+                self.stats['rejected'] += len(new)
+                instrumentation.metrics.inc('service_rejected_total', len(new))
+                raise ServiceBusy(f"Queue is full ({self.queue.qsize()} of {self.queue.maxsize} jobs waiting)")
+            for job in new:
+                self.jobs[job.id] = job
+                # Workers only take jobs off the queue, so the room checked above can't shrink
+                self.queue.put_nowait(job)
+            self.stats['submitted'] += len(new)
+            self.stats['deduplicated'] += len(results) - len(new)
+            instrumentation.metrics.set('service_queue_depth', self.queue.qsize())
+        if len(results) > len(new):
+            instrumentation.metrics.inc('service_deduplicated_total', len(results) - len(new))
+        return results
+
+    def submit_batch(self, files, mode='ai', summary=True):
+        """Queue the files of an archive as one batch; returns (batch id, [(name, job, deduplicated)])"""
+        results = self.submit_many(files, None, mode, summary)
+        batch_id = secrets.token_hex(8)
+        with self._lock:
+            self.batches[batch_id] = [(name, job) for (name, _), (job, _) in zip(files, results)]
+            while len(self.batches) > RETAINED_BATCHES:
+                self.batches.popitem(last=False)
+        return batch_id, [(name, job, deduplicated) for (name, _), (job, deduplicated) in zip(files, results)]
+
+    def health(self):
+        with self._lock:
+            return dict(self.stats, queued=self.queue.qsize(), capacity=self.queue.maxsize,
+                        running=self._running, workers=len(self._threads), retained=len(self.jobs))
+
+    def close(self):
+        """Stop the workers once the jobs already queued are done"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._running += 1
+                instrumentation.metrics.set('service_queue_depth', self.queue.qsize())
+                instrumentation.metrics.set('service_jobs_running', self._running)
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"Service job {job.id} ({job.name or job.file_type}) failed: {e}")
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                job.content = None
+                with self._lock:
+                    self._running -= 1
+                    instrumentation.metrics.set('service_jobs_running', self._running)
+                    self._retire(job)
+                job.finish()
+
+    def _retire(self, job):
+        status = 'failed' if job.error else 'done'
+        self.stats[status] += 1
+        instrumentation.metrics.inc('service_jobs_total', status=status)
+        self._finished.append(job)
+        while len(self._finished) > self.retained:
+            old = self._finished.popleft()
+            self.jobs.pop(old.id, None)
+            if self._by_key.get(old.key) is old:
+                del self._by_key[old.key]
+
+    def _run(self, job):
+        job.started = time.time()
+        job.emit('running')
+        with instrumentation.request('service', file_type=job.file_type, mode=job.mode):
+            with instrumentation.stage('parse', kind=job.file_type) as info:
+                content, structure = self._parse(job.content, job.file_type)
+                if 'error' in structure:
+                    info['error'] = structure['error']
+            if 'error' in structure:
+                job.error = structure['error']
+                return
+
+            statistics = CodeParser().get_code_complexity(structure)
+            job.emit('statistics', statistics)
+            result = {'statistics': statistics, 'diagram': None, 'summary': None}
+            if not job.summary:
+                result['diagram'] = self.generator.generate_mermaid_diagram(
+                    structure, job.file_type, mode=job.mode, code_content=content)
+                job.emit('diagram', result['diagram'])
+            else:
+                events = self.generator.generate_concurrently(structure, content, job.file_type,
+                                                              stream_summary=True, mode=job.mode)
+                for kind, data in events:
+                    if kind in result:
+                        result[kind] = data
+                    job.emit(kind, data)
+            job.result = result
+            # A fallback diagram or failed summary is returned but fails the job, so a resubmit retries it
+            reasons = [getattr(result[kind], 'reason', None) for kind in ('diagram', 'summary')]
+            job.error = next((reason for reason in reasons if reason), None)
+
+    def _parse(self, data, file_type):
+        """(source text the generator works on, parse result)"""
+        if file_type == 'ipynb':
+            try:
+                cells = read_code_cells(data)
+            except NotebookFormatError as e:
+                return '', {'error': f"Invalid Jupyter notebook format: {e}"}
+            return slim_notebook(cells), self.parser.parse_cells(cells)
+        content = data.decode('utf-8', errors='replace')
+        return content, self.parser.parse_file(content, file_type)
+
+
+def decompress(body, encoding):
+    """Undo a gzip or deflate Content-Encoding, refusing output beyond MAX_EXTRACTED_BYTES"""
+    if encoding in ('', 'identity'):
+        return body
+    if encoding not in ('gzip', 'deflate'):
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    inflater = zlib.decompressobj(wbits=47)  # gzip or zlib header, detected
+    try:
+        data = inflater.decompress(body, MAX_EXTRACTED_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt {encoding} body: {e}")
+    if inflater.unconsumed_tail:
+        raise ValueError(f"Body decompresses to more than {MAX_EXTRACTED_BYTES // (1024 * 1024)} MB")
+    return data
+
+
+def read_archive(data):
+    """[(path, content)] of the supported source files in a zip or (compressed) tar archive
+
+    Directories in SKIP_DIRS are left out. Raises ValueError for anything
+    that isn't such an archive or unpacks to more than MAX_EXTRACTED_BYTES.
+    """
+    members = []
+    if data[:4] == b'PK\x03\x04':
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid zip archive: {e}")
+        for info in archive.infolist():
+            if not info.is_dir():
+                members.append((info.filename, info.file_size, lambda info=info: archive.open(info)))
+    else:
+        try:
+            archive = tarfile.open(fileobj=io.BytesIO(data), mode='r:*')
+        except tarfile.TarError:
+            raise ValueError("Expected a zip archive or a tar archive (optionally gzip, bzip2 or xz compressed)")
+        for member in archive.getmembers():
+            if member.isfile():
+                members.append((member.name, member.size, lambda member=member: archive.extractfile(member)))
+
+    files = []
+    total = 0
+    for name, size, open_member in members:
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+        if not parts or '..' in parts or SKIP_DIRS.intersection(parts[:-1]):
+            continue
+        if parts[-1].rsplit('.', 1)[-1].lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        if len(files) == MAX_BATCH_FILES:
+            raise ValueError(f"Archive has more than {MAX_BATCH_FILES} source files")
+        # Read at most what is left of the allowance, whatever size the header claims
+        with open_member() as f:
+            content = f.read(MAX_EXTRACTED_BYTES - total + 1)
+        total += len(content)
+        if total > MAX_EXTRACTED_BYTES or size > MAX_EXTRACTED_BYTES:
+            raise ValueError(f"Archive unpacks to more than {MAX_EXTRACTED_BYTES // (1024 * 1024)} MB")
+        files.append(('/'.join(parts), content))
+    return files
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes the HTTP API to the server's AnalysisService"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+        service = self.server.service
+        if parts == ['health']:
+            return self._json(200, service.health())
+        if parts == ['metrics']:
+            return self._send(200, instrumentation.metrics.render().encode('utf-8'),
+                              'text/plain; version=0.0.4; charset=utf-8')
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = service.jobs.get(parts[1])
+            if job is None:
+                return self._json(404, {'error': f"No job {parts[1]}"})
+            if len(parts) == 2:
+                return self._json(200, job.to_dict())
+            if parts[2] == 'events':
+                return self._stream(job)
+        if len(parts) == 2 and parts[0] == 'batches':
+            jobs = service.batches.get(parts[1])
+            if jobs is None:
+                return self._json(404, {'error': f"No batch {parts[1]}"})
+            results = query.get('results', ['0'])[0] not in ('0', 'false', '')
+            counts = {}
+            for _, job in jobs:
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return self._json(200, {'id': parts[1], 'counts': counts,
+                                    'jobs': [dict(job.to_dict(results), path=name) for name, job in jobs]})
+        self._json(404, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._body()
+            if body is None:
+                return
+            mode = query.get('mode', 'ai')
+            summary = _flag(query.get('summary', '1'))
+            if url.path.rstrip('/') == '/jobs':
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    request = json.loads(body)
+                    if not isinstance(request, dict):
+                        raise TypeError("the JSON body must be an object")
+                    for field in ('name', 'file_type', 'mode'):
+                        if request.get(field) is not None and not isinstance(request[field], str):
+                            raise TypeError(f"'{field}' must be a string")
+                    name = request.get('name')
+                    content = request['content']
+                    file_type = request.get('file_type')
+                    mode = request.get('mode', mode)
+                    summary = _flag(request.get('summary', summary))
+                else:
+                    name, content, file_type = query.get('name'), body, query.get('file_type')
+                job, deduplicated = self.server.service.submit(content, file_type, name, mode, summary)
+                return self._json(200 if deduplicated else 202, dict(job.to_dict(result=False),
+                                                                     deduplicated=deduplicated))
+            if url.path.rstrip('/') == '/batches':
+                files = read_archive(body)
+                if not files:
+                    return self._json(400, {'error': "No .py, .ipynb or .cpp files in the archive"})
+                batch_id, jobs = self.server.service.submit_batch(files, mode, summary)
+                return self._json(202, {'id': batch_id, 'jobs': [
+                    {'path': name, 'id': job.id, 'status': job.status, 'deduplicated': deduplicated}
+                    for name, job, deduplicated in jobs]})
+            self._json(404, {'error': f"Unknown path {url.path}"})
+        except ServiceBusy as e:
+            self._json(503, {'error': str(e)}, {'Retry-After': str(RETRY_AFTER)})
+        except (ValueError, KeyError, TypeError) as e:
+            # json.JSONDecodeError is a ValueError
+            self._json(400, {'error': f"Bad request: {e}"})
+
+    def _body(self):
+        """The decoded request body, or None after an error response"""
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._json(411, {'error': "Content-Length is required"})
+            return None
+        if int(length) < 0:
+            self._json(400, {'error': "Content-Length must not be negative"})
+            return None
+        if int(length) > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self._json(413, {'error': f"Body is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"})
+            return None
+        body = self.rfile.read(int(length))
+        return decompress(body, self.headers.get('Content-Encoding', '').strip().lower())
+
+    def _stream(self, job):
+        """Server-sent events: one per job event, ending with 'done' or 'failed'"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(f"event: queued\ndata: {json.dumps(job.to_dict(result=False))}\n\n".encode())
+            for event in job.follow():
+                if event is None:
+                    self.wfile.write(b": keep-alive\n\n")
+                else:
+                    self.wfile.write(f"event: {event[0]}\ndata: {json.dumps(event[1])}\n\n".encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load, and clients retry them only after a second
+    request_queue_size = 256
+
+    def __init__(self, address, service):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+
+
+def load_test(host, port, requests, concurrency, mode='ai', summary=True):
+    """Submit `requests` distinct files from `concurrency` clients and follow each to the end
+
+    Every client submits a job, reads its event stream until it finishes and
+    then submits the next; a 503 is retried after its Retry-After. Returns
+    completed/rejected/failed counts, requests per second and latency
+    percentiles (submit to finish) in milliseconds.
+    """
+    from benchmark import synthetic_python
+
+    source = synthetic_python(20)
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    totals = {'completed': 0, 'rejected': 0, 'failed': 0}
+    totals_lock = threading.Lock()
+
+    def run_one(connection, body):
+        """Submit one job and follow it; returns its final status"""
+        while True:
+            connection.request('POST', f"/jobs?file_type=py&mode={mode}&summary={int(summary)}", body)
+            response = connection.getresponse()
+            payload = json.loads(response.read())
+            if response.status != 503:
+                break
+            with totals_lock:
+                totals['rejected'] += 1
+            time.sleep(float(response.getheader('Retry-After', RETRY_AFTER)))
+        if response.status >= 400:
+            return 'failed'
+        stream = http.client.HTTPConnection(host, port, timeout=600)
+        try:
+            stream.request('GET', f"/jobs/{payload['id']}/events")
+            for line in stream.getresponse():
+                if line.startswith((b'event: done', b'event: failed')):
+                    return line[7:].strip().decode()
+        finally:
+            stream.close()
+        return 'failed'
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=600)
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                connection.close()
+                return
+            start = time.perf_counter()
+            try:
+                status = run_one(connection, f"{source}\n# request {i}\n".encode('utf-8'))
+            except (OSError, http.client.HTTPException) as e:
+                print(f"Load-test request {i} failed: {e}")
+                connection.close()
+                status = 'failed'
+            with totals_lock:
+                totals['completed' if status == 'done' else 'failed'] += 1
+                if status == 'done':
+                    latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1) if latencies else 0
+
+    return dict(totals, seconds=round(seconds, 3), requests_per_second=round(totals['completed'] / seconds, 1),
+                p50_ms=percentile(50), p95_ms=percentile(95), p99_ms=percentile(99),
+                max_ms=round(latencies[-1] * 1000, 1) if latencies else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve code analysis (parse, diagram, summary) over HTTP")
+    parser.add_argument('--host', default='', help="interface to listen on (default: all)")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help="port to listen on")
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS, help="jobs processed at once")
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE, help="jobs waiting before submissions get 503")
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help="isolated parser processes (default: CODETODIAGRAM_PARSE_WORKERS; 0 parses in-process)")
+    parser.add_argument('--rpm', type=float, default=None, help="max model requests per minute (0 = unlimited)")
+    parser.add_argument('--stub', action='store_true', help="use a local stub instead of Gemini (offline)")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds of simulated latency per stub call")
+    parser.add_argument('--load-test', type=int, metavar='N', default=0,
+                        help="start the service on a free port, run N jobs against it, print throughput and exit")
+    parser.add_argument('--concurrency', type=int, default=16, help="load-test clients")
+    parser.add_argument('--mode', choices=DIAGRAM_MODES, default='ai', help="load-test diagram mode")
+    args = parser.parse_args(argv)
+
+    # Imported here so --help works without the Gemini client installed
+    from diagram_generator import DiagramGenerator, shared_model
+    from isolated_parser import DEFAULT_WORKERS, IsolatedParser
+    from scheduler import DEFAULT_RPM, Scheduler
+
+    rpm = DEFAULT_RPM if args.rpm is None else args.rpm
+    if args.stub:
+        from stub_model import StubModel
+        generator = DiagramGenerator(model=Scheduler(StubModel(latency=args.stub_latency), rpm))
+    else:
+        if args.rpm is not None:
+            shared_model().set_rate(rpm)
+        generator = DiagramGenerator()
+
+    parse_workers = DEFAULT_WORKERS if args.parse_workers is None else args.parse_workers
+    isolated = IsolatedParser(workers=parse_workers) if parse_workers > 0 else None
+    service = AnalysisService(generator, isolated, workers=args.workers, queue_size=args.queue)
+    server = ServiceServer((args.host, 0 if args.load_test else args.port), service)
+    thread = threading.Thread(target=server.serve_forever, name='service-http', daemon=True)
+    thread.start()
+    try:
+        if args.load_test:
+            stats = load_test('127.0.0.1', server.server_address[1], args.load_test, args.concurrency, args.mode)
+            print(f"Completed {stats['completed']} jobs ({stats['failed']} failed, {stats['rejected']} submissions "
+                  f"rejected) in {stats['seconds']}s: {stats['requests_per_second']} jobs/s, latency p50 "
+                  f"{stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms")
+            return 1 if stats['failed'] else 0
+        print(f"Serving on http://{args.host or '0.0.0.0'}:{server.server_address[1]} "
+              f"({args.workers} workers, queue of {args.queue})", file=sys.stderr)
+        thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        if isolated is not None:
+            isolated.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import bisect
+import difflib
+import hashlib
+from collections import Counter
+
+import mermaid_validator
+from code_parser import CodeParser, join_cells
+from local_diagram import LocalDiagramEngine, MermaidCFGWriter
+from notebook_reader import NotebookFormatError, read_code_cells
+
+# Diff text sent to the model beyond this is cut, with a note of how much was left out
+MAX_PATCH_CHARS = 12000
+
+DIFF_STYLES = [
+    "classDef added fill:#DCFCE7,stroke:#16A34A",
+    "classDef removed fill:#FEE2E2,stroke:#DC2626,stroke-dasharray:4 3",
+    "classDef unchanged fill:#F3F4F6,stroke:#9CA3AF,color:#6B7280",
+]
+SUBGRAPH_STYLES = {'added': "fill:#F0FDF4,stroke:#16A34A", 'changed': "fill:#FFFBEB,stroke:#D97706"}
+
+
+def function_id(name):
+    """Subgraph id of a function, derived from its name so it is the same in both versions"""
+    return "fn_" + hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]
+
+
+def source_text(content, file_type):
+    """The code a version is compared on; notebooks are reduced to their joined code cells"""
+    if file_type != 'ipynb':
+        return content
+    try:
+        return join_cells(read_code_cells(content))
+    except NotebookFormatError:
+        return ''
+
+
+def _by_name(functions):
+    """{name: (signature, body)}; repeated names (overloads, redefinitions) get a #n suffix"""
+    result = {}
+    for name, signature, body in functions:
+        key = name
+        n = 1
+        while key in result:
+            n += 1
+            key = f"{name}#{n}"
+        result[key] = (signature, body)
+    return result
+
+
+def _steps(name, signature, body):
+    """Node id -> shape and label of one function's drawing, without the id"""
+    nodes = mermaid_validator.parse(MermaidCFGWriter([(name, signature, body)], [function_id(name)]).render())['nodes']
+    return {node: text[len(node):] for node, text in nodes.items()}
+
+
+def _step_changes(name, old, new):
+    """Nodes of the new drawing with no matching step in the old one, and how many old steps went unmatched"""
+    unmatched = Counter(_steps(name, *old).values())
+    fresh = []
+    for node, step in _steps(name, *new).items():
+        if unmatched[step] > 0:
+            unmatched[step] -= 1
+        else:
+            fresh.append(node)
+    return fresh, sum(unmatched.values())
+
+
+def _changed_lines(opcodes):
+    """Merged (first, last) line ranges, per side, touched by the diff's non-equal opcodes
+
+    Each range is widened by a line on both sides so that pure insertions and
+    deletions also touch the definitions around them.
+    """
+    ranges = ([], [])
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            continue
+        for side, (start, end) in enumerate(((i1, i2), (j1, j2))):
+            if ranges[side] and start <= ranges[side][-1][1]:
+                ranges[side][-1][1] = end + 1
+            else:
+                ranges[side].append([start, end + 1])
+    return ranges
+
+
+def _selector(ranges, names=()):
+    """select() for LocalDiagramEngine.functions: definitions overlapping a range, or named in `names`"""
+    starts = [start for start, _ in ranges]
+
+    def select(name, first_line, last_line):
+        i = bisect.bisect_right(starts, last_line)
+        return (i > 0 and ranges[i - 1][1] >= first_line) or name in names
+    return select
+
+
+def _lowered(functions):
+    return {name for name, _, body in functions if body is not None}
+
+
+def _patch(matcher, old_lines, new_lines):
+    """Unified diff text, cut at MAX_PATCH_CHARS"""
+    lines = ["--- before", "+++ after"]
+    for group in matcher.get_grouped_opcodes(3):
+        first, last = group[0], group[-1]
+        lines.append(f"@@ -{first[1] + 1},{last[2] - first[1]} +{first[3] + 1},{last[4] - first[3]} @@")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend(' ' + line for line in old_lines[i1:i2])
+                continue
+            lines.extend('-' + line for line in old_lines[i1:i2])
+            lines.extend('+' + line for line in new_lines[j1:j2])
+    if len(lines) == 2:
+        return ''
+    patch = "\n".join(lines)
+    if len(patch) > MAX_PATCH_CHARS:
+        cut = patch.rfind("\n", 0, MAX_PATCH_CHARS)
+        patch = patch[:cut] + f"\n... ({len(patch) - cut} more characters of diff left out)"
+    return patch
+
+
+def compare(old_content, new_content, file_type, engine=None):
+    """Structural diff of two versions of one file
+
+    Functions (methods, module code and notebook cells included) are matched
+    by qualified name and compared by their control-flow IR, so moves and
+    whitespace or comment edits don't count as changes. Only functions that
+    the line diff touches are lowered to IR. Returns
+    {'functions', 'classes', 'imports', 'control_flow', 'patch', 'diagram'}:
+    added/removed/changed/unchanged names, added/removed imports, the count of
+    each control-flow kind before and after, a unified diff of the source and
+    a Mermaid diagram that highlights the changes.
+    """
+    engine = engine or LocalDiagramEngine()
+    parser = CodeParser()
+    old_structure = parser.parse_file(old_content, file_type)
+    new_structure = parser.parse_file(new_content, file_type)
+
+    # Only definitions the text diff touches are lowered; the rest are unchanged by construction
+    old_lines = source_text(old_content, file_type).splitlines()
+    new_lines = source_text(new_content, file_type).splitlines()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    old_ranges, new_ranges = _changed_lines(matcher.get_opcodes())
+    new_list = engine.functions(new_content, file_type, _selector(new_ranges))
+    old_list = engine.functions(old_content, file_type, _selector(old_ranges, _lowered(new_list)))
+    if _lowered(old_list) - _lowered(new_list):
+        new_list = engine.functions(new_content, file_type, _selector(new_ranges, _lowered(old_list)))
+    old_functions = _by_name(old_list)
+    new_functions = _by_name(new_list)
+
+    functions = {
+        'added': [name for name in new_functions if name not in old_functions],
+        'removed': [name for name in old_functions if name not in new_functions],
+        'changed': [name for name in new_functions
+                    if name in old_functions and old_functions[name][1] != new_functions[name][1]],
+    }
+    functions['unchanged'] = [name for name in new_functions if name in old_functions
+                              and name not in functions['changed']]
+
+    old_classes = {c['qualname']: (list(c['bases']), list(c['methods'])) for c in old_structure.get('classes', [])}
+    new_classes = {c['qualname']: (list(c['bases']), list(c['methods'])) for c in new_structure.get('classes', [])}
+    edited = functions['added'] + functions['removed'] + functions['changed']
+    classes = {
+        'added': [name for name in new_classes if name not in old_classes],
+        'removed': [name for name in old_classes if name not in new_classes],
+        'changed': [name for name in new_classes if name in old_classes and (
+            old_classes[name] != new_classes[name] or any(f.startswith(f"{name}.") for f in edited))],
+    }
+
+    old_imports = set(old_structure.get('imports', []) + old_structure.get('includes', []))
+    new_imports = set(new_structure.get('imports', []) + new_structure.get('includes', []))
+    control_flow = {
+        'before': dict(Counter(cf['type'] for cf in old_structure.get('control_flow', []))),
+        'after': dict(Counter(cf['type'] for cf in new_structure.get('control_flow', []))),
+    }
+
+    return {
+        'functions': functions,
+        'classes': classes,
+        'imports': {'added': sorted(new_imports - old_imports), 'removed': sorted(old_imports - new_imports)},
+        'control_flow': control_flow,
+        'patch': _patch(matcher, old_lines, new_lines),
+        'diagram': diff_diagram(old_functions, new_functions, functions, sorted(new_imports - old_imports),
+                                sorted(old_imports - new_imports)),
+    }
+
+
+def diff_diagram(old_functions, new_functions, functions, added_imports=(), removed_imports=()):
+    """One flowchart of the new version with the changes highlighted
+
+    Added and changed functions are drawn in full, with new steps in green
+    and the count of added and removed steps in the title; unchanged and
+    removed functions are single grey or red nodes. Node ids come from the
+    function names, so unchanged parts keep their ids between versions.
+    """
+    added, changed = set(functions['added']), set(functions['changed'])
+    drawn = []
+    fresh = {}
+    for name, (signature, body) in new_functions.items():
+        if name in changed:
+            fresh[name], gone = _step_changes(name, old_functions[name], (signature, body))
+            drawn.append((name, f"[+{len(fresh[name])} -{gone}] {signature}", body))
+        elif name in added:
+            drawn.append((name, f"[new] {signature}", body))
+        else:
+            drawn.append((name, signature, None))
+    for name in functions['removed']:
+        drawn.append((name, f"[removed] {old_functions[name][0]}", None))
+
+    ids = [function_id(name) for name, _, _ in drawn]
+    code = MermaidCFGWriter(drawn, ids).render()
+    lines = [code]
+
+    if added_imports or removed_imports:
+        lines.append('    subgraph imports["imports"]')
+        lines.extend(f'    import_added_{i}["+ {module}"]' for i, module in enumerate(added_imports))
+        lines.extend(f'    import_removed_{i}["- {module}"]' for i, module in enumerate(removed_imports))
+        lines.append("    end")
+
+    lines.extend(f"    {style}" for style in DIFF_STYLES)
+    marked = {
+        'added': [f"import_added_{i}" for i in range(len(added_imports))],
+        'removed': [f"import_removed_{i}" for i in range(len(removed_imports))],
+        'unchanged': []
+    }
+    nodes = mermaid_validator.parse(code)['nodes'] if added else {}
+    for (name, _, _), fid in zip(drawn, ids):
+        if name in changed:
+            marked['added'].extend(fresh[name])
+            lines.append(f"    style {fid} {SUBGRAPH_STYLES['changed']}")
+        elif name in added:
+            marked['added'].extend(node for node in nodes if node.startswith(f"{fid}_"))
+            lines.append(f"    style {fid} {SUBGRAPH_STYLES['added']}")
+        elif name in new_functions:
+            marked['unchanged'].append(f"{fid}_start")
+        else:
+            marked['removed'].append(f"{fid}_start")
+    for kind, nodes in marked.items():
+        if nodes:
+            lines.append(f"    class {','.join(nodes)} {kind}")
+    return "\n".join(lines)
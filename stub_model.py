@@ -0,0 +1,99 @@
+import hashlib
+import re
+import threading
+import time
+
+
+class StubUsage:
+    """Token usage in the shape of Gemini's usage_metadata"""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class StubAPIError(Exception):
+    """An API error with an HTTP status, shaped like google.api_core's exceptions"""
+
+    def __init__(self, code, message="Stub API error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class StubResponse:
+    """Minimal stand-in for a Gemini GenerateContentResponse
+
+    Like Gemini's, a streamed chunk reports the usage of everything generated so far.
+    """
+
+    def __init__(self, text, prompt, generated=None):
+        self.text = text
+        generated = text if generated is None else generated
+        self.usage_metadata = StubUsage(len(prompt) // 4, len(generated) // 4)
+
+
+class StubModel:
+    """Deterministic offline replacement for genai.GenerativeModel
+
+    Diagram prompts get a flowchart built from the names in the structure
+    context, everything else gets a short summary derived from a hash of the
+    prompt. `latency` seconds are slept per call to mimic network time.
+    `errors` is a list of HTTP statuses (e.g. [429, 503]) to fail the first
+    calls with, one per call, for exercising retries.
+    """
+
+    def __init__(self, latency=0.0, chunk_size=64, errors=()):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.errors = list(errors)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        """Return a canned response for prompt, optionally as a chunk stream"""
+        with self._lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise StubAPIError(error)
+
+        if 'Mermaid diagram' in prompt:
+            text = self._diagram(prompt)
+        else:
+            text = self._summary(prompt)
+
+        if not stream:
+            return StubResponse(text, prompt)
+        return (StubResponse(text[i:i + self.chunk_size], prompt, text[:i + self.chunk_size])
+                for i in range(0, len(text), self.chunk_size))
+
+    def _diagram(self, prompt):
+        # One node per entry of the structure context's ranked function list
+        _, _, listing = prompt.partition("Functions and methods (most important first):\n")
+        nodes = []
+        for line in listing.splitlines():
+            entry = re.match(r'- (?:async )?([\w.:~]+)\(', line)
+            if entry is None:
+                if not line.startswith('- '):
+                    break
+                continue
+            nodes.append(entry.group(1))
+
+        lines = ["flowchart TD", "    Start([Start])"]
+        prev = "Start"
+        for i, name in enumerate(nodes):
+            lines.append(f"    {prev} --> N{i}[{re.sub(r'[^A-Za-z0-9_. ]', '', name)}]")
+            prev = f"N{i}"
+        lines.append(f"    {prev} --> End([End])")
+        return "\n".join(lines)
+
+    def _summary(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return (
+            f"**Purpose**: Stub summary {digest}.\n\n"
+            f"**Key Components**: {prompt.count('def ')} functions, {prompt.count('class ')} classes.\n\n"
+            "**Complexity**: Moderate."
+        )
@@ -0,0 +1,19 @@
+from batch import parse_job
+
+
+def test_unparseable_file_is_reported_not_raised(tmp_path):
+    (tmp_path / 'deep.py').write_text('x = ' + '-' * 200000 + '1\n')
+    result = parse_job((str(tmp_path), 'deep.py', None))
+    assert result['path'] == 'deep.py' and result['error']
+
+
+def test_missing_file_is_reported_not_raised(tmp_path):
+    result = parse_job((str(tmp_path), 'gone.py', None))
+    assert result['error'].startswith('FileNotFoundError')
+
+
+def test_parsed_file_returns_structure(tmp_path):
+    (tmp_path / 'ok.py').write_text('def f():\n    return 1\n')
+    rel_path, content_hash, content, file_type, structure, seconds = parse_job((str(tmp_path), 'ok.py', None))
+    assert rel_path == 'ok.py' and file_type == 'py'
+    assert parse_job((str(tmp_path), 'ok.py', content_hash)) is None
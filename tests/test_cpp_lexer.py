@@ -0,0 +1,27 @@
+from cpp_lexer import CppScanner
+
+
+def functions(code):
+    return [(f['qualname'], f['line'], f['end_line']) for f in CppScanner(code).scan().functions]
+
+
+def test_braces_in_parameter_list_do_not_open_a_body():
+    code = ('template<class U> U make(U value = U{}) { return value; }\n'
+            'int pick(int (*g)() = [] { return 1; }) {\n'
+            '    return g();\n'
+            '}\n'
+            'int after() { return 1; }\n')
+    assert functions(code) == [('make', 1, 1), ('pick', 2, 4), ('after', 5, 5)]
+
+
+def test_in_class_constructor_with_braced_initializer():
+    code = ('class W {\n'
+            'public:\n'
+            '    W() : a_(0), b_{1} {}\n'
+            '    int get() { return a_; }\n'
+            'private:\n'
+            '    int a_, b_;\n'
+            '};\n')
+    scan = CppScanner(code).scan()
+    assert [(f['qualname'], f['line']) for f in scan.functions] == [('W::W', 3), ('W::get', 4)]
+    assert scan.classes[0]['methods'] == ['W', 'get']
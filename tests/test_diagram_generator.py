@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip('google.generativeai')
+
+from code_parser import CodeParser
+from diagram_generator import Degraded, DiagramGenerator
+from result_cache import ResultCache
+from stub_model import StubModel
+
+CODE = 'def f(x):\n    if x:\n        return 1\n    return 2\n'
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return DiagramGenerator(cache=ResultCache(str(tmp_path)), model=StubModel(errors=[400]))
+
+
+def test_failed_summary_is_degraded_and_retried(generator):
+    assert isinstance(generator.generate_summary(CODE, 'py'), Degraded)
+    summary = generator.generate_summary(CODE, 'py')
+    assert not isinstance(summary, Degraded) and generator.model.calls == 2
+
+
+def test_fallback_diagram_is_degraded_and_not_cached(generator):
+    structure = CodeParser().parse_file(CODE, 'py')
+    diagram = generator.generate_mermaid_diagram(structure, 'py', code_content=CODE)
+    assert isinstance(diagram, Degraded) and diagram.reason
+    retried = generator.generate_mermaid_diagram(structure, 'py', code_content=CODE)
+    assert not isinstance(retried, Degraded) and generator.model.calls == 2
+    assert generator.generate_mermaid_diagram(structure, 'py', code_content=CODE) == retried
+    assert generator.model.calls == 2
+
+
+def test_failed_chunk_fails_the_summary_without_caching_it(tmp_path):
+    code = ''.join(f"def f{i}(x):\n    return x + {i}  # {'padding ' * 20}\n\n" for i in range(80))
+    generator = DiagramGenerator(cache=ResultCache(str(tmp_path)), model=StubModel(errors=[503]))
+    summary = generator.generate_summary(code, 'py')
+    assert isinstance(summary, Degraded) and 'could not be summarized' in summary.reason
+    assert not isinstance(generator.generate_summary(code, 'py'), Degraded)
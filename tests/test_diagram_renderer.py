@@ -0,0 +1,24 @@
+import sys
+
+import diagram_renderer
+from diagram_renderer import DiagramRenderer
+from result_cache import ResultCache
+
+
+def failing_renderer(tmp_path):
+    script = tmp_path / 'mmdc.py'
+    script.write_text(f"open({str(tmp_path / 'calls')!r}, 'a').write('x')\nraise SystemExit('Parse error on line 2')\n")
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    return DiagramRenderer(cache=cache, command=f'{sys.executable} {script}'), tmp_path / 'calls'
+
+
+def test_failed_render_is_cached_briefly(tmp_path, monkeypatch):
+    renderer, calls = failing_renderer(tmp_path)
+    assert renderer.render('flowchart TD\n  A -->') == {'error': 'Parse error on line 2'}
+    assert renderer.render('flowchart TD\n  A -->') == {'error': 'Parse error on line 2'}
+    assert calls.read_text() == 'x'
+
+    monkeypatch.setattr(diagram_renderer, 'ERROR_TTL', 0)
+    renderer.render('flowchart TD\n  B -->')
+    renderer.render('flowchart TD\n  B -->')
+    assert calls.read_text() == 'xxx'
@@ -0,0 +1,41 @@
+import json
+
+from code_parser import CodeParser
+from isolated_parser import IsolatedParser
+from notebook_reader import read_code_cells
+
+
+def notebook(*sources):
+    return json.dumps({'cells': [{'cell_type': 'code', 'source': s} for s in sources],
+                       'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}).encode()
+
+
+def test_only_new_cells_are_sent_to_the_pool():
+    isolated = IsolatedParser(workers=1)
+    parser = CodeParser()
+    try:
+        first = isolated.parse_cells(read_code_cells(notebook('def a():\n    pass\n', 'def b():\n    pass\n')),
+                                     parser=parser)
+        assert [f.name for f in first['functions']] == ['a', 'b']
+        jobs = isolated.stats['jobs']
+        edited = read_code_cells(notebook('def a():\n    pass\n', 'def c():\n    pass\n'))
+        structure = isolated.parse_cells(edited, parser=parser)
+        assert [(f.name, f.line) for f in structure['functions']] == [('a', 1), ('c', 5)]
+        assert isolated.stats['jobs'] == jobs + 1
+        hits = parser.cell_cache.hits
+        isolated.parse_cells(edited, parser=parser)
+        assert isolated.stats['jobs'] == jobs + 1 and parser.cell_cache.hits > hits
+    finally:
+        isolated.close()
+
+
+def test_no_free_worker_fails_as_busy():
+    isolated = IsolatedParser(workers=1)
+    worker = isolated._idle.get()
+    try:
+        structure = isolated.parse_file('x = 1\n', 'py', timeout=0.1)
+        assert structure['limit'] == 'busy' and structure['metrics'] == []
+        assert isolated.stats['busy'] == 1
+    finally:
+        isolated._idle.put(worker)
+        isolated.close()
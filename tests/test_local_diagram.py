@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from local_diagram import TOO_DEEP, LocalDiagramEngine, ParseError
+
+
+def edges(diagram):
+    return {line.strip() for line in diagram.splitlines() if '-->' in line}
+
+
+def test_break_in_python_match_leaves_the_loop():
+    code = ('def f(items):\n'
+            '    for x in items:\n'
+            '        match x:\n'
+            '            case 1:\n'
+            '                break\n'
+            '            case _:\n'
+            '                continue\n'
+            '    return 0\n')
+    diagram = edges(LocalDiagramEngine().build(code, 'py'))
+    assert 'f0_n1 -->|"case 1"| f0_n2' in diagram
+    assert 'f0_n1 -->|"case _"| f0_n0' in diagram
+
+
+def test_continue_in_cpp_switch_goes_to_the_loop():
+    code = ('int g(int n) {\n'
+            '    for (int i = 0; i < n; i++) {\n'
+            '        switch (i) {\n'
+            '        case 1: continue;\n'
+            '        default: break;\n'
+            '        }\n'
+            '        n--;\n'
+            '    }\n'
+            '    return n;\n'
+            '}\n')
+    diagram = edges(LocalDiagramEngine().build(code, 'cpp'))
+    assert 'f0_n1 -->|"case 1"| f0_n0' in diagram
+    assert 'f0_n1 -->|"default"| f0_n2' in diagram
+
+
+def test_deeply_nested_function_is_drawn_as_one_node():
+    code = ('int h(int x) {\n' + 'if (x) {\n' * 400 + 'x++;\n' + '}\n' * 400 + 'return x;\n}\n'
+            'int k() { return 1; }\n')
+    diagram = LocalDiagramEngine().build(code, 'cpp')
+    assert TOO_DEEP in diagram
+    assert 'f1_n0(["return 1"])' in diagram
+
+
+def test_return_inside_try_runs_finally():
+    code = ('def f():\n'
+            '    try:\n'
+            '        return g()\n'
+            '    finally:\n'
+            '        cleanup()\n')
+    diagram = edges(LocalDiagramEngine().build(code, 'py'))
+    assert {'f0_n1 --> f0_n2', 'f0_n2 --> f0_end'} <= diagram
+    assert 'f0_n1 --> f0_end' not in diagram
+
+
+def test_python_too_deep_to_parse_is_a_parse_error():
+    code = 'x = ' + '-' * 200000 + '1\n'
+    with pytest.raises(ParseError):
+        LocalDiagramEngine().build(code, 'py')
+    cells = [{'cell_type': 'code', 'source': code}, {'cell_type': 'code', 'source': 'y = 1\n'}]
+    notebook = json.dumps({'cells': cells, 'metadata': {}, 'nbformat': 4})
+    diagram = LocalDiagramEngine().build(notebook, 'ipynb')
+    assert TOO_DEEP + 'cell 1' in diagram and 'cell 2' in diagram
@@ -0,0 +1,38 @@
+import pytest
+
+from mermaid_validator import repair, validate
+
+
+@pytest.mark.parametrize('code, fixed', [
+    ('flowchart TD\n    A[call f(x)] --> B[done]', 'flowchart TD\n    A["call f(x)"] --> B[done]'),
+    ('flowchart TD\n    A[say "hi"] --> B[done]', 'flowchart TD\n    A["say #quot;hi#quot;"] --> B[done]'),
+    ('flowchart TD\n    A[One] -> B[Two]', 'flowchart TD\n    A[One] --> B[Two]'),
+    ('```mermaid\nflowchart TD\n    A[One] --> B[Two]\n```', 'flowchart TD\n    A[One] --> B[Two]'),
+    ('flowchart TD\n    A[One --> B[Two]', 'flowchart TD\n    A[One] --> B[Two]'),
+])
+def test_repair_fixes_common_mistakes(code, fixed):
+    assert not validate(code)['valid']
+    result = repair(code)
+    assert result['code'] == fixed and result['fixes'] and not result['errors']
+    assert validate(result['code'])['valid']
+
+
+def test_duplicate_id_with_another_label_is_renamed():
+    result = repair('flowchart TD\n    A[One] --> B[Two]\n    A[Other] --> B')
+    assert result['code'] == 'flowchart TD\n    A[One] --> B[Two]\n    A_2[Other] --> B'
+    assert "defined twice" in result['warnings'][0]['message']
+
+
+def test_renamed_reserved_id_keeps_its_text_without_a_warning():
+    result = repair('flowchart TD\n    A[Start] --> B[Go]\n    B --> end')
+    assert result['code'] == 'flowchart TD\n    A[Start] --> B[Go]\n    B --> end_node\n    end_node["end"]'
+    assert result['warnings'] == []
+
+
+@pytest.mark.parametrize('code', [
+    'flowchart TD\n    A[One] --> B[Two]\n    ???\n    !!!\n    ...\n    ###',
+    'flowchart TD\n    ???',
+])
+def test_repair_gives_up_when_too_much_is_lost(code):
+    result = repair(code)
+    assert result['code'] is None and result['errors']
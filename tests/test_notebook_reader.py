@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from notebook_reader import NotebookFormatError, read_code_cells
+
+
+def notebook(source):
+    return json.dumps({'cells': [{'cell_type': 'code', 'source': source}], 'metadata': {}, 'nbformat': 4})
+
+
+def test_source_lists_are_joined():
+    assert read_code_cells(notebook(['x = 1\n', 'y = 2\n']))[0].source == 'x = 1\ny = 2\n'
+
+
+@pytest.mark.parametrize('source', [5, {'a': 1}, ['x = 1\n', 2], None])
+def test_non_string_source_is_a_format_error(source):
+    with pytest.raises(NotebookFormatError):
+        read_code_cells(notebook(source))
+
+
+@pytest.mark.parametrize('raw', [b'"x = \xff\xfe"', b'"x\\n\xff"'])
+def test_invalid_utf8_is_a_format_error(raw):
+    data = b'{"cells": [{"cell_type": "code", "source": ' + raw + b'}]}'
+    with pytest.raises(NotebookFormatError):
+        read_code_cells(data)
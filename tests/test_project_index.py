@@ -0,0 +1,65 @@
+import json
+
+from project_index import ProjectIndex
+
+
+def build(tmp_path, files):
+    root = tmp_path / 'repo'
+    for rel_path, content in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    index = ProjectIndex(str(root), db_path=str(tmp_path / 'index.sqlite'))
+    index.update(workers=0)
+    return index
+
+
+def edges(index):
+    return {(src, dst) for src, dst, _ in index.module_graph()['edges']}
+
+
+def test_from_import_of_submodule_resolves_calls(tmp_path):
+    index = build(tmp_path, {
+        'pkg/__init__.py': '',
+        'pkg/a.py': 'from pkg import b\n\nclass A:\n    def m(self):\n        return b.helper()\n',
+        'pkg/b.py': 'def helper():\n    return 1\n',
+    })
+    assert edges(index) == {('pkg.a', 'pkg.b')}
+    assert [(c['file'], c['caller']) for c in index.callers('helper')] == [('pkg/a.py', 'A.m')]
+    assert [c['targets'] for c in index.callees('A.m')] == [['pkg.b.helper']]
+    index.close()
+
+
+def test_relative_imports(tmp_path):
+    index = build(tmp_path, {
+        'pkg/__init__.py': 'from . import b\n',
+        'pkg/a.py': 'from .b import helper\nfrom .missing import x\n\ndef run():\n    return helper()\n',
+        'pkg/b.py': 'def helper():\n    return 1\n',
+    })
+    assert edges(index) == {('pkg', 'pkg.b'), ('pkg.a', 'pkg.b')}
+    assert [c['caller'] for c in index.callers('helper')] == ['run']
+    index.close()
+
+
+def test_unindexed_import_does_not_link_to_own_package(tmp_path):
+    notebook = {'cells': [{'cell_type': 'code', 'source': ['import numpy\n', 'numpy.zeros(3)\n']}],
+                'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}
+    index = build(tmp_path, {
+        'pkg/__init__.py': 'def zeros():\n    pass\n',
+        'pkg/n.ipynb': json.dumps(notebook),
+        'pkg/m.py': 'import os\nimport numpy\n',
+    })
+    assert edges(index) == set()
+    assert index.callers('zeros') == []
+    index.close()
+
+
+def test_file_too_deep_to_parse_is_stored_with_its_error(tmp_path):
+    index = build(tmp_path, {
+        'deep.py': 'x = ' + '-' * 200000 + '1\n',
+        'ok.py': 'def helper():\n    return 1\n',
+    })
+    errors = dict(index.db.execute('SELECT path, error FROM files').fetchall())
+    assert errors['deep.py'] and errors['ok.py'] is None
+    assert [d['file'] for d in index.find('helper')] == ['ok.py']
+    index.close()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import BATCH, INTERACTIVE, Scheduler
+from stub_model import StubAPIError, StubModel
+
+
+class BlockingModel:
+    """Records each prompt it is called with and holds every call until released"""
+
+    def __init__(self, release=None):
+        self.prompts = []
+        self.entered = threading.Event()
+        self.release = release
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        self.prompts.append(prompt)
+        self.entered.set()
+        if self.release is not None:
+            self.release.wait(5)
+        return f"reply to {prompt}"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_identical_prompts_in_flight_are_sent_once():
+    release = threading.Event()
+    model = BlockingModel(release)
+    scheduler = Scheduler(model, rate_per_minute=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.generate_content('same')))
+               for _ in range(2)]
+    threads[0].start()
+    assert model.entered.wait(5)
+    threads[1].start()
+    wait_for(lambda: scheduler.stats['coalesced'] == 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['reply to same', 'reply to same']
+    assert model.prompts == ['same'] and scheduler.stats['calls'] == 1
+
+
+def test_rate_limited_call_is_retried_until_it_succeeds():
+    model = StubModel(errors=[429])
+    scheduler = Scheduler(model, rate_per_minute=0, base_delay=0.01)
+    assert scheduler.generate_content('Summarize this').text
+    assert model.calls == 2
+    assert scheduler.stats['retries'] == 1 and scheduler.stats['failures'] == 0
+
+
+def test_non_retryable_error_is_raised_at_once():
+    model = StubModel(errors=[400, 400])
+    scheduler = Scheduler(model, rate_per_minute=0, base_delay=0.01)
+    with pytest.raises(StubAPIError) as info:
+        scheduler.generate_content('Summarize this')
+    assert info.value.code == 400
+    assert model.calls == 1
+    assert scheduler.stats['retries'] == 0 and scheduler.stats['failures'] == 1
+
+
+def test_interactive_lane_goes_ahead_of_waiting_batch_calls():
+    model = BlockingModel()
+    # One permit every 0.1 s, none available until the pause ends
+    scheduler = Scheduler(model, rate_per_minute=600, burst=1)
+    scheduler.bucket.pause(0.2)
+    batch = threading.Thread(target=scheduler.lane(BATCH).generate_content, args=('batch',))
+    batch.start()
+    wait_for(lambda: len(scheduler._waiting) == 1)
+    interactive = threading.Thread(target=scheduler.lane(INTERACTIVE).generate_content, args=('interactive',))
+    interactive.start()
+    batch.join(5)
+    interactive.join(5)
+    assert model.prompts == ['interactive', 'batch']
@@ -0,0 +1,73 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from service import AnalysisService, ServiceServer
+
+
+class LocalGenerator:
+    def generate_mermaid_diagram(self, structure, file_type, mode='ai', code_content=None):
+        return "flowchart TD\n    A --> B"
+
+
+@pytest.fixture
+def server():
+    service = AnalysisService(LocalGenerator(), workers=1)
+    server = ServiceServer(('127.0.0.1', 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    service.close()
+
+
+def post(server, body, path='/jobs'):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    connection.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.mark.parametrize('body', [[1, 2], {'content': 'x = 1', 'file_type': 'py', 'summary': 2},
+                                  {'content': 'x = 1', 'name': 5}])
+def test_invalid_json_bodies_get_400(server, body):
+    assert post(server, body)[0] == 400
+
+
+def test_summary_string_is_normalized_and_final_event_carries_final_status(server):
+    status, job = post(server, {'content': 'def f():\n    return 1\n', 'file_type': 'py', 'summary': '0'})
+    assert status == 202
+    events = list(server.service.jobs[job['id']].follow())
+    kind, data = events[-1]
+    assert kind == 'done' and data['status'] == 'done'
+    assert data['result']['diagram'] and data['result']['summary'] is None
+
+
+def test_negative_content_length_gets_400(server):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    connection.putrequest('POST', '/jobs')
+    connection.putheader('Content-Length', '-1')
+    connection.endheaders()
+    assert connection.getresponse().status == 400
+
+
+class Fallback(str):
+    reason = 'timed out'
+
+
+class FallbackGenerator:
+    def generate_mermaid_diagram(self, structure, file_type, mode='ai', code_content=None):
+        return Fallback("flowchart TD\n    A --> B")
+
+
+def test_fallback_result_fails_the_job_and_is_not_deduplicated():
+    service = AnalysisService(FallbackGenerator(), workers=1)
+    try:
+        [(job, _)] = service.submit_many([('a.py', 'x = 1')], summary=False)
+        kind, data = list(job.follow())[-1]
+        assert kind == 'failed' and data['error'] == 'timed out' and data['result']['diagram']
+        [(again, deduplicated)] = service.submit_many([('a.py', 'x = 1')], summary=False)
+        assert again is not job and not deduplicated
+    finally:
+        service.close()
@@ -0,0 +1,12 @@
+from code_parser import CodeParser
+from context_builder import build_context
+from stub_model import StubModel
+
+
+def test_diagram_has_a_node_per_listed_function():
+    structure = CodeParser().parse_file(
+        'class A:\n    def m(self):\n        return helper()\n\ndef helper():\n    return 1\n', 'py')
+    prompt = "Create a Mermaid diagram for this structure:\n" + build_context(structure)
+    diagram = StubModel().generate_content(prompt).text
+    assert '[helper]' in diagram and '[A.m]' in diagram
+    assert 'Start --> End' not in diagram